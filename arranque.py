@@ -0,0 +1,114 @@
+# arranque.py
+"""
+Arranque en frío: importaciones perezosas, calentamiento en segundo plano y reporte.
+
+Los módulos pesados (pandas, openpyxl, gspread / googleapiclient, passlib) ya no se
+importan al cargar main: cada módulo los importa dentro de la función que los usa
+(con TYPE_CHECKING para las anotaciones). Así uvicorn queda escuchando y `/` responde
+apenas termina de importarse FastAPI; en el evento startup un hilo de fondo los
+importa y construye el cliente de Sheets (credenciales + discovery, una sola vez), de
+modo que el primer /buscar normalmente ya no paga nada de eso.
+
+    import arranque
+    arranque.marcar("app lista")
+    pd = arranque.importar("pandas")          # mide la primera importación
+    arranque.calentar([("sheets", client.calentar)])
+
+`reporte()` (en /estado) devuelve las etapas en ms desde que arrancó el proceso y el
+desglose de importaciones / tareas de calentamiento.
+"""
+from __future__ import annotations
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import registro
+
+log = registro.obtener("arranque")
+
+T0 = time.perf_counter()   # primer import de un módulo de la app
+
+_etapas: List[Tuple[str, float]] = []
+_importaciones: Dict[str, float] = {}    # módulo -> ms de la primera importación
+_tareas: Dict[str, Dict[str, Any]] = {}  # tarea de calentamiento -> {"ms", "error"}
+_lock = threading.Lock()
+_calentado = threading.Event()
+
+
+def _ms(desde: float) -> float:
+    return round((time.perf_counter() - desde) * 1000, 1)
+
+
+def _previo_ms() -> Optional[float]:
+    """ms entre el inicio del proceso (kernel) y T0: intérprete + site + uvicorn (solo Linux)."""
+    try:
+        with open("/proc/self/stat") as f:
+            inicio = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+    return max(round((uptime - inicio) * 1000 - _ms(T0), 1), 0.0)
+
+
+_PREVIO_MS = _previo_ms()
+
+
+def marcar(etapa: str):
+    """Registra una etapa del arranque (ms desde T0)."""
+    ms = _ms(T0)
+    with _lock:
+        _etapas.append((etapa, ms))
+    log.info("arranque", extra={"datos": {"etapa": etapa, "ms": ms}})
+
+
+def importar(nombre: str):
+    """importlib.import_module que registra cuánto tardó la primera importación."""
+    mod = sys.modules.get(nombre)
+    if mod is not None:
+        return mod
+    t0 = time.perf_counter()
+    mod = importlib.import_module(nombre)
+    with _lock:
+        _importaciones.setdefault(nombre, _ms(t0))
+    return mod
+
+
+def calentar(tareas: Sequence[Tuple[str, Callable[[], Any]]], modulos: Sequence[str] = ()) -> threading.Thread:
+    """Importa `modulos` y corre `tareas` en un hilo de fondo; un error no detiene al resto."""
+    def correr():
+        for nombre in modulos:
+            try:
+                importar(nombre)
+            except Exception:
+                log.exception("calentamiento: import falló", extra={"datos": {"modulo": nombre}})
+        for nombre, fn in tareas:
+            t0 = time.perf_counter()
+            error = None
+            try:
+                fn()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                log.warning("calentamiento falló", extra={"datos": {"tarea": nombre, "error": error}})
+            with _lock:
+                _tareas[nombre] = {"ms": _ms(t0), "error": error}
+        _calentado.set()
+        marcar("calentado")
+
+    hilo = threading.Thread(target=correr, name="calentamiento", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def reporte() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "antes_de_la_app_ms": _PREVIO_MS,
+            "etapas_ms": dict(_etapas),
+            "importaciones_ms": dict(sorted(_importaciones.items(), key=lambda kv: -kv[1])),
+            "calentamiento_ms": dict(_tareas),
+            "calentado": _calentado.is_set(),
+        }
@@ -1,12 +1,18 @@
 # auth.py
 from __future__ import annotations
+import os
 import secrets
 from fastapi import APIRouter, Request, Form, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 import usuarios  # nuestro módulo
+import ejecutor_hash
+from concurrencia import Ocupado
 import time
 
+MSG_OCUPADO = "Demasiados intentos simultáneos, reintenta en unos segundos."
+
 templates = Jinja2Templates(directory="templates")
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -21,6 +27,19 @@ def _csrf_check(request: Request, token: str):
         raise HTTPException(status_code=400, detail="CSRF inválido")
 
 
+# proxies propios delante de la app (Render = 1). Cada uno AGREGA al final de
+# X-Forwarded-For la IP que le habló; lo de más a la izquierda lo pone el cliente.
+PROXIES_CONFIABLES = int(os.getenv("PROXIES_CONFIABLES", "1"))
+
+
+def _client_ip(request: Request) -> str:
+    # la entrada que agregó nuestro proxy más externo (no la primera: esa la elige el cliente)
+    fwd = [p.strip() for p in request.headers.get("x-forwarded-for", "").split(",") if p.strip()]
+    if PROXIES_CONFIABLES > 0 and len(fwd) >= PROXIES_CONFIABLES:
+        return fwd[-PROXIES_CONFIABLES]
+    return request.client.host if request.client else ""
+
+
 def current_user(request: Request) -> str | None:
     if not hasattr(request, "session"):
         return None
@@ -36,10 +55,23 @@ def login_form(request: Request, next: str = "/buscar"):
     return templates.TemplateResponse("auth_login.html", {"request": request, "next": next, "csrf": _csrf_new(request)})
 
 @router.post("/login", response_class=HTMLResponse)
-def login_do(request: Request, email: str = Form(...), password: str = Form(...),
-             next: str = Form("/buscar"), csrf: str = Form(...)):
+async def login_do(request: Request, email: str = Form(...), password: str = Form(...),
+                   next: str = Form("/buscar"), csrf: str = Form(...)):
     _csrf_check(request, csrf)
-    ok = usuarios.authenticate(email, password)
+    u = await run_in_threadpool(usuarios.get_user, email)
+    try:
+        # bcrypt en el pool dedicado, no en el threadpool compartido
+        ok = bool(u) and await ejecutor_hash.ejecutar(
+            usuarios.verify_password, u, password,
+            ip=_client_ip(request), email=usuarios._norm_email(email),
+        )
+    except Ocupado:
+        return templates.TemplateResponse("auth_login.html", {
+            "request": request,
+            "error": MSG_OCUPADO,
+            "next": next,
+            "csrf": _csrf_new(request)
+        }, status_code=429)
     if not ok:
         return templates.TemplateResponse("auth_login.html", {
             "request": request,
@@ -62,10 +94,15 @@ def register_form(request: Request):
     return templates.TemplateResponse("auth_register.html", {"request": request, "csrf": _csrf_new(request)})
 
 @router.post("/register", response_class=HTMLResponse)
-def register_do(request: Request, email: str = Form(...), name: str = Form(""), password: str = Form(...), csrf: str = Form(...)):
+async def register_do(request: Request, email: str = Form(...), name: str = Form(""), password: str = Form(...), csrf: str = Form(...)):
     _csrf_check(request, csrf)
     try:
-        usuarios.create_user(email=email, password=password, name=name)
+        await run_in_threadpool(usuarios.validate_new_user, email, password)
+        h = await ejecutor_hash.ejecutar(usuarios.hash_password, password,
+                                         ip=_client_ip(request), email=usuarios._norm_email(email))
+        await run_in_threadpool(usuarios.create_user, email=email, password=password, name=name, password_hash=h)
+    except Ocupado:
+        return templates.TemplateResponse("auth_register.html", {"request": request, "error": MSG_OCUPADO, "csrf": _csrf_new(request)}, status_code=429)
     except Exception as e:
         return templates.TemplateResponse("auth_register.html", {"request": request, "error": str(e), "csrf": _csrf_new(request)})
     request.session["user_email"] = usuarios._norm_email(email)
@@ -81,7 +118,7 @@ def forgot_do(request: Request, email: str = Form(...), csrf: str = Form(...)):
     token = usuarios.start_password_reset(email)
     # Enviamos siempre mensaje genérico
     try:
-        from main import send_mail
+        from correo import send_mail
         reset_link = f"{request.url_for('reset_form')}?token={token}" if token else ""
         if reset_link:
             send_mail("Reset de contraseña", f"<p>Para restablecer tu clave haz clic: <a href='{reset_link}'>{reset_link}</a> (válido por 2 horas).</p>", to_addrs=[usuarios._norm_email(email)])
@@ -94,10 +131,16 @@ def reset_form(request: Request, token: str):
     return templates.TemplateResponse("auth_reset.html", {"request": request, "token": token, "csrf": _csrf_new(request)})
 
 @router.post("/reset", response_class=HTMLResponse)
-def reset_do(request: Request, token: str = Form(...), password: str = Form(...), csrf: str = Form(...)):
+async def reset_do(request: Request, token: str = Form(...), password: str = Form(...), csrf: str = Form(...)):
     _csrf_check(request, csrf)
     try:
-        usuarios.complete_password_reset(token, password)
+        usuarios.validate_password(password)
+        u = await run_in_threadpool(usuarios.check_reset_token, token)
+        h = await ejecutor_hash.ejecutar(usuarios.hash_password, password,
+                                         ip=_client_ip(request), email=u["email"])
+        await run_in_threadpool(usuarios.complete_password_reset, token, password, h)
+    except Ocupado:
+        return templates.TemplateResponse("auth_reset.html", {"request": request, "error": MSG_OCUPADO, "token": token, "csrf": _csrf_new(request)}, status_code=429)
     except Exception as e:
         return templates.TemplateResponse("auth_reset.html", {"request": request, "error": str(e), "token": token, "csrf": _csrf_new(request)})
     return RedirectResponse("/auth/login", status_code=302)
@@ -0,0 +1,248 @@
+# benchmarks/bench_hot_paths.py
+"""
+Micro-benchmarks de los caminos calientes de búsqueda e ingesta sobre hojas sintéticas.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_hot_paths.py                              # 10k / 100k / 500k filas
+    python benchmarks/bench_hot_paths.py --filas 10000 --salida base.json
+    python benchmarks/bench_hot_paths.py --filas 10000 --comparar base.json [--umbral 0.15]
+    python benchmarks/bench_hot_paths.py --solo filtrar,strip
+
+Casos (funciones reales de main / conector_sheets, sin red: SHEETS_BACKEND=fake):
+    filtrar_por_pop        hojas RANCO / Hardware / Export (máscara sobre la columna POP normalizada,
+                           cacheada por DataFrame como en producción)
+    filtrar_columnas       máscara POP de Bases / Directorio en /buscar (_filtrar_columnas)
+    strip_accents          normalizacion.sin_tildes sobre N strings (escalar)
+    normalizar_serie       normalizacion.serie sobre N strings (vectorizado, sin cache)
+    ordenar_hardware       _natural_key por SITE ID (_ordenar_hardware) sobre N filas
+    analizar_pop_df        vacíos / duplicados de POP en una carga
+    excel_rows_from_bytes  lectura streaming de un .xlsx subido (ingesta)
+    comparativo_df         _comparativo_df Bases vs Directorio
+    construir_excel        _construir_excel (ExcelStreamExporter, reemplazo de _format_sheet)
+
+Los casos de Excel se limitan a --max-excel filas: openpyxl cuesta ~10 µs por celda,
+un libro de 500k filas tarda minutos y no agrega información. La fila del reporte
+muestra las filas reales y un mismo (caso, filas) no se mide dos veces.
+
+Se reporta el mínimo y la mediana de --repeticiones corridas con el GC apagado
+(como timeit), tras una de calentamiento (que cuenta como muestra si tarda > 1 s).
+--salida guarda JSON; --comparar lee un JSON anterior, muestra la razón actual/base
+por caso (sobre el mínimo) y sale con código 1 si algún caso empeoró más que
+--umbral: sirve como chequeo antes de deploy (comparar siempre en la misma máquina).
+"""
+from __future__ import annotations
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SHEETS_BACKEND", "fake")   # importar main no debe tocar Google
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+import main
+import normalizacion
+from conector_sheets import excel_rows_from_bytes
+
+SEMILLA = 42
+NOMBRES = ["Estación Ñuñoa", "Cerro Alegre", "Peñalolén Alto", "Quilpué Centro", "Valparaíso Puerto",
+           "Concepción Sur", "Temuco Ñielol", "Curicó Oriente", "Copiapó Norte", "Chillán Viejo"]
+REGIONES = ["Metropolitana", "Valparaíso", "Biobío", "Araucanía", "Maule", "Ñuble", "Atacama"]
+EQUIPOS = ["BBU5900", "RRU3959", "AAU5613", "UBBPg2a", "RRU5258\nbanda 700", "-"]
+
+
+# =========================
+#  Datos sintéticos
+# =========================
+def _codigos(rng: np.random.Generator, n: int) -> Tuple[np.ndarray, List[str]]:
+    """POP por fila (~20 filas por POP, con variantes de mayúsculas / espacios como en las hojas reales)."""
+    n_pops = max(n // 20, 1)
+    base = np.array([f"{'ABCDEFGH'[i % 8]}{'XYZ'[i % 3]}{i:05d}" for i in range(n_pops)], dtype=object)
+    pops = base[rng.integers(0, n_pops, n)]
+    sucios = rng.random(n) < 0.05
+    pops[sucios] = [f" {p.lower()} " for p in pops[sucios]]
+    return pops, list(base)
+
+
+def _columna(rng: np.random.Generator, n: int, valores: List[str], nulos: float = 0.05) -> np.ndarray:
+    col = np.array(valores, dtype=object)[rng.integers(0, len(valores), n)]
+    col[rng.random(n) < nulos] = None
+    return col
+
+
+def generar(n: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(SEMILLA)
+    pops, codigos = _codigos(rng, n)
+    bases = {c: _columna(rng, n, [f"{c[:3]}-{i}" for i in range(30)]) for c in main.COLUMNAS_BASES}
+    bases["POP"] = pops
+    bases["Nombre"] = _columna(rng, n, NOMBRES, 0)
+    bases["Región"] = _columna(rng, n, REGIONES, 0)
+    bases["Latitud"] = np.round(rng.uniform(-56, -17, n), 6)
+    bases["Longitud"] = np.round(rng.uniform(-76, -66, n), 6)
+    df_bases = pd.DataFrame(bases)
+
+    directorio = {c: _columna(rng, n, [f"{c[:3]}_{i}" for i in range(30)]) for c in main.COLUMNAS_DIRECTORIO}
+    directorio["POP"] = pops
+    df_dir = pd.DataFrame(directorio)
+
+    site = np.array([f"{p.strip().upper()}_{k}" for p, k in zip(pops, rng.integers(1, 40, n))], dtype=object)
+    site[rng.random(n) < 0.03] = ""
+    df_hw = pd.DataFrame({
+        "POP": pops, "SITE ID": site, "Equipo": _columna(rng, n, EQUIPOS),
+        "Serie": _columna(rng, n, [f"SN{i:08d}" for i in range(1000)], 0.02),
+        "Observación": _columna(rng, n, ["ok", "revisar\ncableado", "", "cambio programado"], 0.3),
+    })
+    # carga con vacíos / duplicados (analizar_pop_df)
+    df_carga = df_bases[["POP", "Nombre", "Región"]].copy()
+    df_carga.loc[rng.random(n) < 0.01, "POP"] = ""
+    return {"n": n, "bases": df_bases, "directorio": df_dir, "hardware": df_hw, "carga": df_carga,
+            "codigo": codigos[len(codigos) // 2], "textos": list(bases["Nombre"])}
+
+
+def _xlsx(df: pd.DataFrame) -> bytes:
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Carga")
+    ws.append(list(df.columns))
+    for fila in df.itertuples(index=False):
+        ws.append(["" if v is None else v for v in fila])
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+# =========================
+#  Casos
+# =========================
+def casos(d: Dict[str, Any], max_excel: int) -> List[Tuple[str, int, Callable[[], Any]]]:
+    """[(nombre, filas efectivas, fn)]; la preparación (copias, .xlsx) queda fuera del tiempo."""
+    n, codigo = d["n"], d["codigo"]
+    hw_rows = d["hardware"].fillna("").to_dict(orient="records")
+    textos = pd.Series(d["textos"], dtype=object)
+    ne = min(n, max_excel)
+    xlsx = _xlsx(d["carga"].head(ne))
+    bases_rows = d["bases"].head(ne).fillna("").to_dict(orient="records")
+    dir_rows = d["directorio"].head(ne).fillna("").to_dict(orient="records")
+    res = {"bases": bases_rows[:50], "directorio": dir_rows[:50],
+           "proyecto_ranco": bases_rows, "hardware": hw_rows[:ne],
+           "export_5g": [], "export_4g": [], "export_3g": [], "export_2g": []}
+
+    def construir_excel():
+        f = main._construir_excel(res)
+        f.close()
+
+    return [
+        ("filtrar_por_pop", n, lambda: main.filtrar_por_pop(d["hardware"], codigo)),
+        ("filtrar_por_pop_excluir", n, lambda: main.filtrar_por_pop(d["directorio"], codigo, excluir=["CLASS 1", "CLASS 2"])),
+        ("filtrar_columnas_bases", n, lambda: main._filtrar_columnas(d["bases"], codigo, main.COLUMNAS_BASES)),
+        ("filtrar_columnas_directorio", n, lambda: main._filtrar_columnas(d["directorio"], codigo, main.COLUMNAS_DIRECTORIO)),
+        ("strip_accents", n, lambda: [normalizacion.sin_tildes(s) for s in d["textos"]]),
+        ("normalizar_serie", n, lambda: normalizacion.serie(textos)),
+        ("ordenar_hardware", n, lambda: main._ordenar_hardware(hw_rows[:])),
+        ("analizar_pop_df", n, lambda: main.analizar_pop_df(d["carga"])),
+        ("excel_rows_from_bytes", ne, lambda: sum(1 for _ in excel_rows_from_bytes(io.BytesIO(xlsx)))),
+        ("comparativo_df", ne, lambda: main._comparativo_df(bases_rows, dir_rows, main.COLUMNAS_BASES, main.COLUMNAS_DIRECTORIO)),
+        ("construir_excel", ne, construir_excel),
+    ]
+
+
+def _una(fn: Callable[[], Any]) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def medir(fn: Callable[[], Any], repeticiones: int) -> Dict[str, float]:
+    gc.collect()
+    gc.disable()
+    try:
+        primera = _una(fn)  # calentamiento (caches lru / imports perezosos)
+        tiempos = [primera] if primera > 1 else []
+        while len(tiempos) < repeticiones:
+            tiempos.append(_una(fn))
+    finally:
+        gc.enable()
+    return {"min_s": min(tiempos), "mediana_s": statistics.median(tiempos)}
+
+
+# =========================
+#  Reporte / comparación
+# =========================
+def _clave(r: Dict[str, Any]) -> Tuple[str, int]:
+    return r["caso"], r["filas"]
+
+
+def comparar(actual: List[Dict[str, Any]], base_path: str, umbral: float) -> bool:
+    with open(base_path, encoding="utf-8") as f:
+        base = {_clave(r): r for r in json.load(f)["resultados"]}
+    print(f"\ncomparación con {base_path} (umbral +{umbral:.0%} sobre el mínimo)")
+    print(f"{'caso':<30}{'filas':>9}{'base ms':>11}{'actual ms':>11}{'razón':>8}")
+    regresiones = 0
+    for r in actual:
+        b = base.get(_clave(r))
+        if b is None:
+            print(f"{r['caso']:<30}{r['filas']:>9}{'—':>11}{r['min_s'] * 1000:>11.1f}{'nuevo':>8}")
+            continue
+        razon = r["min_s"] / b["min_s"] if b["min_s"] else float("inf")
+        marca = ""
+        if razon > 1 + umbral:
+            marca, regresiones = "  ⚠️ REGRESIÓN", regresiones + 1
+        elif razon < 1 - umbral:
+            marca = "  ✅ mejora"
+        print(f"{r['caso']:<30}{r['filas']:>9}{b['min_s'] * 1000:>11.1f}{r['min_s'] * 1000:>11.1f}{razon:>8.2f}{marca}")
+    if regresiones:
+        print(f"\n❌ {regresiones} caso(s) más lentos que la base")
+    return regresiones == 0
+
+
+def main_cli():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--filas", default="10000,100000,500000", help="tamaños separados por coma")
+    ap.add_argument("--repeticiones", type=int, default=3)
+    ap.add_argument("--max-excel", type=int, default=10_000, help="tope de filas para los casos de Excel")
+    ap.add_argument("--solo", default="", help="subcadenas de nombres de caso, separadas por coma")
+    ap.add_argument("--salida", default="", help="guardar resultados en este JSON")
+    ap.add_argument("--comparar", default="", help="JSON de una corrida anterior")
+    ap.add_argument("--umbral", type=float, default=0.15, help="empeoramiento tolerado (0.15 = +15%%)")
+    args = ap.parse_args()
+
+    filtros = [s for s in args.solo.split(",") if s]
+    resultados: List[Dict[str, Any]] = []
+    print(f"{'caso':<30}{'filas':>9}{'min ms':>11}{'mediana ms':>12}{'µs/fila':>10}")
+    for n in (int(x) for x in args.filas.split(",") if x):
+        t0 = time.perf_counter()
+        datos = generar(n)
+        lista = casos(datos, args.max_excel)
+        print(f"— {n:,} filas (datos + preparación en {time.perf_counter() - t0:.1f}s)")
+        for nombre, filas, fn in lista:
+            if filtros and not any(f in nombre for f in filtros):
+                continue
+            if any(_clave(r) == (nombre, filas) for r in resultados):
+                continue   # caso con tope (Excel) ya medido en un tamaño anterior
+            m = medir(fn, args.repeticiones)
+            resultados.append({"caso": nombre, "filas": filas, **m})
+            print(f"{nombre:<30}{filas:>9}{m['min_s'] * 1000:>11.1f}{m['mediana_s'] * 1000:>12.1f}"
+                  f"{m['min_s'] / filas * 1e6:>10.2f}")
+
+    if args.salida:
+        meta = {"fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                "pandas": pd.__version__, "numpy": np.__version__, "host": platform.node(),
+                "repeticiones": args.repeticiones}
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "resultados": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 resultados en {args.salida}")
+    if args.comparar and not comparar(resultados, args.comparar, args.umbral):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,116 @@
+# benchmarks/bench_metricas.py
+"""
+Costo de las métricas (metricas.py): por operación y por request.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_metricas.py [-n 200000] [--requests 5000]
+
+1) ns/op de Contador.inc / Histograma.observe con y sin etiquetas, y con METRICAS
+   desactivadas (rama que vuelve de inmediato).
+2) µs/request de una ruta mínima con AppMiddleware (que observa la latencia por ruta)
+   con métricas activas vs desactivadas.
+3) Tiempo de metricas.exponer() con series típicas.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+
+import metricas
+from middleware import AppMiddleware
+from bench_middleware import _request  # mismo cliente ASGI directo
+
+SECRET = "bench-secret"
+
+
+def _ns_por_op(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def micro(n: int):
+    c = metricas.Contador("bench_contador_total", "bench", ("metodo",))
+    c0 = metricas.Contador("bench_contador_simple_total", "bench")
+    h = metricas.Histograma("bench_latencia_segundos", "bench", ("metodo",))
+    casos = {
+        "Contador.inc()": lambda: c0.inc(),
+        "Contador.inc(metodo=)": lambda: c.inc(metodo="values.get"),
+        "Histograma.observe(metodo=)": lambda: h.observe(0.042, metodo="values.get"),
+        "(llamada vacía, referencia)": lambda: None,
+    }
+    print(f"{'operación':<32}{'activas ns/op':>16}{'desactivadas ns/op':>20}")
+    for nombre, fn in casos.items():
+        metricas.HABILITADAS = True
+        on = _ns_por_op(fn, n)
+        metricas.HABILITADAS = False
+        off = _ns_por_op(fn, n)
+        print(f"{nombre:<32}{on:>16.0f}{off:>20.0f}")
+    metricas.HABILITADAS = True
+
+
+def app_bench() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AppMiddleware, secret_key=SECRET, session_cookie="bi_session", max_age=1800, ttl_seconds=1800)
+
+    @app.get("/ping")
+    def ping():
+        metricas.CACHE_ACIERTOS.inc(hoja="Bases POP")  # como un get_data en cache
+        return {"ok": True}
+    return app
+
+
+async def _medir_requests(app, n: int) -> float:
+    for _ in range(200):
+        await _request(app, "/ping", None)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await _request(app, "/ping", None)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def por_request(n: int):
+    app = app_bench()
+    res = {}
+    with contextlib.redirect_stdout(io.StringIO()):  # logs del middleware (registro.py -> stdout)
+        for estado in (True, False) * 3:  # alternado; se toma el mínimo de cada uno
+            metricas.HABILITADAS = estado
+            res.setdefault(estado, []).append(asyncio.run(_medir_requests(app, n)))
+    metricas.HABILITADAS = True
+    on, off = min(res[True]), min(res[False])
+    print(f"\n/ping vía AppMiddleware: activas {on:.1f} µs/req, desactivadas {off:.1f} µs/req "
+          f"(overhead {on - off:+.1f} µs, {(on - off) / off:+.1%})")
+
+
+def exposicion():
+    h = metricas.Histograma("bench_rutas_segundos", "bench", ("ruta",))
+    for i in range(30):
+        h.observe(0.01, ruta=f"/ruta_{i}")
+    t0 = time.perf_counter()
+    for _ in range(100):
+        texto = metricas.exponer()
+    dt = (time.perf_counter() - t0) / 100 * 1000
+    print(f"\nmetricas.exponer(): {dt:.2f} ms ({len(texto.splitlines())} líneas)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=200_000)
+    ap.add_argument("--requests", type=int, default=5000)
+    args = ap.parse_args()
+    micro(args.n)
+    por_request(args.requests)
+    exposicion()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/bench_middleware.py
+"""
+Overhead por request del stack de middleware: antes (SessionMiddleware + dos
+@app.middleware("http") estilo BaseHTTPMiddleware) vs ahora (middleware.AppMiddleware).
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_middleware.py [-n 5000]
+
+Mide µs/request llamando la app ASGI directamente (sin red) con una sesión logueada,
+sobre una ruta JSON mínima y sobre un StreamingResponse de 64 chunks.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.middleware.sessions import SessionMiddleware
+
+from middleware import AppMiddleware
+
+SECRET = "bench-secret"
+TTL = 1800
+
+
+def _rutas(app: FastAPI):
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((b"x" * 1024 for _ in range(64)), media_type="application/octet-stream")
+
+    @app.get("/login")
+    def login(request: Request):
+        request.session["user_email"] = "bench@example.com"
+        request.session["login_ts"] = time.time()
+        return {"ok": True}
+
+
+def app_antes() -> FastAPI:
+    """Réplica del stack anterior de main.py."""
+    app = FastAPI()
+    app.add_middleware(SessionMiddleware, secret_key=SECRET, session_cookie="bi_session",
+                       https_only=True, same_site="lax", max_age=TTL)
+
+    @app.middleware("http")
+    async def enforce_session_ttl(request: Request, call_next):
+        if "session" not in request.scope:
+            return await call_next(request)
+        email = request.session.get("user_email")
+        login_ts = request.session.get("login_ts")
+        if email and login_ts:
+            if time.time() - float(login_ts) > TTL:
+                request.session.clear()
+                return RedirectResponse("/auth/login", status_code=302)
+            request.session["login_ts"] = time.time()
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def log_and_block(request: Request, call_next):
+        print(f"→ {request.method} {request.url.path} {request.url.query}")
+        if request.method in ("HEAD", "OPTIONS"):
+            return JSONResponse(content={"status": "ok"}, status_code=200)
+        resp = await call_next(request)
+        print(f"← {resp.status_code} {request.url.path}")
+        return resp
+
+    _rutas(app)
+    return app
+
+
+def app_ahora() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AppMiddleware, secret_key=SECRET, session_cookie="bi_session",
+                       https_only=True, same_site="lax", max_age=TTL, ttl_seconds=TTL)
+    _rutas(app)
+    return app
+
+
+async def _request(app, path: str, cookie: str | None):
+    headers = [(b"host", b"bench")]
+    if cookie:
+        headers.append((b"cookie", cookie.encode()))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "https", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": headers, "client": ("127.0.0.1", 1), "server": ("bench", 443)}
+    out = {"set_cookie": None}
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()  # el cliente nunca se desconecta
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            for k, v in message["headers"]:
+                if k == b"set-cookie":
+                    out["set_cookie"] = v.decode()
+
+    await app(scope, receive, send)
+    return out["set_cookie"]
+
+
+async def _medir(app, path: str, n: int) -> tuple[float, int]:
+    set_cookie = await _request(app, "/login", None)
+    cookie = set_cookie.split(";", 1)[0]
+    resignados = 0
+    for _ in range(50):  # warm-up
+        await _request(app, path, cookie)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        if await _request(app, path, cookie):
+            resignados += 1
+    return (time.perf_counter() - t0) / n * 1e6, resignados
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=5000)
+    args = ap.parse_args()
+
+    res = {}
+    with contextlib.redirect_stdout(io.StringIO()):  # ambos stacks loguean a stdout
+        for nombre, factory in (("antes", app_antes), ("ahora", app_ahora)):
+            app = factory()
+            for path in ("/ping", "/stream"):
+                res[(nombre, path)] = asyncio.run(_medir(app, path, args.n))
+
+    print(f"{'ruta':<10}{'antes µs/req':>14}{'ahora µs/req':>14}{'ahorro':>10}{'re-firmas antes/ahora':>24}")
+    for path in ("/ping", "/stream"):
+        (a, ra), (b, rb) = res[("antes", path)], res[("ahora", path)]
+        print(f"{path:<10}{a:>14.1f}{b:>14.1f}{(a - b) / a:>9.0%}{f'{ra}/{rb}':>24}")
+
+
+if __name__ == "__main__":
+    main()
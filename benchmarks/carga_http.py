@@ -0,0 +1,427 @@
+# benchmarks/carga_http.py
+"""
+Prueba de carga HTTP end-to-end: /buscar (+ secciones diferidas), /api/buscar,
+/exportar_excel y /carga, contra Sheets falso (sheets_fake.py).
+
+Uso (desde la raíz del repo):
+    python benchmarks/carga_http.py                                  # 20 usuarios, 30 s, en proceso
+    python benchmarks/carga_http.py --usuarios 50 --duracion 60 --latencia-ms 150 --salida carga.json
+    python benchmarks/carga_http.py --mezcla buscar=60,api=20,exportar=15,carga=5
+
+    # servidor aparte (otro proceso / otra máquina) con los mismos datos sintéticos:
+    python benchmarks/carga_http.py --generar-dir /tmp/fake --filas 20000
+    SHEETS_BACKEND=fake SHEETS_FAKE_DIR=/tmp/fake SHEETS_FAKE_LATENCIA_MS=150 SECRET_KEY=s \\
+        UPLOAD_USERS=carga@bench:clave uvicorn main:app --port 8000
+    python benchmarks/carga_http.py --url http://127.0.0.1:8000 --secret s --filas 20000
+
+En proceso (por defecto) levanta uvicorn en un hilo sobre 127.0.0.1 con las hojas
+sintéticas de bench_hot_paths.generar cargadas en FakeSheets (latencia / costo por KB /
+429 configurables) y mide, además de las latencias del cliente:
+  - lag del event loop del servidor (sonda asyncio.sleep cada 50 ms),
+  - memoria (RSS del proceso) por segundo.
+Cliente y servidor comparten proceso (y GIL): para capacidad absoluta usar --url.
+
+Usuarios virtuales en lazo cerrado (--pausa-ms entre operaciones). Los POP se eligen
+entre unos pocos "calientes" (cache de resultados) con --prob-caliente, o al azar
+entre todos (fríos). La carga sube un .xlsx de --filas-carga filas a /carga/ranco
+(preview + confirmar, Basic auth). La sesión de /buscar se firma con el mismo
+SECRET_KEY que la app (sin pasar por login).
+
+Reporte: por ruta n, errores, req/s, p50/p95/p99/max; throughput total; lag del loop
+(p50/p99/max); RSS inicial/máximo/final; llamadas y 429 de Sheets falso; y con
+--salida un JSON con todo más la serie por segundo (req/s, lag máx, RSS).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SHEETS_BACKEND", "fake")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("UPLOAD_USERS", "carga@bench:clave")
+
+import httpx
+import numpy as np
+
+MEZCLA = "buscar=60,api=15,exportar=20,carga=5"
+USUARIO_CARGA = ("carga@bench", "clave")
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+# =========================
+#  Datos (Sheets falso)
+# =========================
+def sembrar(fk, sheet_id: str, filas: int, filas_carga: int, indice: bool) -> Dict[str, Any]:
+    """Carga las hojas de la app en FakeSheets; devuelve códigos POP y el .xlsx de carga."""
+    import main
+    import usuarios
+    from bench_hot_paths import generar, _xlsx
+    from conector_sheets import escribir_hoja_stream_por_pop
+
+    d = generar(filas)
+    latencia, por_kb = fk.latencia_ms, fk.ms_por_kb
+    fk.latencia_ms = fk.ms_por_kb = 0   # sembrar no cuenta
+    fk.cargar_df(sheet_id, "Bases POP", d["bases"])
+    fk.cargar_df(sheet_id, "Directorio", d["directorio"])
+    fk.cargar_df(sheet_id, "Base Hardware", d["hardware"])
+    ranco = d["bases"].head(filas_carga)
+    fk.cargar_df(sheet_id, "Proyecto_RANCO", ranco)
+    fk.cargar(sheet_id, usuarios.USERS_SHEET, [usuarios.COLUMNS])
+    export = d["directorio"].fillna("").astype(str)
+    for hoja, _ in main.HOJAS_EXPORT.values():
+        if indice:   # como una carga con "ordenar por POP": lectura por índice
+            escribir_hoja_stream_por_pop(sheet_id, hoja, [list(export.columns), *export.values.tolist()])
+        else:
+            fk.cargar_df(sheet_id, hoja, export)
+    fk.latencia_ms, fk.ms_por_kb = latencia, por_kb
+    codigos = sorted({str(p).strip().upper() for p in d["bases"]["POP"]})
+    return {"codigos": codigos, "xlsx_carga": _xlsx(ranco)}
+
+
+def volcar(fk, sheet_id: str, directorio: str):
+    """Escribe cada hoja de FakeSheets como CSV (para SHEETS_FAKE_DIR de un servidor aparte)."""
+    os.makedirs(directorio, exist_ok=True)
+    for titulo, hoja in fk.libro(sheet_id).hojas.items():
+        with open(os.path.join(directorio, f"{titulo}.csv"), "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(hoja.datos)
+    print(f"💾 {len(fk.libro(sheet_id).hojas)} hojas en {directorio}")
+
+
+def cookie_sesion(secret: str, email: str) -> Tuple[str, str]:
+    """(nombre, valor) de la cookie de sesión, firmada como AppMiddleware."""
+    from middleware import AppMiddleware
+    mw = AppMiddleware(None, secret_key=secret, session_cookie="bi_session")
+    nombre, _, resto = mw._cookie_header({"user_email": email, "login_ts": time.time()}).partition("=")
+    return nombre, resto.split(";", 1)[0]
+
+
+# =========================
+#  Servidor en proceso
+# =========================
+class ServidorLocal:
+    """uvicorn en un hilo con su propio loop + sonda de lag del loop."""
+    def __init__(self, app, intervalo_lag: float = 0.05):
+        import uvicorn
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.puerto = s.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.puerto,
+                                                    log_level="warning", lifespan="on"))
+        self.intervalo = intervalo_lag
+        self.lag: List[Tuple[float, float]] = []     # (monotonic, segundos de atraso)
+        self._hilo = threading.Thread(target=self._correr, name="servidor-carga", daemon=True)
+
+    async def _sonda(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.intervalo)
+            self.lag.append((time.monotonic(), max(time.perf_counter() - t0 - self.intervalo, 0.0)))
+
+    def _correr(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        sonda = loop.create_task(self._sonda())
+        loop.run_until_complete(self.server.serve())
+        sonda.cancel()
+        loop.run_until_complete(asyncio.gather(sonda, return_exceptions=True))
+        loop.close()
+
+    def iniciar(self) -> str:
+        self._hilo.start()
+        while not self.server.started:
+            if not self._hilo.is_alive():
+                raise RuntimeError("uvicorn no arrancó")
+            time.sleep(0.05)
+        return f"http://127.0.0.1:{self.puerto}"
+
+    def detener(self):
+        self.server.should_exit = True
+        self._hilo.join(timeout=10)
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource   # pico, no actual (fuera de Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# =========================
+#  Cliente
+# =========================
+class Registro:
+    """status 0 = error de red; -1 = respuesta 2xx que no trae lo esperado (ambos cuentan como error)."""
+    def __init__(self):
+        self.muestras: List[Tuple[str, float, float, int, int]] = []   # (ruta, inicio, seg, status, bytes)
+
+    def agregar(self, ruta: str, inicio: float, status: int, nbytes: int):
+        self.muestras.append((ruta, inicio, time.monotonic() - inicio, status, nbytes))
+
+
+async def _get(cli: httpx.AsyncClient, reg: Registro, ruta: str, url: str, **kw) -> Optional[httpx.Response]:
+    t0 = time.monotonic()
+    try:
+        r = await cli.get(url, **kw)
+    except httpx.HTTPError:
+        reg.agregar(ruta, t0, 0, 0)
+        return None
+    reg.agregar(ruta, t0, r.status_code, len(r.content))
+    return r
+
+
+async def _post(cli: httpx.AsyncClient, reg: Registro, ruta: str, url: str,
+                valida: Optional[Callable[[httpx.Response], bool]] = None, **kw) -> Optional[httpx.Response]:
+    """`valida`: un 200 que no la cumple se registra como error (status -1) y devuelve None."""
+    t0 = time.monotonic()
+    try:
+        r = await cli.post(url, **kw)
+    except httpx.HTTPError:
+        reg.agregar(ruta, t0, 0, 0)
+        return None
+    if valida is not None and r.status_code < 400 and not valida(r):
+        reg.agregar(ruta, t0, -1, len(r.content))
+        return None
+    reg.agregar(ruta, t0, r.status_code, len(r.content))
+    return r
+
+
+_TOKEN_CARGA = re.compile(r'name="token" value="([^"]+)"')
+
+
+def _error_carga(r: httpx.Response) -> bool:
+    return 'class="error"' in r.text
+
+
+class Escenario:
+    def __init__(self, codigos: List[str], xlsx: bytes, args, semilla: int):
+        import main
+        self.codigos = codigos
+        self.calientes = codigos[:args.pops_calientes]
+        self.prob_caliente = args.prob_caliente
+        self.xlsx = xlsx
+        self.diferidas = [clave for _, clave in main.SECCIONES_DIFERIDAS]
+        self.pagina = main.PAGINA_FILAS
+        self.rng = random.Random(semilla)
+
+    def codigo(self) -> str:
+        if self.calientes and self.rng.random() < self.prob_caliente:
+            return self.rng.choice(self.calientes)
+        return self.rng.choice(self.codigos)
+
+    async def buscar(self, cli, reg):
+        """Como el navegador: la página y luego cada sección diferida en paralelo."""
+        c = self.codigo()
+        r = await _get(cli, reg, "/buscar", "/buscar", params={"codigo": c})
+        if r is None or r.status_code != 200:
+            return
+        await asyncio.gather(*(
+            _get(cli, reg, "/api/buscar (sección)", "/api/buscar",
+                 params={"codigo": c, "secciones": s, "offset": 0, "limite": self.pagina})
+            for s in self.diferidas))
+
+    async def api(self, cli, reg):
+        await _get(cli, reg, "/api/buscar", "/api/buscar", params={"codigo": self.codigo()})
+
+    async def exportar(self, cli, reg):
+        await _get(cli, reg, "/exportar_excel", "/exportar_excel", params={"codigo": self.codigo()})
+
+    async def carga(self, cli, reg):
+        # un 200 sin token (p. ej. la página con "Error procesando archivo") es un error
+        r = await _post(cli, reg, "/carga (preview)", "/carga/ranco", auth=USUARIO_CARGA,
+                        valida=lambda r: _TOKEN_CARGA.search(r.text) is not None and not _error_carga(r),
+                        files={"file": ("ranco.xlsx", self.xlsx, XLSX)})
+        if r is None or r.status_code != 200:
+            return
+        await _post(cli, reg, "/carga (confirmar)", "/carga/ranco", auth=USUARIO_CARGA,
+                    valida=lambda r: not _error_carga(r),
+                    data={"confirmar": "si", "token": _TOKEN_CARGA.search(r.text).group(1)})
+
+
+async def conducir(url: str, cookies: List[Tuple[str, str]], esc: Escenario, mezcla: Dict[str, float],
+                   duracion: float, pausa: float) -> Registro:
+    """Un usuario virtual por cookie, cada uno con su cliente (sesión y conexiones propias)."""
+    reg = Registro()
+    ops = list(mezcla)
+    pesos = [mezcla[o] for o in ops]
+    fin = time.monotonic() + duracion
+
+    async def usuario(cookie: Tuple[str, str]):
+        # 8 conexiones: la página + sus secciones diferidas en paralelo, como un navegador
+        limites = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+        async with httpx.AsyncClient(base_url=url, cookies={cookie[0]: cookie[1]}, timeout=300,
+                                     limits=limites, follow_redirects=False) as cli:
+            while time.monotonic() < fin:
+                await getattr(esc, esc.rng.choices(ops, pesos)[0])(cli, reg)
+                if pausa:
+                    await asyncio.sleep(pausa)
+
+    await asyncio.gather(*(usuario(c) for c in cookies))
+    return reg
+
+
+# =========================
+#  Reporte
+# =========================
+def _pct(xs: List[float]) -> Dict[str, float]:
+    if not xs:
+        return {}
+    a = np.asarray(xs) * 1000
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1), "max_ms": round(float(a.max()), 1)}
+
+
+def reporte(reg: Registro, t_ini: float, t_fin: float, lag: List[Tuple[float, float]],
+            memoria: List[Tuple[float, float]], fk) -> Dict[str, Any]:
+    dur = t_fin - t_ini
+    por_ruta: Dict[str, List] = defaultdict(list)
+    for m in reg.muestras:
+        if m[1] >= t_ini:
+            por_ruta[m[0]].append(m)
+    rutas = {}
+    for ruta, ms in sorted(por_ruta.items()):
+        errores = sum(1 for m in ms if m[3] <= 0 or m[3] >= 400)
+        rutas[ruta] = {"n": len(ms), "errores": errores, "rps": round(len(ms) / dur, 2),
+                       "kb_prom": round(sum(m[4] for m in ms) / len(ms) / 1024, 1), **_pct([m[2] for m in ms])}
+    total = sum(r["n"] for r in rutas.values())
+
+    serie = []
+    for s in range(int(dur)):
+        a, b = t_ini + s, t_ini + s + 1
+        serie.append({
+            "t": s,
+            "rps": sum(1 for m in reg.muestras if a <= m[1] + m[2] < b),
+            "lag_max_ms": round(max((x for t, x in lag if a <= t < b), default=0) * 1000, 1),
+            "rss_mb": round(next((x for t, x in memoria if t >= a), memoria[-1][1] if memoria else 0), 1),
+        })
+    lag_ok = [x for t, x in lag if t_ini <= t <= t_fin]
+    out: Dict[str, Any] = {
+        "duracion_s": round(dur, 1), "requests": total, "rps": round(total / dur, 2), "rutas": rutas,
+        "lag_loop": _pct(lag_ok) if lag_ok else None,
+        "rss_mb": ({"inicial": round(memoria[0][1], 1), "max": round(max(x for _, x in memoria), 1),
+                    "final": round(memoria[-1][1], 1)} if memoria else None),
+        "serie": serie,
+    }
+    if fk is not None:
+        out["sheets_fake"] = {"llamadas": fk.llamadas, "429": fk.rechazadas}
+    return out
+
+
+def imprimir(r: Dict[str, Any]):
+    print(f"\n{'ruta':<26}{'n':>7}{'err':>6}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'KB':>8}")
+    for ruta, x in r["rutas"].items():
+        print(f"{ruta:<26}{x['n']:>7}{x['errores']:>6}{x['rps']:>8.1f}{x['p50_ms']:>9.0f}{x['p95_ms']:>9.0f}"
+              f"{x['p99_ms']:>9.0f}{x['max_ms']:>9.0f}{x['kb_prom']:>8.1f}")
+    print(f"\ntotal: {r['requests']} requests en {r['duracion_s']} s => {r['rps']} req/s")
+    if r["lag_loop"]:
+        l = r["lag_loop"]
+        print(f"lag del event loop: p50 {l['p50_ms']} ms, p99 {l['p99_ms']} ms, máx {l['max_ms']} ms")
+    if r["rss_mb"]:
+        m = r["rss_mb"]
+        print(f"RSS: inicial {m['inicial']} MB, máx {m['max']} MB, final {m['final']} MB")
+    if "sheets_fake" in r:
+        print(f"Sheets falso: {r['sheets_fake']['llamadas']} llamadas, {r['sheets_fake']['429']} con 429")
+
+
+def _mezcla(texto: str) -> Dict[str, float]:
+    out = {}
+    for par in texto.split(","):
+        op, _, peso = par.partition("=")
+        if op.strip() not in ("buscar", "api", "exportar", "carga"):
+            raise SystemExit(f"operación desconocida en --mezcla: {op}")
+        out[op.strip()] = float(peso or 1)
+    return {k: v for k, v in out.items() if v > 0}
+
+
+def main_cli():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--usuarios", type=int, default=20, help="usuarios virtuales concurrentes")
+    ap.add_argument("--duracion", type=float, default=30, help="segundos medidos")
+    ap.add_argument("--calentamiento", type=float, default=3, help="segundos previos que no se reportan")
+    ap.add_argument("--mezcla", default=MEZCLA, help="pesos por operación (buscar, api, exportar, carga)")
+    ap.add_argument("--pausa-ms", type=float, default=0, help="pausa entre operaciones de un usuario")
+    ap.add_argument("--pops-calientes", type=int, default=20)
+    ap.add_argument("--prob-caliente", type=float, default=0.8)
+    ap.add_argument("--filas", type=int, default=20_000, help="filas por hoja sintética")
+    ap.add_argument("--filas-carga", type=int, default=2_000, help="filas del .xlsx subido a /carga")
+    ap.add_argument("--sin-indice", action="store_true", help="hojas Export sin índice POP (lectura por escaneo)")
+    ap.add_argument("--latencia-ms", type=float, default=float(os.getenv("SHEETS_FAKE_LATENCIA_MS", "120")))
+    ap.add_argument("--ms-por-kb", type=float, default=float(os.getenv("SHEETS_FAKE_MS_POR_KB", "0.02")))
+    ap.add_argument("--prob-429", type=float, default=0)
+    ap.add_argument("--semilla", type=int, default=1)
+    ap.add_argument("--url", default="", help="servidor ya levantado (si no, uvicorn en proceso)")
+    ap.add_argument("--secret", default=os.environ["SECRET_KEY"], help="SECRET_KEY del servidor (--url)")
+    ap.add_argument("--generar-dir", default="", help="solo escribir las hojas sintéticas como CSV y salir")
+    ap.add_argument("--salida", default="", help="guardar el reporte en JSON")
+    args = ap.parse_args()
+    mezcla = _mezcla(args.mezcla)
+
+    import main
+    from conector_sheets import client
+    fk = client._fake
+    if fk is None:
+        raise SystemExit("SHEETS_BACKEND debe ser 'fake' para esta herramienta")
+    fk.latencia_ms, fk.ms_por_kb, fk.prob_429 = args.latencia_ms, args.ms_por_kb, args.prob_429
+    datos = sembrar(fk, main.SHEET_ID, args.filas, args.filas_carga, indice=not args.sin_indice)
+    if args.generar_dir:
+        volcar(fk, main.SHEET_ID, args.generar_dir)
+        return
+
+    servidor = None
+    url = args.url
+    if not url:
+        servidor = ServidorLocal(main.app)
+        url = servidor.iniciar()
+    print(f"🚀 {args.usuarios} usuarios, {args.duracion:.0f}s (+{args.calentamiento:.0f}s calentamiento) "
+          f"contra {url} | mezcla {mezcla} | Sheets falso {args.latencia_ms} ms + {args.ms_por_kb} ms/KB")
+
+    memoria: List[Tuple[float, float]] = []
+    corriendo = threading.Event()
+    corriendo.set()
+
+    def muestrear():
+        while corriendo.is_set():
+            memoria.append((time.monotonic(), rss_mb()))
+            time.sleep(0.5)
+
+    hilo_mem = threading.Thread(target=muestrear, daemon=True)
+    if servidor is not None:
+        hilo_mem.start()
+    esc = Escenario(datos["codigos"], datos["xlsx_carga"], args, args.semilla)
+    # un email por usuario virtual: el cupo por usuario de Sheets aplica a cada uno por separado
+    cookies = [cookie_sesion(args.secret, f"bench{i}@carga") for i in range(args.usuarios)]
+    t_ini = time.monotonic() + args.calentamiento
+    try:
+        reg = asyncio.run(conducir(url, cookies, esc, mezcla,
+                                   args.calentamiento + args.duracion, args.pausa_ms / 1000))
+    finally:
+        t_fin = time.monotonic()
+        corriendo.clear()
+        if servidor is not None:
+            servidor.detener()
+    res = reporte(reg, t_ini, t_fin, servidor.lag if servidor else [], memoria if servidor else [],
+                  fk if servidor else None)
+    res["config"] = {k: v for k, v in vars(args).items() if k not in ("secret",)}
+    imprimir(res)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(res, f, ensure_ascii=False, indent=2)
+        print(f"💾 reporte en {args.salida}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,152 @@
+# concurrencia.py
+from __future__ import annotations
+import copy
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Type
+
+
+class Ocupado(Exception):
+    """No hay cupo disponible: el caller responde 'ocupado' (429/503) en vez de encolar."""
+
+
+class LimiteConcurrencia:
+    """
+    Cupos NO bloqueantes: un máximo global y, opcionalmente, máximos por tipo de clave
+    (p. ej. caps={"ip": 4, "email": 2}). Si no hay cupo, `adquirir` lanza Ocupado.
+    Thread-safe: se usa tanto desde el event loop como desde el threadpool.
+    """
+    def __init__(self, total: int, caps: Optional[Dict[str, int]] = None):
+        self.total = total
+        self.caps = dict(caps or {})
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self._por_clave: Dict[Tuple[str, str], int] = {}
+        self.rechazos = 0
+
+    @property
+    def en_curso(self) -> int:
+        return self._en_curso
+
+    def adquirir(self, **claves: Optional[str]) -> List[Tuple[str, str]]:
+        keys = [(tipo, str(v)) for tipo, v in claves.items() if v and self.caps.get(tipo)]
+        with self._lock:
+            if self.total and self._en_curso >= self.total:
+                self.rechazos += 1
+                raise Ocupado("límite global alcanzado")
+            for k in keys:
+                if self._por_clave.get(k, 0) >= self.caps[k[0]]:
+                    self.rechazos += 1
+                    raise Ocupado(f"límite por {k[0]} alcanzado")
+            self._en_curso += 1
+            for k in keys:
+                self._por_clave[k] = self._por_clave.get(k, 0) + 1
+        return keys
+
+    def liberar(self, keys: List[Tuple[str, str]]):
+        with self._lock:
+            self._en_curso -= 1
+            for k in keys:
+                n = self._por_clave.get(k, 0) - 1
+                if n > 0:
+                    self._por_clave[k] = n
+                else:
+                    self._por_clave.pop(k, None)
+
+    @contextmanager
+    def cupo(self, **claves: Optional[str]):
+        keys = self.adquirir(**claves)
+        try:
+            yield
+        finally:
+            self.liberar(keys)
+
+
+def _copia(e: BaseException) -> BaseException:
+    """Copia de la excepción del líder (sin su traceback) para relanzar en otro hilo."""
+    try:
+        return copy.copy(e)
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+
+
+class _Vuelo:
+    __slots__ = ("listo", "resultado", "error", "esperando")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.esperando = 0
+        self.resultado: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class Coalescedor:
+    """
+    Singleflight: llamadas concurrentes con la misma clave comparten UNA ejecución.
+    El primero (líder) corre `fn`; los que llegan mientras tanto esperan y reciben el
+    mismo resultado (o una copia de la excepción: una misma instancia no se relanza
+    desde varios hilos). Los errores de tipo `no_compartir` no se reparten: quien
+    esperaba vuelve a intentar, y puede quedar de líder (p. ej. Ocupado: el cupo
+    agotado era el del usuario del líder, no el suyo).
+    Al terminar la clave se libera: una llamada posterior vuelve a ejecutar (el cacheo
+    es responsabilidad del caller).
+    Thread-safe; pensado para el threadpool (los que esperan bloquean su hilo). Por eso
+    la espera se acota: más de `max_esperando` por clave, o un líder que tarda más de
+    `espera` segundos, hacen que el que espera lance Ocupado en vez de tomar un hilo más.
+    """
+    def __init__(self, no_compartir: Tuple[Type[BaseException], ...] = (),
+                 espera: Optional[float] = None, max_esperando: int = 0):
+        self.no_compartir = tuple(no_compartir)
+        self.espera = espera
+        self.max_esperando = max_esperando
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, _Vuelo] = {}
+        self.ejecuciones = 0
+        self.compartidas = 0
+        self.rechazos = 0
+
+    @property
+    def en_vuelo(self) -> int:
+        return len(self._en_vuelo)
+
+    def ejecutar(self, clave: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                vuelo = self._en_vuelo.get(clave)
+                lider = vuelo is None
+                if lider:
+                    vuelo = self._en_vuelo[clave] = _Vuelo()
+                    self.ejecuciones += 1
+                elif self.max_esperando and vuelo.esperando >= self.max_esperando:
+                    self.rechazos += 1
+                    raise Ocupado("demasiadas esperas por la misma clave")
+                else:
+                    vuelo.esperando += 1
+                    self.compartidas += 1
+            if lider:
+                break
+            try:
+                listo = vuelo.listo.wait(self.espera)
+            finally:
+                with self._lock:
+                    vuelo.esperando -= 1
+            if not listo:
+                with self._lock:
+                    self.rechazos += 1
+                raise Ocupado("el cálculo compartido no terminó a tiempo")
+            error = vuelo.error
+            if error is None:
+                return vuelo.resultado
+            if isinstance(error, self.no_compartir):
+                continue
+            raise _copia(error) from error
+        try:
+            vuelo.resultado = fn()
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+            vuelo.listo.set()
@@ -1,30 +1,167 @@
 # conector_sheets.py
 from __future__ import annotations
 import os
+import re
 import json
 import string
-from typing import Iterable, List, Optional, Generator
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread_dataframe import set_with_dataframe
-import pandas as pd
-from openpyxl import load_workbook
-from googleapiclient.discovery import build
+import threading
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Generator
+from urllib.parse import urlsplit
+
+import metricas
+import normalizacion
+import registro
+
+# pandas / gspread / googleapiclient / openpyxl se importan al primer uso (ver arranque.py)
+if TYPE_CHECKING:
+    import gspread
+    import pandas as pd
+    from google.oauth2.service_account import Credentials
+
+log = registro.obtener("sheets")
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
+# "google" (API real) | "fake" (sheets_fake.FakeSheets en memoria / SHEETS_FAKE_DIR, sin red)
+SHEETS_BACKEND = os.getenv("SHEETS_BACKEND", "google").lower()
+
+# Hoja lateral con el índice (POP, first_row, row_count) de una hoja ordenada por POP
+IDX_SUFFIX = os.getenv("POP_INDEX_SUFFIX", "_idx")
+IDX_HEADERS = ["POP", "first_row", "row_count"]
+
+
+def nombre_indice(sheet_name: str) -> str:
+    return f"{sheet_name}{IDX_SUFFIX}"
+
+
+# (sheet_id, hoja) => monotonic de cuando se vio que NO tiene índice: evita un values.get
+# que responde 400 en cada lectura. Los writers de este proceso lo actualizan al crear /
+# borrar el índice; para cambios hechos desde fuera manda el TTL.
+IDX_AUSENTE_TTL = int(os.getenv("POP_INDEX_AUSENTE_TTL", "300"))
+_sin_indice: Dict[tuple, float] = {}
+_sin_indice_lock = threading.Lock()
+
+
+def _marcar_sin_indice(sheet_id: str, sheet_name: str, ausente: bool):
+    with _sin_indice_lock:
+        if ausente:
+            _sin_indice[(sheet_id, sheet_name)] = time.monotonic()
+        else:
+            _sin_indice.pop((sheet_id, sheet_name), None)
+
+
+def _sabido_sin_indice(sheet_id: str, sheet_name: str) -> bool:
+    with _sin_indice_lock:
+        t = _sin_indice.get((sheet_id, sheet_name))
+        if t is None:
+            return False
+        if time.monotonic() - t > IDX_AUSENTE_TTL:
+            del _sin_indice[(sheet_id, sheet_name)]
+            return False
+        return True
+
+
+# ========== Medición de llamadas HTTP (gspread y API v4) ==========
+
+def metodo_api(http_method: str, url: str) -> str:
+    """URL de la API de Sheets => 'values.batchGet', 'values.update', 'spreadsheets.get', ..."""
+    http_method = http_method.upper()   # gspread usa minúsculas
+    path = urlsplit(url).path
+    m = re.search(r"/spreadsheets/[^/:]+(.*)$", path)
+    rest = m.group(1) if m else path
+    if rest.startswith("/values"):
+        ultimo = rest.rsplit("/", 1)[-1]   # el rango va url-encoded: ':' solo separa la acción
+        if ":" in ultimo:
+            return "values." + ultimo.rsplit(":", 1)[1]
+        return "values." + {"GET": "get", "PUT": "update", "POST": "append"}.get(http_method, http_method.lower())
+    if rest.startswith(":"):
+        return "spreadsheets." + rest[1:]
+    return "spreadsheets." + ("get" if http_method == "GET" else http_method.lower())
+
+
+def _medir(metodo: str, segundos: float, status: int, enviados: int, recibidos: int):
+    metricas.SHEETS_LLAMADAS.inc(metodo=metodo, status=str(status))
+    metricas.SHEETS_LATENCIA.observe(segundos, metodo=metodo)
+    metricas.SHEETS_BYTES.inc(enviados, metodo=metodo, sentido="enviados")
+    metricas.SHEETS_BYTES.inc(recibidos, metodo=metodo, sentido="recibidos")
+    if status == 429:
+        metricas.SHEETS_429.inc(metodo=metodo)
+
+
+@lru_cache(maxsize=None)
+def _http_client_medido():
+    """HTTPClient de gspread que registra método, status, bytes y latencia (clase armada al primer uso)."""
+    from gspread.exceptions import APIError
+    from gspread.http_client import HTTPClient
+
+    class _HTTPClientMedido(HTTPClient):
+        def request(self, method, endpoint, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                resp = super().request(method, endpoint, *args, **kwargs)
+            except APIError as e:
+                self._registrar(method, endpoint, t0, e.response)
+                raise
+            self._registrar(method, endpoint, t0, resp)
+            return resp
+
+        @staticmethod
+        def _registrar(method, endpoint, t0, resp):
+            body = getattr(resp.request, "body", None) or b""
+            _medir(metodo_api(method, endpoint), time.perf_counter() - t0,
+                   resp.status_code, len(body), len(resp.content or b""))
+
+    return _HTTPClientMedido
+
+
+@lru_cache(maxsize=None)
+def _http_medido():
+    """Transporte httplib2 autorizado (API v4) que registra las mismas métricas."""
+    from google_auth_httplib2 import AuthorizedHttp
+
+    class _HttpMedido(AuthorizedHttp):
+        def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+            t0 = time.perf_counter()
+            resp, content = super().request(uri, method, body=body, headers=headers, **kwargs)
+            _medir(metodo_api(method, uri), time.perf_counter() - t0, resp.status,
+                   len(body or b""), len(content or b""))
+            return resp, content
+
+    return _HttpMedido
+
 
 # ========== Core de autenticación / cliente ==========
 
 class GoogleSheetsClient:
-    """Cliente perezoso (lazy) con cache de credenciales y acceso a APIs de gspread y Sheets v4."""
+    """Cliente perezoso (lazy) con cache de credenciales y acceso a APIs de gspread y Sheets v4.
+
+    Con un backend falso enchufado (usar_backend / SHEETS_BACKEND=fake) `gspread` y
+    `values_api` devuelven sus equivalentes en memoria y no se cargan credenciales.
+    El cliente gspread y el servicio de discovery se construyen una sola vez por
+    proceso (bajo lock: los primeros requests concurrentes no los arman cada uno).
+    """
     _creds: Optional[Credentials] = None
     _gsc: Optional[gspread.Client] = None
     _svc_values = None
+    _fake = None   # sheets_fake.FakeSheets
+    _lock = threading.Lock()
+
+    def usar_backend(self, fake):
+        """Enchufa un sheets_fake.FakeSheets (None => vuelve a la API real)."""
+        self._fake = fake
+        self._gsc = None
+        self._svc_values = None
+
+    @property
+    def backend(self) -> str:
+        return "google" if self._fake is None else "fake"
 
     def _load_creds(self) -> Credentials:
         if self._creds:
             return self._creds
+        from google.oauth2.service_account import Credentials
         env_json = os.getenv("GOOGLE_CREDENTIALS") or os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
         if env_json:
             self._creds = Credentials.from_service_account_info(json.loads(env_json), scopes=SCOPES)
@@ -32,25 +169,43 @@ class GoogleSheetsClient:
             path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "config/credentials.json")
             self._creds = Credentials.from_service_account_file(path, scopes=SCOPES)
         try:
-            print("➡️ Service Account:", self._creds.service_account_email)
+            log.info("service account", extra={"datos": {"email": self._creds.service_account_email}})
         except Exception:
             pass
         return self._creds
 
     @property
     def gspread(self) -> gspread.Client:
+        if self._fake is not None:
+            return self._fake.cliente
         if not self._gsc:
-            self._gsc = gspread.authorize(self._load_creds())
+            with self._lock:
+                if not self._gsc:
+                    import gspread
+                    self._gsc = gspread.authorize(self._load_creds(), http_client=_http_client_medido())
         return self._gsc
 
     @property
     def values_api(self):
         """Google Sheets API v4 values endpoint (para batch updates eficientes)."""
+        if self._fake is not None:
+            return self._fake.values
         if not self._svc_values:
-            svc = build("sheets", "v4", credentials=self._load_creds(), cache_discovery=False)
-            self._svc_values = svc.spreadsheets().values()
+            with self._lock:
+                if not self._svc_values:
+                    from googleapiclient.discovery import build
+                    from googleapiclient.http import build_http
+                    http = _http_medido()(self._load_creds(), http=build_http())
+                    # documento de discovery empaquetado en la librería: sin ida a la red
+                    svc = build("sheets", "v4", http=http, cache_discovery=False, static_discovery=True)
+                    self._svc_values = svc.spreadsheets().values()
         return self._svc_values
 
+    def calentar(self):
+        """Construye credenciales, cliente gspread y servicio v4 (calentamiento de arranque)."""
+        self.gspread
+        self.values_api
+
     # helpers
     def open_by_key(self, sheet_id: str):
         return self.gspread.open_by_key(sheet_id)
@@ -67,6 +222,12 @@ class GoogleSheetsClient:
 
 client = GoogleSheetsClient()  # instancia única reutilizable
 
+if SHEETS_BACKEND == "fake":
+    from sheets_fake import FakeSheets
+    client.usar_backend(FakeSheets.desde_entorno(medir=_medir))
+    log.warning("backend de Sheets FALSO (SHEETS_BACKEND=fake)",
+                extra={"datos": {"dir": os.getenv("SHEETS_FAKE_DIR", "")}})
+
 
 # ========== Lectores ==========
 
@@ -109,6 +270,7 @@ class SheetReaderBase:
 class FullSheetReader(SheetReaderBase):
     """Lee la hoja entera (usa get_all_values). Úsalo solo en hojas chicas."""
     def to_dataframe(self) -> pd.DataFrame:
+        import pandas as pd
         all_vals = self.ws.get_all_values()
         if not all_vals:
             return pd.DataFrame()
@@ -121,17 +283,114 @@ class FullSheetReader(SheetReaderBase):
 
 
 class PopFilteredReader(SheetReaderBase):
-    """Lee SOLO filas cuyo POP == código, escaneando por chunks la columna POP."""
+    """Lee SOLO filas cuyo POP está entre los códigos pedidos.
+
+    Si la hoja fue cargada ordenada por POP (ver PopClusteredWriter), usa la hoja
+    índice y baja solo los rangos contiguos de esos POP; si no, escanea por chunks
+    la columna POP (una sola pasada aunque se pidan muchos códigos).
+    """
+    RANGES_PER_CALL = 100   # rangos por batchGet (evita URLs gigantes)
+    MERGE_GAP = 50          # filas intermedias toleradas al fusionar rangos vecinos
+
     def to_dataframe(self, codigo: str, chunk: int = 5000) -> pd.DataFrame:
+        return self.to_dataframe_multi([codigo], chunk=chunk)
+
+    def to_dataframe_multi(self, codigos: Iterable[str], chunk: int = 5000) -> pd.DataFrame:
+        wanted = {normalizacion.clave(c) for c in codigos} - {""}
+        df = self._leer_por_indice(wanted)
+        if df is not None:
+            return df
+        return self._leer_por_escaneo(wanted, chunk)
+
+    def _leer_por_indice(self, wanted: set) -> Optional[pd.DataFrame]:
+        """Índice + (header, rangos). None => sin índice o índice desactualizado."""
+        import pandas as pd
+        from googleapiclient.errors import HttpError
+        if _sabido_sin_indice(self.sheet_id, self.sheet_name):
+            return None
+        values = client.values_api
+        try:
+            resp = values.get(
+                spreadsheetId=self.sheet_id,
+                range=f"'{nombre_indice(self.sheet_name)}'!A2:C",
+            ).execute()
+        except HttpError as e:
+            if e.resp.status == 400:
+                _marcar_sin_indice(self.sheet_id, self.sheet_name, True)
+                return None  # la hoja índice no existe
+            raise
+
+        spans: List[List[int]] = []
+        expected = 0
+        for entry in resp.get("values", []):
+            if entry and normalizacion.clave(entry[0]) in wanted:
+                try:
+                    first_row, row_count = int(entry[1]), int(entry[2])
+                except (IndexError, ValueError):
+                    return None
+                spans.append([first_row, first_row + row_count - 1])
+                expected += row_count
+
+        # fusiona rangos vecinos: menos rangos por request
+        spans.sort()
+        merged: List[List[int]] = []
+        for a, b in spans:
+            if merged and a <= merged[-1][1] + 1 + self.MERGE_GAP:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+
+        ranges = [f"'{self.sheet_name}'!1:1"] + [f"'{self.sheet_name}'!{a}:{b}" for a, b in merged]
+        blocks: List[dict] = []
+        try:
+            for i in range(0, len(ranges), self.RANGES_PER_CALL):
+                got = values.batchGet(spreadsheetId=self.sheet_id, ranges=ranges[i:i + self.RANGES_PER_CALL]).execute()
+                blocks.extend(got.get("valueRanges", []))
+        except HttpError as e:
+            if e.resp.status != 400:
+                raise
+            # rangos rechazados (índice corrupto / fuera de la hoja): mejor escanear que fallar
+            log.warning("lectura por índice rechazada, se escanea", extra={"datos": {
+                "hoja": self.sheet_name, "error": repr(e)}})
+            return None
+
+        hdr = (blocks[0].get("values") or [[]])[0] if blocks else []
+        headers = self._dedup_headers(hdr)
+        self._headers = headers
+        if not spans:
+            return pd.DataFrame(columns=headers)
+
+        col_map = {normalizacion.clave(h): i for i, h in enumerate(headers)}
+        if "POP" not in col_map:
+            return None
+        pop_idx = col_map["POP"]
+        n = len(headers)
+        rows: List[List[str]] = []
+        leidas = 0
+        for block in blocks[1:]:
+            for vals in block.get("values", []):
+                leidas += 1
+                vals = vals[:n] + [""] * (n - len(vals))
+                if normalizacion.clave(vals[pop_idx]) in wanted:
+                    rows.append(vals)
+        metricas.POP_FILAS_LEIDAS.inc(leidas, hoja=self.sheet_name, modo="indice")
+        metricas.POP_FILAS_COINCIDEN.inc(len(rows), hoja=self.sheet_name, modo="indice")
+
+        # índice viejo (hoja recargada sin ordenar o escritura a medias): escaneo completo
+        if len(rows) != expected:
+            return None
+        return pd.DataFrame(rows, columns=headers)
+
+    def _leer_por_escaneo(self, wanted: set, chunk: int = 5000) -> pd.DataFrame:
+        import pandas as pd
         headers = self.headers()
-        if "POP" not in [h.strip().upper() for h in headers]:
+        if "POP" not in [normalizacion.clave(h) for h in headers]:
             return pd.DataFrame(columns=headers)
 
         # mapa de encabezados a índice 1-based
-        col_map = {h.strip().upper(): i + 1 for i, h in enumerate(headers)}
+        col_map = {normalizacion.clave(h): i + 1 for i, h in enumerate(headers)}
         pop_col = col_map["POP"]
         last_row = self.ws.row_count
-        codigo_norm = (codigo or "").strip().upper()
 
         matched = []
         for r0 in range(2, last_row + 1, chunk):
@@ -141,11 +400,13 @@ class PopFilteredReader(SheetReaderBase):
             rng = f"{colL}{r0}:{colL}{r1}"
             blocks = self.ws.batch_get([rng])
             col = blocks[0] if blocks else []
+            metricas.POP_FILAS_LEIDAS.inc(len(col), hoja=self.sheet_name, modo="escaneo")
             for i, v in enumerate(col):
-                val = (v[0] if v else "").strip().upper()
-                if val == codigo_norm:
+                val = normalizacion.clave(v[0] if v else "")
+                if val in wanted:
                     matched.append(r0 + i)
 
+        metricas.POP_FILAS_COINCIDEN.inc(len(matched), hoja=self.sheet_name, modo="escaneo")
         if not matched:
             return pd.DataFrame(columns=headers)
 
@@ -173,10 +434,11 @@ class SheetWriterBase:
         self.sheet_name = sheet_name
 
     def _get_or_create_ws(self, rows=100, cols=26):
+        from gspread.exceptions import WorksheetNotFound
         sh = client.open_by_key(self.sheet_id)
         try:
             ws = sh.worksheet(self.sheet_name)
-        except gspread.WorksheetNotFound:
+        except WorksheetNotFound:
             ws = sh.add_worksheet(self.sheet_name, rows=rows, cols=cols)
         return ws
 
@@ -184,6 +446,7 @@ class SheetWriterBase:
 class StreamingWriter(SheetWriterBase):
     """Escribe en bloques usando Sheets API (memoria constante)."""
     def write_rows(self, rows_iter: Iterable[List], batch_rows: int = 2000):
+        t0 = time.perf_counter()
         ws = self._get_or_create_ws()
         ws.clear()
 
@@ -208,6 +471,8 @@ class StreamingWriter(SheetWriterBase):
                 body={"values": rect},
             ).execute()
             start_row += len(rect)
+            metricas.ESCRITURA_LOTES.inc(hoja=self.sheet_name)
+            metricas.ESCRITURA_FILAS.inc(len(rect), hoja=self.sheet_name)
             buf = []
 
         for row in rows_iter:
@@ -218,11 +483,103 @@ class StreamingWriter(SheetWriterBase):
                 flush()
         flush()
         ws.resize(rows=start_row - 1, cols=max_cols)
+        metricas.ESCRITURA_DURACION.observe(time.perf_counter() - t0, hoja=self.sheet_name)
+
+
+class RowWriter(SheetWriterBase):
+    """Escrituras puntuales de UNA fila vía Sheets API (sin reescribir la hoja)."""
+    def read_row(self, row: int) -> List[str]:
+        """Valores actuales de la fila (sin celdas vacías al final); [] si está vacía."""
+        resp = client.values_api.get(
+            spreadsheetId=self.sheet_id,
+            range=f"'{self.sheet_name}'!{row}:{row}",
+        ).execute()
+        return (resp.get("values") or [[]])[0]
+
+    def update_row(self, row: int, values: List):
+        client.values_api.update(
+            spreadsheetId=self.sheet_id,
+            range=f"'{self.sheet_name}'!A{row}",
+            valueInputOption="RAW",
+            body={"values": [["" if v is None else v for v in values]]},
+        ).execute()
+
+    def append_row(self, values: List) -> int:
+        """Agrega la fila al final de la tabla y devuelve su número (1-based), o 0 si no se pudo inferir."""
+        resp = client.values_api.append(
+            spreadsheetId=self.sheet_id,
+            range=f"'{self.sheet_name}'!A1",
+            valueInputOption="RAW",
+            insertDataOption="INSERT_ROWS",
+            body={"values": [["" if v is None else v for v in values]]},
+        ).execute()
+        # updatedRange: "'Usuarios'!A12:H12"
+        rng = (resp.get("updates") or {}).get("updatedRange", "")
+        m = re.search(r"![A-Z]+(\d+)", rng)
+        return int(m.group(1)) if m else 0
+
+
+class PopClusteredWriter(StreamingWriter):
+    """
+    Igual que StreamingWriter, pero agrupa las filas por POP normalizado (normalizacion.clave)
+    y deja en la hoja lateral `<hoja>_idx` el índice (POP, first_row, row_count).
+    Las filas sin POP van al final y no se indexan. Mantiene el orden original dentro de cada POP.
+
+    Orden de escritura: se borra el índice viejo ANTES de limpiar la hoja y el nuevo se
+    escribe al final; un lector concurrente nunca sigue un índice hacia datos que no le
+    corresponden (mientras tanto escanea).
+    """
+    def write_rows(self, rows_iter: Iterable[List], batch_rows: int = 2000):
+        it = iter(rows_iter)
+        header = next(it, None)
+        eliminar_indice_pop(self.sheet_id, self.sheet_name)
+        if header is None:
+            super().write_rows([], batch_rows=batch_rows)
+            return
+        header = list(header)
+        cols_norm = [normalizacion.clave(h) for h in header]
+        if "POP" not in cols_norm:
+            # sin columna POP no hay nada que indexar: escritura normal
+            super().write_rows([header, *it], batch_rows=batch_rows)
+            return
+        pop_idx = cols_norm.index("POP")
+
+        grupos: Dict[str, List[List]] = {}
+        for row in it:
+            row = list(row)
+            v = row[pop_idx] if pop_idx < len(row) else ""
+            key = normalizacion.clave(v)
+            grupos.setdefault(key, []).append(row)
+
+        claves = sorted(k for k in grupos if k)
+        if "" in grupos:
+            claves.append("")
+
+        index_rows: List[List] = []
+        fila = 2  # la fila 1 es el header
+        for k in claves:
+            n = len(grupos[k])
+            if k:
+                index_rows.append([k, fila, n])
+            fila += n
+
+        def ordenadas():
+            yield header
+            for k in claves:
+                yield from grupos.pop(k)  # liberamos cada grupo apenas se escribe
+
+        super().write_rows(ordenadas(), batch_rows=batch_rows)
+        StreamingWriter(self.sheet_id, nombre_indice(self.sheet_name)).write_rows(
+            [IDX_HEADERS, *index_rows], batch_rows=5000
+        )
+        _marcar_sin_indice(self.sheet_id, self.sheet_name, False)
 
 
 class DataFrameWriter(SheetWriterBase):
     """Escritura simple con gspread (para DFs chicos)."""
     def write_df(self, df: pd.DataFrame):
+        import pandas as pd
+        from gspread_dataframe import set_with_dataframe
         ws = self._get_or_create_ws()
         ws.clear()
         set_with_dataframe(ws, (df.copy() if df is not None else pd.DataFrame()).fillna(""))
@@ -235,6 +592,7 @@ def excel_rows_from_bytes(xio, sheet: Optional[str] = None) -> Generator[List, N
     Genera filas (listas) leyendo un XLSX en modo streaming.
     La primera fila devuelta es el header.
     """
+    from openpyxl import load_workbook
     wb = load_workbook(filename=xio, read_only=True, data_only=True)
     ws = wb[sheet] if sheet and sheet in wb.sheetnames else wb.active
     first = True
@@ -265,12 +623,40 @@ def leer_filas_por_pop(sheet_id: str, nombre_hoja: str, codigo: str) -> pd.DataF
     """Recomendado para hojas grandes: solo filas con POP=codigo."""
     return PopFilteredReader(sheet_id, nombre_hoja).to_dataframe(codigo)
 
+def leer_filas_por_pops(sheet_id: str, nombre_hoja: str, codigos: Iterable[str]) -> pd.DataFrame:
+    """Como leer_filas_por_pop, pero para varios POP en una sola pasada / un solo fetch de rangos."""
+    return PopFilteredReader(sheet_id, nombre_hoja).to_dataframe_multi(codigos)
+
 def escribir_hoja(sheet_id: str, sheet_name: str, df: pd.DataFrame):
     DataFrameWriter(sheet_id, sheet_name).write_df(df)
 
 def escribir_hoja_stream(sheet_id: str, sheet_name: str, rows_iter: Iterable[List], batch_rows: int = 2000):
     StreamingWriter(sheet_id, sheet_name).write_rows(rows_iter, batch_rows=batch_rows)
 
+def leer_fila(sheet_id: str, sheet_name: str, row: int) -> List[str]:
+    return RowWriter(sheet_id, sheet_name).read_row(row)
+
+def actualizar_fila(sheet_id: str, sheet_name: str, row: int, values: List):
+    RowWriter(sheet_id, sheet_name).update_row(row, values)
+
+def agregar_fila(sheet_id: str, sheet_name: str, values: List) -> int:
+    return RowWriter(sheet_id, sheet_name).append_row(values)
+
+def escribir_hoja_stream_por_pop(sheet_id: str, sheet_name: str, rows_iter: Iterable[List], batch_rows: int = 2000):
+    """Como escribir_hoja_stream, pero ordenando por POP y generando la hoja índice `<hoja>_idx`."""
+    PopClusteredWriter(sheet_id, sheet_name).write_rows(rows_iter, batch_rows=batch_rows)
+
+def eliminar_indice_pop(sheet_id: str, sheet_name: str):
+    """Borra la hoja índice si existe (ANTES de recargar la hoja sin ordenar: ver PopClusteredWriter)."""
+    from gspread.exceptions import WorksheetNotFound
+    _marcar_sin_indice(sheet_id, sheet_name, True)
+    sh = client.open_by_key(sheet_id)
+    try:
+        ws = sh.worksheet(nombre_indice(sheet_name))
+    except WorksheetNotFound:
+        return
+    sh.del_worksheet(ws)
+
 def escribir_excel_streaming(sheet_id: str, sheet_name: str, xio, batch_rows: int = 2000, sheet_in_xlsx: Optional[str]=None):
     """Carga un XLSX a Sheets sin DataFrame ni copias grandes."""
     rows_iter = excel_rows_from_bytes(xio, sheet=sheet_in_xlsx)
@@ -0,0 +1,222 @@
+# correo.py
+"""
+Outbox de correo: send_mail() solo encola y vuelve al instante; un hilo de fondo
+drena la cola reutilizando UNA conexión SMTP autenticada, agrupa ráfagas,
+reintenta con backoff (sin frenar al resto de la cola) y expone la profundidad de la cola.
+
+Para probar en local con un servidor de debug (sin TLS):
+    python -m smtpd -n -c DebuggingServer localhost:1025      # Python <= 3.11
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_TLS=none NOTIFY_EMAILS=yo@example.com uvicorn main:app
+"""
+from __future__ import annotations
+import os
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from email.mime.text import MIMEText
+from email.utils import formatdate
+from typing import Dict, List, Optional
+
+import registro
+
+log = registro.obtener("correo")
+
+SMTP_HOST = os.getenv("SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASS = os.getenv("SMTP_PASS", "")
+SMTP_TLS = os.getenv("SMTP_TLS", "").lower()   # "ssl" | "starttls" | "none"; vacío => según puerto
+FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER or "no-reply@example.com")
+NOTIFY_EMAILS = [e.strip() for e in os.getenv("NOTIFY_EMAILS", "").split(",") if e.strip()]
+
+OUTBOX_MAX = int(os.getenv("MAIL_OUTBOX_MAX", "500"))        # mensajes en cola
+MAIL_BATCH = int(os.getenv("MAIL_BATCH", "20"))               # máx. mensajes por ráfaga
+MAIL_RETRIES = int(os.getenv("MAIL_RETRIES", "5"))
+MAIL_IDLE_CLOSE = int(os.getenv("MAIL_IDLE_CLOSE", "60"))     # seg sin mensajes => cerrar conexión
+MAIL_BACKOFF_MAX = float(os.getenv("MAIL_BACKOFF_MAX", "60"))  # tope de espera entre reintentos (s)
+
+
+def _espera(intentos: int) -> float:
+    return min(MAIL_BACKOFF_MAX, 2 ** intentos)
+
+
+class Outbox:
+    """Cola de salida + hilo remitente con una conexión SMTP reutilizable."""
+    def __init__(self):
+        self._q: "queue.Queue[Dict]" = queue.Queue(maxsize=OUTBOX_MAX)
+        self._conn: Optional[smtplib.SMTP] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # correos a reintentar más tarde; solo los toca el hilo remitente
+        self._diferidos: List[Dict] = []
+        self.enviados = 0
+        self.fallidos = 0
+        self.descartados = 0
+
+    # ---------- API ----------
+    def enqueue(self, from_addr: str, recipients: List[str], raw: str) -> bool:
+        self._start()
+        try:
+            self._q.put_nowait({"from": from_addr, "to": recipients, "raw": raw, "intentos": 0})
+            return True
+        except queue.Full:
+            self.descartados += 1
+            log.error("outbox llena: correo descartado", extra={"datos": {"para": recipients}})
+            return False
+
+    def depth(self) -> int:
+        return self._q.qsize() + len(self._diferidos)
+
+    def estado(self) -> Dict[str, int]:
+        return {"en_cola": self.depth(), "enviados": self.enviados,
+                "fallidos": self.fallidos, "descartados": self.descartados}
+
+    def cerrar(self, timeout: float = 5.0):
+        """Espera (acotado) a que se vacíe la cola; se usa al apagar la app."""
+        fin = time.time() + timeout
+        while self.depth() and time.time() < fin:
+            time.sleep(0.1)
+        self._close()
+
+    # ---------- hilo remitente ----------
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="outbox-smtp", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._vencidos()
+            try:
+                if not batch:
+                    batch.append(self._q.get(timeout=self._espera_cola()))
+            except queue.Empty:
+                if not self._diferidos:
+                    self._close()
+                continue
+            while len(batch) < MAIL_BATCH:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._send_batch(batch)
+
+    def _vencidos(self) -> List[Dict]:
+        """Saca de los diferidos los que ya cumplieron su espera."""
+        ahora = time.monotonic()
+        listos, quedan = [], []
+        for d in self._diferidos:
+            (listos if d["proximo_intento"] <= ahora and len(listos) < MAIL_BATCH else quedan).append(d)
+        self._diferidos = quedan
+        return listos
+
+    def _espera_cola(self) -> float:
+        if not self._diferidos:
+            return MAIL_IDLE_CLOSE
+        proximo = min(d["proximo_intento"] for d in self._diferidos)
+        return max(0.0, min(MAIL_IDLE_CLOSE, proximo - time.monotonic()))
+
+    def _send_batch(self, batch: List[Dict]):
+        pending = list(batch)
+        while pending:
+            item = pending[0]
+            try:
+                self._ensure_conn().sendmail(item["from"], item["to"], item["raw"])
+                self.enviados += 1
+                log.info("mail enviado", extra={"datos": {"para": item["to"]}})
+                pending.pop(0)
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    self._discard(pending, e)   # rechazo permanente: no tiene sentido reintentar
+                    continue
+                self._retry(pending, e)
+            except smtplib.SMTPRecipientsRefused as e:
+                # no es SMTPResponseException: los códigos vienen por destinatario
+                if all(code >= 500 for code, _ in e.recipients.values()):
+                    self._discard(pending, e)
+                    continue
+                self._retry(pending, e)
+            except Exception as e:
+                self._retry(pending, e)
+
+    def _discard(self, pending: List[Dict], err: Exception):
+        self.fallidos += 1
+        log.error("error enviando correo (permanente)", extra={"datos": {"para": pending[0]["to"], "error": repr(err)}})
+        pending.pop(0)
+
+    def _retry(self, pending: List[Dict], err: Exception):
+        """Difiere el correo con backoff; el resto de la cola sigue saliendo mientras tanto."""
+        if not isinstance(err, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+            self._close()   # la conexión puede haber quedado rota; los rechazos 4xx no la invalidan
+        item = pending.pop(0)
+        item["intentos"] += 1
+        if item["intentos"] >= MAIL_RETRIES:
+            self.fallidos += 1
+            log.error("error enviando correo (sin más reintentos)", extra={"datos": {"para": item["to"], "error": repr(err)}})
+            return
+        delay = _espera(item["intentos"])
+        item["proximo_intento"] = time.monotonic() + delay
+        self._diferidos.append(item)
+        log.warning("error enviando correo, reintento", extra={"datos": {
+            "intento": item["intentos"], "max": MAIL_RETRIES, "espera_s": delay, "error": repr(err)}})
+
+    # ---------- conexión ----------
+    def _ensure_conn(self) -> smtplib.SMTP:
+        if self._conn is not None:
+            try:
+                if self._conn.noop()[0] == 250:
+                    return self._conn
+            except Exception:
+                pass
+            self._close()
+        self._conn = self._connect()
+        return self._conn
+
+    @staticmethod
+    def _connect() -> smtplib.SMTP:
+        mode = SMTP_TLS or ("ssl" if SMTP_PORT == 465 else "starttls")
+        if mode == "ssl":
+            s = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=20, context=ssl.create_default_context())
+        else:
+            s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20)
+            s.ehlo()
+            if mode == "starttls":
+                s.starttls(context=ssl.create_default_context())
+                s.ehlo()
+        if SMTP_USER:
+            s.login(SMTP_USER, SMTP_PASS)
+        return s
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+
+outbox = Outbox()  # instancia única por proceso
+
+
+def send_mail(subject: str, html_body: str, to_addrs=None):
+    """Encola un correo HTML (no bloquea). Soporta SMTP SSL (465), STARTTLS (587) o sin TLS."""
+    if not SMTP_HOST or not (NOTIFY_EMAILS or to_addrs):
+        log.info("notificación no enviada: SMTP/destinatarios no configurados")
+        return
+
+    recipients = [e.strip() for e in (to_addrs or NOTIFY_EMAILS) if e.strip()]
+    if not recipients:
+        log.info("notificación no enviada: lista de destinatarios vacía")
+        return
+
+    msg = MIMEText(html_body, "html", "utf-8")
+    msg["Subject"] = subject
+    msg["From"] = FROM_EMAIL
+    msg["To"] = ", ".join(recipients)
+    msg["Date"] = formatdate(localtime=True)
+
+    outbox.enqueue(FROM_EMAIL, recipients, msg.as_string())
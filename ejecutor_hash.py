@@ -0,0 +1,78 @@
+# ejecutor_hash.py
+"""
+Pool dedicado y acotado para bcrypt (hash/verify).
+
+Así un burst de logins no ocupa los hilos del threadpool compartido de FastAPI
+(que atiende /buscar, /exportar_excel, etc.).
+"""
+from __future__ import annotations
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from concurrencia import LimiteConcurrencia, Ocupado  # noqa: F401 (Ocupado se re-exporta)
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "16"))       # en ejecución + en cola
+HASH_MAX_POR_IP = int(os.getenv("HASH_MAX_POR_IP", "4"))
+HASH_MAX_POR_EMAIL = int(os.getenv("HASH_MAX_POR_EMAIL", "2"))
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash")
+_limite = LimiteConcurrencia(HASH_QUEUE_MAX, caps={"ip": HASH_MAX_POR_IP, "email": HASH_MAX_POR_EMAIL})
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, float] = {
+    "tareas": 0,
+    "espera_total_s": 0.0,
+    "espera_max_s": 0.0,
+    "hash_total_s": 0.0,
+    "hash_max_s": 0.0,
+}
+
+
+def _registrar(espera: float, duracion: float):
+    with _stats_lock:
+        _stats["tareas"] += 1
+        _stats["espera_total_s"] += espera
+        _stats["espera_max_s"] = max(_stats["espera_max_s"], espera)
+        _stats["hash_total_s"] += duracion
+        _stats["hash_max_s"] = max(_stats["hash_max_s"], duracion)
+
+
+async def ejecutar(fn: Callable[..., Any], *args, ip: Optional[str] = None, email: Optional[str] = None) -> Any:
+    """
+    Corre fn(*args) en el pool de hashing. Lanza Ocupado (sin encolar) si se supera
+    HASH_QUEUE_MAX o los cupos por IP / por email.
+    """
+    keys = _limite.adquirir(ip=ip, email=email)
+    t_submit = time.perf_counter()
+
+    def tarea():
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            _registrar(t0 - t_submit, time.perf_counter() - t0)
+
+    try:
+        fut = _pool.submit(tarea)
+    except Exception:
+        _limite.liberar(keys)
+        raise
+    # el cupo se libera cuando termina el hash (aunque el cliente se haya ido)
+    fut.add_done_callback(lambda _f: _limite.liberar(keys))
+    return await asyncio.wrap_future(fut)
+
+
+def estadisticas() -> Dict[str, float]:
+    with _stats_lock:
+        out = dict(_stats)
+    n = out["tareas"] or 1
+    out["espera_prom_s"] = out["espera_total_s"] / n
+    out["hash_prom_s"] = out["hash_total_s"] / n
+    out["en_curso"] = _limite.en_curso
+    out["rechazos"] = _limite.rechazos
+    return out
@@ -0,0 +1,232 @@
+# exportador_excel.py
+"""
+Motor de exportación a Excel en modo write-only de openpyxl.
+
+Reemplaza el flujo pd.ExcelWriter + _format_sheet (que recorría cada celda tres veces
+y creaba un Alignment por celda). Aquí:
+  - los estilos (cabecera / datos) se crean una sola vez y se copian por referencia;
+  - el ancho de columnas se calcula en una pasada sobre los valores ya convertidos a texto
+    (en write-only las <cols> van antes de las filas, así que deben conocerse antes);
+  - la altura de cada fila se calcula al momento de emitirla;
+  - el libro se guarda en un SpooledTemporaryFile (pasa a disco si crece) y se entrega
+    en chunks, sin tener el .xlsx completo en memoria.
+"""
+from __future__ import annotations
+import sys
+import tempfile
+import zipfile
+from copy import copy
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+if TYPE_CHECKING:   # openpyxl se importa al primer Excel (ver arranque.py)
+    from openpyxl.cell import WriteOnlyCell
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MEDIA_TYPE = "application/zip"
+
+# Misma heurística que el antiguo _format_sheet
+MIN_WIDTH = 10
+MAX_WIDTH = 55         # ancho máximo para no desbordar demasiado
+BASE_HEIGHT = 15       # altura de una línea
+MAX_HEIGHT = 150       # para no generar filas gigantes
+SIN_DATOS = "Sin datos para este POP"
+
+SPOOL_MAX = 8 * 1024 * 1024   # hasta 8 MB en RAM, luego a disco
+CHUNK = 64 * 1024
+
+
+def _vacio(v: Any) -> bool:
+    """None, "" o un escalar nulo de pandas/numpy (NaN, NaT, pd.NA) => celda vacía."""
+    if v is None:
+        return True
+    if isinstance(v, str):
+        return v == ""
+    if isinstance(v, float):
+        return v != v
+    if isinstance(v, int):
+        return False
+    pd = sys.modules.get("pandas")   # si pandas no está cargado no puede haber pd.NA / NaT
+    return pd is not None and pd.api.types.is_scalar(v) and bool(pd.isna(v))
+
+
+def _texto(v: Any) -> str:
+    return "" if _vacio(v) else str(v)
+
+
+def _lineas(text: str, chars_per_line: int) -> int:
+    # líneas explícitas por saltos de línea + wrap según el ancho de la columna
+    return sum(max(1, (len(hl) + chars_per_line - 1) // chars_per_line) for hl in text.split("\n"))
+
+
+@lru_cache(maxsize=None)
+def _estilos() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Objetos de estilo compartidos (cabecera, datos), creados una vez."""
+    from openpyxl.styles import Alignment, Font, PatternFill
+    header = {
+        "font": Font(bold=True),
+        "fill": PatternFill("solid", fgColor="F2F2F2"),
+        "alignment": Alignment(wrap_text=True, vertical="top"),
+    }
+    return header, {"alignment": Alignment(wrap_text=True, vertical="top")}
+
+
+class ExcelStreamExporter:
+    """Arma un .xlsx hoja por hoja en modo write-only."""
+    def __init__(self):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        self.wb = Workbook(write_only=True)
+        self._celda = WriteOnlyCell
+
+    def _plantilla(self, ws, styles: Dict[str, Any]) -> WriteOnlyCell:
+        # el estilo se registra una vez en el libro; luego solo se copia su StyleArray
+        cell = self._celda(ws)
+        for k, v in styles.items():
+            setattr(cell, k, v)
+        return cell
+
+    def _cell(self, ws, value: Any, tpl: WriteOnlyCell) -> WriteOnlyCell:
+        cell = self._celda(ws, value=None if _vacio(value) else value)
+        cell._style = copy(tpl._style)
+        return cell
+
+    # ---------- API ----------
+    def add_sheet(self, title: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]):
+        """Agrega una hoja con cabecera + filas (valores escalares)."""
+        ws = self.wb.create_sheet(title)
+        from openpyxl.utils import get_column_letter
+        header_style, data_style = _estilos()
+        tpl_header = self._plantilla(ws, header_style)
+        tpl_data = self._plantilla(ws, data_style)
+        headers = list(headers)
+        if not headers:
+            ws.column_dimensions["A"].width = max(MIN_WIDTH, min(MAX_WIDTH, len(SIN_DATOS) * 0.9 + 2))
+            ws.append([self._cell(ws, SIN_DATOS, tpl_header)])
+            return
+
+        # 1) texto de cada celda (se reutiliza para anchos y alturas)
+        n = len(headers)
+        text_rows: List[List[str]] = [[_texto(h) for h in headers]]
+        raw_rows: List[Sequence[Any]] = [headers]
+        for r in rows:
+            r = list(r)[:n]
+            raw_rows.append(r)
+            text_rows.append([_texto(v) for v in r])
+
+        # 2) anchos (deben escribirse antes de la primera fila)
+        widths = [MIN_WIDTH] * n
+        for tr in text_rows:
+            for i, t in enumerate(tr):
+                if t:
+                    w = len(t) * 0.9 + 2  # ~0.9 chars por punto + 2 de margen
+                    if w > widths[i]:
+                        widths[i] = min(MAX_WIDTH, w)
+        for i, w in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = w
+        chars_per_line = [max(1, int(w * 1.1)) for w in widths]  # 1.1 ≈ heurística
+
+        # 3) filas: altura estimada al emitir cada una
+        for idx, (raw, tr) in enumerate(zip(raw_rows, text_rows), start=1):
+            max_lines = 1
+            for i, t in enumerate(tr):
+                if t:
+                    max_lines = max(max_lines, _lineas(t, chars_per_line[i]))
+            ws.row_dimensions[idx].height = min(MAX_HEIGHT, BASE_HEIGHT * max_lines)
+            tpl = tpl_header if idx == 1 else tpl_data
+            ws.append([self._cell(ws, v, tpl) for v in raw])
+
+    def add_records(self, title: str, records: List[Dict[str, Any]]):
+        """Hoja desde una lista de dicts (columnas en orden de aparición)."""
+        headers: List[str] = []
+        seen = set()
+        for r in records:
+            for k in r.keys():
+                if k not in seen:
+                    seen.add(k)
+                    headers.append(k)
+        self.add_sheet(title, headers, ([r.get(h, "") for h in headers] for r in records))
+
+    def add_dataframe(self, title: str, df):
+        headers = [str(c) for c in df.columns] if df is not None else []
+        rows = df.itertuples(index=False, name=None) if headers else ()
+        self.add_sheet(title, headers, rows)
+
+    def save(self) -> tempfile.SpooledTemporaryFile:
+        """Guarda el libro y devuelve el archivo posicionado al inicio."""
+        f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+        self.wb.save(f)
+        f.seek(0)
+        return f
+
+
+def file_size(f) -> int:
+    pos = f.tell()
+    f.seek(0, 2)
+    size = f.tell()
+    f.seek(pos)
+    return size
+
+
+def iter_file(f, chunk: int = CHUNK, close: bool = True) -> Iterator[bytes]:
+    """Entrega el archivo en chunks (para StreamingResponse) y lo cierra al final."""
+    try:
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            yield data
+    finally:
+        if close:
+            f.close()
+
+
+class _SalidaZip:
+    """Destino no-seekable para ZipFile: acumula bytes hasta que se drenan."""
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drenar(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+def iter_zip(entries: Iterable[Tuple[str, Any]], chunk: int = CHUNK) -> Iterator[bytes]:
+    """
+    ZIP generado de forma incremental: cada entrada (nombre, archivo) se copia en
+    chunks y lo escrito se entrega de inmediato, así en memoria hay a lo más un chunk
+    (más el archivo de la entrada en curso). Los .xlsx ya vienen comprimidos => STORED.
+    `entries` puede ser un generador: cada libro se arma recién cuando toca.
+    """
+    out = _SalidaZip()
+    with zipfile.ZipFile(out, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for name, f in entries:
+            try:
+                with zf.open(name, mode="w", force_zip64=True) as dst:
+                    while True:
+                        data = f.read(chunk)
+                        if not data:
+                            break
+                        dst.write(data)
+                        b = out.drenar()
+                        if b:
+                            yield b
+            finally:
+                f.close()
+            b = out.drenar()  # data descriptor de la entrada
+            if b:
+                yield b
+    yield out.drenar()  # directorio central
@@ -0,0 +1,446 @@
+# indices.py
+"""
+Índices en memoria construidos sobre las hojas cacheadas (se reconstruyen solo
+cuando cambia la versión de datos de las hojas de origen).
+"""
+from __future__ import annotations
+import math
+import re
+import threading
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from normalizacion import compacta as _normalizar   # sin tildes, mayúsculas, espacios colapsados
+
+if TYPE_CHECKING:
+    # numpy / pandas se importan al construir o consultar un índice (ver arranque.py)
+    import numpy as np
+    import pandas as pd
+
+
+def sitios_desde_hojas(*dfs: Optional[pd.DataFrame], campos: Dict[str, str]) -> List[Dict[str, str]]:
+    """
+    Un registro por POP con los `campos` pedidos ({clave_salida: COLUMNA_NORMALIZADA}).
+    Si el POP aparece en varias hojas, gana el primer valor no vacío de cada campo.
+    """
+    sitios: Dict[str, Dict[str, str]] = {}
+    for df in dfs:
+        if df is None or df.empty:
+            continue
+        cols = {_normalizar(c): c for c in df.columns}
+        if "POP" not in cols:
+            continue
+        pops = df[cols["POP"]].fillna("").astype(str).str.strip().tolist()
+        valores = {k: (df[cols[c]].fillna("").astype(str).str.strip().tolist() if c in cols else None)
+                   for k, c in campos.items()}
+        for i, pop in enumerate(pops):
+            if not pop:
+                continue
+            s = sitios.setdefault(pop.upper(), dict({"pop": pop}, **{k: "" for k in campos}))
+            for k, vals in valores.items():
+                if vals is not None and vals[i] and not s[k]:
+                    s[k] = vals[i]
+    return list(sitios.values())
+
+
+class IndiceVersionado:
+    """Guarda el índice construido para una versión; `obtener` lo rehace si la versión cambió."""
+    def __init__(self, construir: Callable[[], Any]):
+        self._construir = construir
+        self._lock = threading.Lock()
+        self._version: Optional[Hashable] = None
+        self._indice: Any = None
+
+    def obtener(self, version: Hashable) -> Any:
+        if self._version == version and self._indice is not None:
+            return self._indice
+        with self._lock:
+            if self._version != version or self._indice is None:
+                self._indice = self._construir()
+                self._version = version
+        return self._indice
+
+
+class PrefixIndex:
+    """
+    Autocompletado por prefijo: claves normalizadas (sin tildes, mayúsculas) en un
+    arreglo ordenado + bisect. Cada sitio se indexa por su código POP, por el nombre
+    completo y por cada palabra del nombre (para encontrar "MAIPU" en "CERRO MAIPU").
+    """
+    def __init__(self):
+        self._claves: List[str] = []
+        self._ids: List[int] = []
+        self._prioridad: List[int] = []   # 0 = coincide el POP, 1 = nombre, 2 = palabra del nombre
+        self.sitios: List[Dict[str, str]] = []
+
+    @classmethod
+    def desde_hojas(cls, *dfs: Optional[pd.DataFrame]) -> "PrefixIndex":
+        return cls._construir(sitios_desde_hojas(*dfs, campos={"nombre": "NOMBRE"}))
+
+    @classmethod
+    def _construir(cls, sitios: List[Dict[str, str]]) -> "PrefixIndex":
+        idx = cls()
+        idx.sitios = sitios
+        entradas: List[Tuple[str, int, int]] = []
+        for i, s in enumerate(sitios):
+            entradas.append((_normalizar(s["pop"]), 0, i))
+            nombre = _normalizar(s["nombre"])
+            if nombre:
+                entradas.append((nombre, 1, i))
+                for palabra in set(nombre.split()[1:]):
+                    entradas.append((palabra, 2, i))
+        entradas.sort()
+        idx._claves = [e[0] for e in entradas]
+        idx._prioridad = [e[1] for e in entradas]
+        idx._ids = [e[2] for e in entradas]
+        return idx
+
+    def __len__(self) -> int:
+        return len(self.sitios)
+
+    def buscar(self, prefijo: str, limite: int = 10) -> List[Dict[str, str]]:
+        """Hasta `limite` sitios cuyo POP / nombre / palabra del nombre empieza con `prefijo`."""
+        q = _normalizar(prefijo)
+        if not q:
+            return []
+        i = bisect_left(self._claves, q)
+        # se revisan a lo más limite*4 claves: basta para rankear sin recorrer todo el rango
+        candidatos: Dict[int, Tuple[int, str]] = {}
+        n = len(self._claves)
+        while i < n and self._claves[i].startswith(q) and len(candidatos) < limite * 4:
+            sid, prio = self._ids[i], self._prioridad[i]
+            if sid not in candidatos or prio < candidatos[sid][0]:
+                candidatos[sid] = (prio, self._claves[i])
+            i += 1
+        orden = sorted(candidatos.items(), key=lambda kv: (kv[1][0], len(kv[1][1]), kv[1][1]))
+        return [self.sitios[sid] for sid, _ in orden[:limite]]
+
+
+# =========================
+#  Índice espacial (Latitud / Longitud)
+# =========================
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = 111.195          # km por grado de latitud (≈ constante)
+CAMPOS_GEO = {"nombre": "NOMBRE", "comuna": "COMUNA", "region": "REGION",
+              "lat": "LATITUD", "lon": "LONGITUD"}
+
+
+def _a_float(valores: List[str]) -> np.ndarray:
+    """'-33,4489' / '-33.4489' / '' => float (NaN si no se puede leer)."""
+    import pandas as pd
+    s = pd.Series(valores, dtype="object").astype(str).str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distancia (km) desde un punto a todos los puntos, vectorizada (grados)."""
+    import numpy as np
+    p1, l1 = np.radians(lat), np.radians(lon)
+    p2, l2 = np.radians(lats), np.radians(lons)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin((l2 - l1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+class GeoIndex:
+    """
+    Grilla de celdas de `celda` grados: los sitios se ordenan por celda y cada celda
+    guarda su rango [ini, fin) en los arreglos. Las consultas solo calculan haversine
+    (vectorizado) sobre las celdas que pueden contener resultados.
+    """
+    def __init__(self, sitios: List[Dict[str, str]], celda: float = 0.25):
+        import numpy as np
+        lat = _a_float([s["lat"] for s in sitios])
+        lon = _a_float([s["lon"] for s in sitios])
+        ok = (np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+              & ~((lat == 0) & (lon == 0)))
+        idx = np.flatnonzero(ok)
+        cy = np.floor(lat[idx] / celda).astype(np.int64)
+        cx = np.floor(lon[idx] / celda).astype(np.int64)
+        orden = np.lexsort((cx, cy))
+        idx, cy, cx = idx[orden], cy[orden], cx[orden]
+
+        self.celda = celda
+        self.sitios = [sitios[i] for i in idx]
+        self.lat = lat[idx]
+        self.lon = lon[idx]
+        self._pos = {s["pop"].upper(): i for i, s in enumerate(self.sitios)}
+        self._celdas: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        if len(idx):
+            cambios = np.flatnonzero((np.diff(cy) != 0) | (np.diff(cx) != 0)) + 1
+            inicios = np.concatenate(([0], cambios))
+            finales = np.concatenate((cambios, [len(idx)]))
+            for a, b in zip(inicios.tolist(), finales.tolist()):
+                self._celdas[(int(cy[a]), int(cx[a]))] = (a, b)
+            self._cy_rango = (int(cy.min()), int(cy.max()))
+            self._cx_rango = (int(cx.min()), int(cx.max()))
+        self.descartados = len(sitios) - len(idx)   # sin coordenadas válidas
+
+    @classmethod
+    def desde_hojas(cls, *dfs: Optional[pd.DataFrame]) -> "GeoIndex":
+        return cls(sitios_desde_hojas(*dfs, campos=CAMPOS_GEO))
+
+    def __len__(self) -> int:
+        return len(self.sitios)
+
+    def coordenadas(self, pop: str) -> Optional[Tuple[float, float]]:
+        i = self._pos.get((pop or "").strip().upper())
+        return None if i is None else (float(self.lat[i]), float(self.lon[i]))
+
+    # ---------- internos ----------
+    def _candidatos(self, lat: float, lon: float, anillo: int) -> np.ndarray:
+        """Índices de los sitios en las celdas a distancia <= anillo de la celda del punto."""
+        import numpy as np
+        cy0, cx0 = math.floor(lat / self.celda), math.floor(lon / self.celda)
+        ys = range(max(cy0 - anillo, self._cy_rango[0]), min(cy0 + anillo, self._cy_rango[1]) + 1)
+        xs = range(max(cx0 - anillo, self._cx_rango[0]), min(cx0 + anillo, self._cx_rango[1]) + 1)
+        if len(ys) * len(xs) > len(self._celdas):
+            # ventana más grande que las celdas ocupadas: recorrer las celdas
+            rangos = [r for (y, x), r in self._celdas.items() if y in ys and x in xs]
+        else:
+            rangos = [self._celdas[(y, x)] for y in ys for x in xs if (y, x) in self._celdas]
+        if not rangos:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(a, b) for a, b in rangos])
+
+    def _cubre_todo(self, lat: float, lon: float, anillo: int) -> bool:
+        cy0, cx0 = math.floor(lat / self.celda), math.floor(lon / self.celda)
+        return (cy0 - anillo <= self._cy_rango[0] and cy0 + anillo >= self._cy_rango[1]
+                and cx0 - anillo <= self._cx_rango[0] and cx0 + anillo >= self._cx_rango[1])
+
+    def _radio_garantizado_km(self, lat: float, anillo: int) -> float:
+        # todo punto fuera de la ventana está al menos a esta distancia del punto consultado
+        lat_max = min(90.0, abs(lat) + (anillo + 1) * self.celda)
+        return anillo * self.celda * KM_POR_GRADO * max(0.0, math.cos(math.radians(lat_max)))
+
+    def _resultado(self, idx: np.ndarray, dist: np.ndarray) -> List[Dict[str, Any]]:
+        return [dict(self.sitios[i], lat=float(self.lat[i]), lon=float(self.lon[i]),
+                     distancia_km=round(float(d), 3)) for i, d in zip(idx.tolist(), dist.tolist())]
+
+    # ---------- API ----------
+    def cercanos(self, lat: float, lon: float, k: int = 10, excluir: str = "") -> List[Dict[str, Any]]:
+        """Los k sitios más cercanos al punto (anillos de celdas crecientes)."""
+        import numpy as np
+        if not len(self.sitios) or k <= 0:
+            return []
+        excluir = (excluir or "").strip().upper()
+        anillo = 1
+        while True:
+            todo = self._cubre_todo(lat, lon, anillo)
+            cand = np.arange(len(self.sitios)) if todo else self._candidatos(lat, lon, anillo)
+            if excluir in self._pos:
+                cand = cand[cand != self._pos[excluir]]
+            if todo or len(cand) >= k:
+                dist = haversine_km(lat, lon, self.lat[cand], self.lon[cand])
+                n = min(k, len(cand))
+                sel = np.argpartition(dist, n - 1)[:n] if n else np.empty(0, dtype=np.int64)
+                sel = sel[np.argsort(dist[sel], kind="stable")]
+                if todo or dist[sel[-1]] <= self._radio_garantizado_km(lat, anillo):
+                    return self._resultado(cand[sel], dist[sel])
+            anillo *= 2
+
+    def en_radio(self, lat: float, lon: float, km: float, excluir: str = "",
+                 limite: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Todos los sitios a <= km del punto, ordenados por distancia."""
+        import numpy as np
+        if not len(self.sitios) or km < 0:
+            return []
+        dlat = km / KM_POR_GRADO
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        alcance = max(dlat, km / (KM_POR_GRADO * max(cos_lat, 1e-6)))
+        anillo = math.ceil(alcance / self.celda)
+        if self._cubre_todo(lat, lon, anillo):
+            cand = np.arange(len(self.sitios))
+        else:
+            cand = self._candidatos(lat, lon, anillo)
+        excluir = (excluir or "").strip().upper()
+        if excluir in self._pos:
+            cand = cand[cand != self._pos[excluir]]
+        dist = haversine_km(lat, lon, self.lat[cand], self.lon[cand])
+        dentro = dist <= km
+        cand, dist = cand[dentro], dist[dentro]
+        orden = np.argsort(dist, kind="stable")
+        if limite:
+            orden = orden[:limite]
+        return self._resultado(cand[orden], dist[orden])
+
+
+# =========================
+#  Índice invertido (texto completo sobre atributos del sitio)
+# =========================
+# campo de consulta => columna normalizada de Bases POP / Directorio
+CAMPOS_TEXTO = {
+    "nombre": "NOMBRE", "comuna": "COMUNA", "region": "REGION", "tipo": "TIPO",
+    "tipo_fdt": "TIPO FDT", "tipo_lloo": "TIPO LLOO", "esa": "ESA", "soluc": "SOLUC. ESP",
+    "detalle": "DETALLE INFRA ((28-12-2021))", "tecnologias": "TECNOLOGIAS ACTUALES TOTALES",
+}
+# flag de tecnología => columna (valor no vacío / distinto de NO => el sitio la tiene)
+FLAGS_TEC = {
+    "3G1900": "3G1900.1", "3G900": "3G900", "LTE3500": "LTE3500 A/B/C", "NR3500": "NR3500",
+    "NR26000": "NR26000", "LTE2600": "LTE2600", "LTE1900": "LTE1900", "LTE700": "LTE700",
+}
+_VALORES_NO = {"", "NO", "0", "-", "N/A", "NA", "NAN", "NONE", "FALSE"}
+_TOKEN = re.compile(r"[A-Z0-9]+")
+_TERMINO = re.compile(r'(-?)(?:([a-zA-Z_]+):)?(?:"([^"]*)"|(\S+))')
+
+
+def tokens(texto: Any) -> List[str]:
+    return _TOKEN.findall(_normalizar(texto))
+
+
+def tiene_flag(valor: str) -> bool:
+    return _normalizar(valor) not in _VALORES_NO
+
+
+class InvertedIndex:
+    """
+    Posting lists (np.ndarray ordenados de ids de sitio) por token sin tildes:
+      "TOKEN"            => token en cualquier campo (+ el POP y los flags de tecnología)
+      "campo:TOKEN"      => token dentro de un campo (nombre, comuna, region, tipo, ...)
+      "tec:FLAG"         => el sitio tiene la tecnología (NR3500, LTE700, ...)
+    Las consultas combinan postings con intersect1d / union1d / setdiff1d, sin
+    recorrer DataFrames.
+    """
+    def __init__(self, sitios: List[Dict[str, str]]):
+        import numpy as np
+        import pandas as pd
+        self.sitios = sitios
+        tmp: Dict[str, List[np.ndarray]] = {}
+
+        def agregar(valores: List[str], campo: Optional[str], es_flag: bool = False):
+            # se tokeniza cada valor DISTINTO una vez; sus sitios salen de un argsort de los códigos
+            codes, uniques = pd.factorize(pd.Series(valores, dtype="object"))
+            orden = np.argsort(codes, kind="stable").astype(np.int32)
+            limites = np.searchsorted(codes[orden], np.arange(len(uniques) + 1))
+            for j, valor in enumerate(uniques):
+                ids = orden[limites[j]:limites[j + 1]]
+                if es_flag:
+                    if tiene_flag(valor):
+                        tmp.setdefault(campo, []).append(ids)
+                        tmp.setdefault(f"tec:{campo}", []).append(ids)
+                    continue
+                for t in set(tokens(valor)):
+                    tmp.setdefault(t, []).append(ids)
+                    if campo:
+                        tmp.setdefault(f"{campo}:{t}", []).append(ids)
+
+        agregar([s["pop"] for s in sitios], None)
+        for campo in CAMPOS_TEXTO:
+            agregar([s[campo] for s in sitios], campo)
+        for flag in FLAGS_TEC:
+            agregar([s[flag] for s in sitios], flag, es_flag=True)
+        # np.unique ordena y quita repetidos (un token puede venir de varios campos)
+        self._postings: Dict[str, np.ndarray] = {
+            k: (v[0] if len(v) == 1 else np.unique(np.concatenate(v))) for k, v in tmp.items()
+        }
+        self._vocab = sorted(self._postings)
+        self._todos = np.arange(len(sitios), dtype=np.int32)
+
+    @classmethod
+    def desde_hojas(cls, *dfs: Optional[pd.DataFrame]) -> "InvertedIndex":
+        campos = dict(CAMPOS_TEXTO, **FLAGS_TEC)
+        return cls(sitios_desde_hojas(*dfs, campos=campos))
+
+    def __len__(self) -> int:
+        return len(self.sitios)
+
+    # ---------- postings ----------
+    def _posting(self, clave: str) -> np.ndarray:
+        """Posting exacto, o unión de los que empiezan con el prefijo si termina en '*'."""
+        if not clave.endswith("*"):
+            return self._postings.get(clave, self._todos[:0])
+        pref = clave[:-1]
+        if not pref or pref.endswith(":"):
+            return self._todos[:0]
+        import numpy as np
+        i = bisect_left(self._vocab, pref)
+        partes = []
+        # tokens en MAYÚSCULAS y campos en minúsculas: "MAI*" nunca toca claves "campo:..."
+        while i < len(self._vocab) and self._vocab[i].startswith(pref):
+            partes.append(self._postings[self._vocab[i]])
+            i += 1
+        return np.unique(np.concatenate(partes)) if partes else self._todos[:0]
+
+    @staticmethod
+    def _interseccion(listas: List[np.ndarray]) -> np.ndarray:
+        import numpy as np
+        listas = sorted(listas, key=len)  # la más corta primero: intersecciones baratas
+        out = listas[0]
+        for p in listas[1:]:
+            if not len(out):
+                break
+            out = np.intersect1d(out, p, assume_unique=True)
+        return out
+
+    def _termino(self, campo: Optional[str], valor: str) -> Optional[List[np.ndarray]]:
+        """Postings (AND) de un término; None si el campo no existe."""
+        prefijo = valor.endswith("*")
+        toks = tokens(valor)
+        if not toks:
+            return []
+        if prefijo:
+            toks[-1] += "*"
+        if campo:
+            campo = _normalizar(campo).lower()
+            if campo == "tec":
+                return [self._posting(f"tec:{t}") for t in toks]
+            if campo not in CAMPOS_TEXTO:
+                return None
+            return [self._posting(f"{campo}:{t}") for t in toks]
+        return [self._posting(t) for t in toks]
+
+    # ---------- API ----------
+    def buscar(self, consulta: str = "", filtros: Optional[Dict[str, str]] = None,
+               tec: Iterable[str] = ()) -> np.ndarray:
+        """
+        ids de los sitios que cumplen `consulta`, los `filtros` ({campo: valor}) y
+        tienen TODAS las tecnologías de `tec` (filtros y tec se aplican sobre el
+        resultado completo, no sobre una cláusula OR).
+        Sintaxis: términos separados por espacio = AND; "OR" entre grupos = OR
+        (AND liga más fuerte); campo:valor o campo:"dos palabras"; -termino excluye;
+        prefijo* para coincidencias por prefijo. Sin términos => todos los sitios.
+        Lanza ValueError si se usa un campo desconocido.
+        """
+        import numpy as np
+        grupos: List[np.ndarray] = []
+        for clausula in re.split(r"\s+(?:OR|or|\|)\s+", (consulta or "").strip()):
+            incluir: List[np.ndarray] = []
+            excluir: List[np.ndarray] = []
+            for m in _TERMINO.finditer(clausula):
+                neg, campo, entre_comillas, suelto = m.groups()
+                postings = self._termino(campo, entre_comillas if entre_comillas is not None else suelto)
+                if postings is None:
+                    raise ValueError(f"Campo desconocido: {campo}")
+                if neg and postings:
+                    excluir.append(self._interseccion(postings))
+                else:
+                    incluir.extend(postings)
+            ids = self._interseccion(incluir) if incluir else self._todos
+            for p in excluir:
+                ids = np.setdiff1d(ids, p, assume_unique=True)
+            grupos.append(ids)
+        ids = grupos[0]
+        for g in grupos[1:]:
+            ids = np.union1d(ids, g)
+
+        for campo, valor in (filtros or {}).items():
+            if not valor:
+                continue
+            # valores separados por coma dentro de un filtro => OR
+            opciones = []
+            for v in str(valor).split(","):
+                postings = self._termino(campo, v.strip())
+                if postings is None:
+                    raise ValueError(f"Campo desconocido: {campo}")
+                if postings:
+                    opciones.append(self._interseccion(postings))
+            if opciones:
+                permitido = opciones[0]
+                for o in opciones[1:]:
+                    permitido = np.union1d(permitido, o)
+                ids = np.intersect1d(ids, permitido, assume_unique=True)
+
+        for flag in tec:
+            postings = self._termino("tec", str(flag).strip())
+            if postings:
+                ids = np.intersect1d(ids, self._interseccion(postings), assume_unique=True)
+        return ids
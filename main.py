@@ -1,23 +1,26 @@
+import arranque
 from fastapi import FastAPI, Request, UploadFile, File, Form, Depends, Response
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from conector_sheets import leer_hoja, escribir_hoja_stream
-import pandas as pd
 import time
 import io
-from typing import Dict, List
-from email.mime.text import MIMEText
-from email.utils import formatdate
+from typing import TYPE_CHECKING, Dict, List
 from fastapi import HTTPException, status
 import uuid
+import json
+import hashlib
+import hmac
+import threading
+from contextlib import nullcontext
+from email.utils import formatdate
 from typing import Any
+from cachetools import TTLCache
+from starlette.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, PatternFill, Alignment
-import unicodedata
-from openpyxl import load_workbook
-from conector_sheets import leer_filas_por_pop
+from exportador_excel import ExcelStreamExporter, iter_file, iter_zip, file_size, XLSX_MEDIA_TYPE, ZIP_MEDIA_TYPE
+from conector_sheets import leer_filas_por_pop, leer_filas_por_pops, escribir_hoja_stream_por_pop, eliminar_indice_pop
 from io import BytesIO
 import re
 import asyncio
@@ -25,12 +28,32 @@ from auth import current_user
 import os
 from fastapi.staticfiles import StaticFiles
 from auth import router as auth_router
+import usuarios
+import ejecutor_hash
+from concurrencia import Coalescedor, LimiteConcurrencia, Ocupado
 from fastapi.responses import FileResponse
-from starlette.middleware.sessions import SessionMiddleware
+from middleware import AppMiddleware
+from respuestas import JSONRapida, dumps, a_columnas, a_filas
+from tiempos import span
+import metricas
+import perfilado
+import registro
+import normalizacion
+from perfilado import perfilable
+from base64 import b64decode
+import binascii
+from indices import IndiceVersionado, PrefixIndex, GeoIndex, InvertedIndex, FLAGS_TEC, tiene_flag
+
+if TYPE_CHECKING:
+    import pandas as pd   # pandas / openpyxl se importan al primer uso (ver arranque.py)
 
+arranque.marcar("imports")
 
 
 
+
+log = registro.obtener("main")
+
 SHEET_ID = "18e8Bfx5U1XLar7DOQ7PSVO5nQzluqKBHaxSOfRcreRI"
 templates = Jinja2Templates(directory="templates")
 
@@ -38,16 +61,6 @@ templates = Jinja2Templates(directory="templates")
 # ---- crea la app primero
 app = FastAPI()
 
-# --- Session middleware: DEBE ir apenas se crea app ---
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=os.getenv("SECRET_KEY", "dev-secret-change-me"),
-    session_cookie="bi_session",
-    https_only=True,   # True en Render
-    same_site="lax",
-    max_age=1800,       # 30 min
-)
-
 # (opcional) sirve favicon para que no pase por middlewares
 
 @app.get("/favicon.ico")
@@ -62,41 +75,18 @@ SESSION_TTL_SECONDS = 1800  # igual que max_age
 
 from urllib.parse import quote
 
-@app.middleware("http")
-async def enforce_session_ttl(request: Request, call_next):
-    path = request.url.path
-
-    # Rutas que NO requieren sesión
-    if (
-        path.startswith("/static")
-        or path.startswith("/auth")
-        or path in ("/", "/favicon.ico")
-    ):
-        return await call_next(request)
-
-    # ⚠️ Importante: NO accedemos a request.session aquí.
-    # Revisamos el scope directamente para evitar la AssertionError.
-    if "session" not in request.scope:
-        return await call_next(request)
-
-    email = request.session.get("user_email")
-    login_ts = request.session.get("login_ts")
-
-    if email and login_ts:
-        try:
-            if time.time() - float(login_ts) > SESSION_TTL_SECONDS:
-                request.session.clear()
-                nxt = quote(str(request.url), safe="")
-                return RedirectResponse(f"/auth/login?next={nxt}", status_code=302)
-            else:
-                # sesión deslizante
-                request.session["login_ts"] = time.time()
-        except Exception:
-            request.session.clear()
-            nxt = quote(str(request.url), safe="")
-            return RedirectResponse(f"/auth/login?next={nxt}", status_code=302)
-
-    return await call_next(request)
+# --- Sesión + TTL deslizante + log en un solo middleware ASGI puro ---
+app.add_middleware(
+    AppMiddleware,
+    secret_key=os.getenv("SECRET_KEY", "dev-secret-change-me"),
+    session_cookie="bi_session",
+    https_only=True,   # True en Render
+    same_site="lax",
+    max_age=SESSION_TTL_SECONDS,       # 30 min
+    ttl_seconds=SESSION_TTL_SECONDS,
+    refresh_fraction=float(os.getenv("SESSION_REFRESH_FRACTION", "0.25")),  # re-firma la cookie cada ~7.5 min de uso
+    autorizar_perfil=lambda scope: _admin_perfil(scope),  # ?perfil=1 solo para usuarios de /carga (más abajo)
+)
 
 
 # ---- static
@@ -106,6 +96,26 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(auth_router)
 
 
+@app.on_event("startup")
+def _arranque():
+    # módulos pesados y cliente de Sheets en segundo plano: el proceso ya atiende requests
+    from conector_sheets import client
+    arranque.calentar(
+        [("sheets_cliente", client.calentar), ("hashers", usuarios.hashers),
+         ("tabla_tildes", normalizacion.tabla)],
+        modulos=["pandas", "openpyxl", "gspread", "googleapiclient.discovery", "gspread_dataframe"],
+    )
+    # cache de usuarios caliente (y refrescada en segundo plano) antes del primer login
+    usuarios.start_background_refresh()
+    arranque.marcar("startup")
+
+
+@app.on_event("shutdown")
+def _apagado():
+    # damos unos segundos al outbox para despachar lo pendiente
+    outbox.cerrar(timeout=5)
+
+
 
 # =========================
 #  Autenticación (Basic) - Multiusuario
@@ -129,17 +139,16 @@ def _parse_user_list(raw: str):
         users[u.strip()] = p.strip()
     return users
 
+def _usuarios_carga() -> Dict[str, str]:
+    return _parse_user_list(UPLOAD_USERS) if UPLOAD_USERS else {ADMIN_USER: ADMIN_PASS}
+
 def require_auth(credentials: HTTPBasicCredentials = Depends(security)) -> str:
     """
     Devuelve el username autenticado (lo usamos para el correo).
     """
-    if UPLOAD_USERS:
-        users = _parse_user_list(UPLOAD_USERS)
-        if credentials.username in users and credentials.password == users[credentials.username]:
-            return credentials.username
-    else:
-        if (credentials.username == ADMIN_USER) and (credentials.password == ADMIN_PASS):
-            return credentials.username
+    users = _usuarios_carga()
+    if credentials.username in users and credentials.password == users[credentials.username]:
+        return credentials.username
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -147,14 +156,62 @@ def require_auth(credentials: HTTPBasicCredentials = Depends(security)) -> str:
         headers={"WWW-Authenticate": "Basic"},
     )
 
+def _usuario_basic(valor: bytes) -> str | None:
+    """Usuario de /carga de un header `Authorization: Basic ...` válido; None si no lo es."""
+    if valor[:6].lower() != b"basic ":
+        return None
+    try:
+        u, _, p = b64decode(valor[6:]).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    users = _usuarios_carga()
+    return u if u in users and p == users[u] else None
+
+def _admin_perfil(scope) -> str | None:
+    """Usuario de /carga que pide perfilar el request: por Basic (curl -u) o por su sesión."""
+    for k, v in scope.get("headers", ()):
+        if k == b"authorization" and v[:6].lower() == b"basic ":
+            return _usuario_basic(v)
+    email = (scope.get("session") or {}).get("user_email")
+    return email if email in _usuarios_carga() else None
+
 # =========================
 #  Caché (mejor rendimiento)
 # =========================
 CACHE_TIMEOUT = 86400  # 24 horas en segundos
-data_cache: Dict[str, pd.DataFrame] = {}
+data_cache: Dict[str, "pd.DataFrame"] = {}
 last_update: Dict[str, float] = {}
 
-def get_data(sheet_name: str) -> pd.DataFrame:
+# Versión de datos por hoja: sube al recargar la cache y tras cada carga (/carga).
+# Las caches de resultados / Excel se indexan por estas versiones.
+_BOOT_TS = time.time()
+data_version: Dict[str, int] = {}
+version_ts: Dict[str, float] = {}
+cache_stats: Dict[str, tuple] = {}   # hoja => (filas, bytes en memoria)
+
+def _build_id() -> str:
+    """Hash del código y las plantillas desplegadas: entra en cada ETag para que un deploy
+    nuevo no responda 304 con el HTML/JS (o el formato del JSON/Excel) de la versión anterior."""
+    h = hashlib.blake2b(digest_size=6)
+    base = os.path.dirname(os.path.abspath(__file__))
+    for carpeta, ext in ((base, ".py"), (os.path.join(base, "templates"), ""), (os.path.join(base, "static"), "")):
+        if not os.path.isdir(carpeta):
+            continue
+        for nombre in sorted(os.listdir(carpeta)):
+            ruta = os.path.join(carpeta, nombre)
+            if nombre.endswith(ext) and os.path.isfile(ruta):
+                h.update(nombre.encode())
+                with open(ruta, "rb") as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+_BUILD_ID = os.getenv("BUILD_ID") or _build_id()
+
+def _bump_version(sheet_name: str):
+    data_version[sheet_name] = data_version.get(sheet_name, 0) + 1
+    version_ts[sheet_name] = time.time()
+
+def get_data(sheet_name: str) -> "pd.DataFrame":
     """Devuelve DF cacheado si está fresco, si no, recarga desde Google Sheets."""
     now = time.time()
     if (
@@ -162,10 +219,21 @@ def get_data(sheet_name: str) -> pd.DataFrame:
         or sheet_name not in last_update
         or (now - last_update[sheet_name]) > CACHE_TIMEOUT
     ):
-        print(f"♻️ Recargando hoja: {sheet_name}")
-        df = leer_hoja(SHEET_ID, sheet_name)
+        metricas.CACHE_FALLOS.inc(hoja=sheet_name)
+        t0 = time.perf_counter()
+        with span("sheets_lectura"):
+            df = leer_hoja(SHEET_ID, sheet_name)
+        metricas.CACHE_RECARGA.observe(time.perf_counter() - t0, hoja=sheet_name)
+        # filas / bytes por hoja (se calculan una vez por recarga, no al exponer)
+        cache_stats[sheet_name] = (len(df), int(df.memory_usage(deep=True).sum()))
+        log.info("hoja recargada", extra={"datos": {
+            "hoja": sheet_name, "filas": cache_stats[sheet_name][0],
+            "ms": round((time.perf_counter() - t0) * 1000, 1)}})
         data_cache[sheet_name] = df
         last_update[sheet_name] = now
+        _bump_version(sheet_name)
+    else:
+        metricas.CACHE_ACIERTOS.inc(hoja=sheet_name)
     return data_cache[sheet_name]
 
 def invalidate_cache(sheets: List[str]):
@@ -175,6 +243,7 @@ def invalidate_cache(sheets: List[str]):
             del data_cache[s]
         if s in last_update:
             del last_update[s]
+        _bump_version(s)
 
 # =========================
 #  Utilidades
@@ -209,9 +278,6 @@ def _norm_cols_upper(cols):
 def _norm_cols(cols):
     return [str(c).strip() for c in cols]
 
-def _strip_accents(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-
 # ==== Helpers de orden ====
 def _natural_key(s: str):
     """Clave de orden 'natural' para IDs alfanuméricos (A1, A2, A10...)."""
@@ -222,24 +288,24 @@ def _find_key_ci(rows: list[dict], target: str) -> str | None:
     """Devuelve el nombre real de la clave 'target' ignorando tildes y mayúsculas, o None si no existe."""
     if not rows:
         return None
-    tgt = _strip_accents(target).upper().strip()
+    tgt = normalizacion.clave(target)
     for k in rows[0].keys():
-        if _strip_accents(str(k)).upper().strip() == tgt:
+        if normalizacion.clave(k) == tgt:
             return k
     return None
 
 # Modifica en filtrar_por_pop:
-def filtrar_por_pop(df: pd.DataFrame, codigo: str, excluir=None):
-    df = df.copy()
-    # Normaliza columnas: mayúsculas + sin tildes
-    df.columns = [_strip_accents(str(c).upper().strip()) for c in df.columns]
-    col_pop = next((c for c in df.columns if "POP" in c), None)
-    if not col_pop:
+def filtrar_por_pop(df: "pd.DataFrame", codigo: str, excluir=None):
+    # Normaliza columnas: mayúsculas + sin tildes (solo en las filas que calzan: el DF cacheado no se copia)
+    cols = [normalizacion.clave(c) for c in df.columns]
+    pos = next((i for i, c in enumerate(cols) if "POP" in c), None)
+    if pos is None:
         return []
-    mask = df[col_pop].astype(str).str.upper().str.strip() == _strip_accents(str(codigo).upper().strip())
-    df_filtrado = df.loc[mask, df.columns]
+    mask = normalizacion.columna(df, df.columns[pos]) == normalizacion.clave(codigo)
+    df_filtrado = df.loc[mask]
+    df_filtrado.columns = cols
     if excluir:
-        excluir_upper = [_strip_accents(str(c).upper()) for c in excluir]
+        excluir_upper = [normalizacion.clave(c) for c in excluir]
         df_filtrado = df_filtrado[[c for c in df_filtrado.columns if c not in excluir_upper]]
     return (
         df_filtrado.replace({r"\n": " "}, regex=True)
@@ -252,55 +318,8 @@ def filtrar_por_pop(df: pd.DataFrame, codigo: str, excluir=None):
 # =========================
 #  Notificaciones por correo
 # =========================
-SMTP_HOST = os.getenv("SMTP_HOST", "")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER", "")
-SMTP_PASS = os.getenv("SMTP_PASS", "")
-FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER or "no-reply@example.com")
-NOTIFY_EMAILS = [e.strip() for e in os.getenv("NOTIFY_EMAILS", "").split(",") if e.strip()]
-
-
-def send_mail(subject: str, html_body: str, to_addrs=None):
-    """Envía un correo HTML. Soporta SMTP SSL (465) y STARTTLS (587)."""
-    if not SMTP_HOST or not (NOTIFY_EMAILS or to_addrs):
-        print("ℹ️ Notificación no enviada: SMTP/DESTinatarios no configurados.")
-        return
-
-    import smtplib, ssl
-
-    recipients = [e.strip() for e in (to_addrs or NOTIFY_EMAILS) if e.strip()]
-    if not recipients:
-        print("ℹ️ Notificación no enviada: lista de destinatarios vacía.")
-        return
-
-    msg = MIMEText(html_body, "html", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = FROM_EMAIL
-    msg["To"] = ", ".join(recipients)
-    msg["Date"] = formatdate(localtime=True)
-
-    try:
-        port = int(SMTP_PORT or "587")
-        if port == 465:
-            # SSL directo
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(SMTP_HOST, port, timeout=20, context=context) as s:
-                if SMTP_USER:
-                    s.login(SMTP_USER, SMTP_PASS)
-                s.sendmail(FROM_EMAIL, recipients, msg.as_string())
-        else:
-            # STARTTLS (p. ej. 587)
-            with smtplib.SMTP(SMTP_HOST, port, timeout=20) as s:
-                s.ehlo()
-                s.starttls(context=ssl.create_default_context())
-                s.ehlo()
-                if SMTP_USER:
-                    s.login(SMTP_USER, SMTP_PASS)
-                s.sendmail(FROM_EMAIL, recipients, msg.as_string())
-
-        print(f"✉️  Mail enviado a: {recipients}")
-    except Exception as e:
-        print("❌ Error enviando correo:", repr(e))
+# El envío real lo hace el outbox de correo.py en segundo plano (ningún request espera a SMTP).
+from correo import send_mail, outbox, NOTIFY_EMAILS
 
 
 
@@ -316,7 +335,7 @@ def analizar_pop_df(df) -> dict:
         return {"exists": False, "vacios_count": 0, "vacios_rows": [], "dups_count": 0, "dups_values": []}
 
     # hallar columna POP con normalización (mayúsculas + sin tildes)
-    cols_norm = {_strip_accents(str(c).upper().strip()): c for c in df.columns}
+    cols_norm = normalizacion.columnas(df)
     if "POP" not in cols_norm:
         return {"exists": False, "vacios_count": 0, "vacios_rows": [], "dups_count": 0, "dups_values": []}
 
@@ -328,7 +347,7 @@ def analizar_pop_df(df) -> dict:
     vacios_rows = list(df.index[vacios_mask].tolist())
 
     # duplicados (normalizando valor: sin tildes + mayúsculas + trim)
-    norm = series.map(lambda s: _strip_accents(s)).str.upper().str.strip()
+    norm = normalizacion.serie(series)
     dups_mask = norm.duplicated(keep=False) & (~vacios_mask)
     dups_values = sorted(norm[dups_mask].unique().tolist())
 
@@ -342,7 +361,7 @@ def analizar_pop_df(df) -> dict:
 
 
 # Intentaremos usar escribir_hoja del conector si existe
-def escribir_hoja_safe(sheet_id: str, sheet_name: str, df: pd.DataFrame):
+def escribir_hoja_safe(sheet_id: str, sheet_name: str, df: "pd.DataFrame"):
     """Escribe un DataFrame en una pestaña de Google Sheets usando conector_sheets.escribir_hoja."""
     try:
         from conector_sheets import escribir_hoja
@@ -352,26 +371,10 @@ def escribir_hoja_safe(sheet_id: str, sheet_name: str, df: pd.DataFrame):
     escribir_hoja(sheet_id, sheet_name, df.fillna(""))
 
 def backup_sheet(sheet_name: str) -> str:
-    print(f"(debug) backup desactivado temporalmente para {sheet_name}")
+    log.debug("backup desactivado temporalmente", extra={"datos": {"hoja": sheet_name}})
     return ""
 
 
-# =========================
-#  Middleware
-# =========================
-@app.middleware("http")
-async def log_and_block(request: Request, call_next):
-    print(f"→ {request.method} {request.url.path} {request.url.query}")
-    if request.method in ("HEAD", "OPTIONS"):
-        return JSONResponse(content={"status": "ok"}, status_code=200)
-    try:
-        resp = await call_next(request)
-        print(f"← {resp.status_code} {request.url.path}")
-        return resp
-    except Exception as e:
-        print(f"✖ error en {request.url.path}: {e}")
-        raise
-
 # =========================
 #  Ping
 # =========================
@@ -379,13 +382,280 @@ async def log_and_block(request: Request, call_next):
 def root():
     return {"message": "Buscador POP activo ✅"}
 
+# ---- métricas (Prometheus) ----
+metricas.Medidor("cache_hojas_filas", "Filas en cache por hoja",
+                 lambda: {(h,): st[0] for h, st in cache_stats.items() if h in data_cache}, ("hoja",))
+metricas.Medidor("cache_hojas_bytes", "Bytes en memoria por hoja cacheada",
+                 lambda: {(h,): st[1] for h, st in cache_stats.items() if h in data_cache}, ("hoja",))
+metricas.Medidor("cache_resultados_bytes", "Bytes en la cache de resultados / Excel",
+                 lambda: {("resultados",): result_cache.currsize, ("xlsx",): xlsx_cache.currsize}, ("cache",))
+metricas.Medidor("correo_outbox", "Estado del outbox de correo",
+                 lambda: {(k,): v for k, v in outbox.estado().items()}, ("campo",))
+metricas.Medidor("hash_pool", "Pool de hashing (bcrypt)",
+                 lambda: {(k,): v for k, v in ejecutor_hash.estadisticas().items()}, ("campo",))
+metricas.Medidor("sheets_admision", "Cupos de Sheets y coalescencia de resultados por POP",
+                 lambda: {(k,): v for k, v in _estado_sheets().items()}, ("campo",))
+metricas.Medidor("log_cola", "Cola de logs (registro.py): en cola / descartados",
+                 lambda: dict(zip([("en_cola",), ("descartados",)], registro.estado_cola())), ("campo",))
+
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+@app.get("/metricas")
+def metricas_prometheus(request: Request):
+    """
+    Formato texto de Prometheus. Exige `Authorization: Bearer <METRICAS_TOKEN>` o
+    credenciales Basic de /carga; sin METRICAS_TOKEN solo sirve Basic (nunca es público).
+    """
+    auth = request.headers.get("authorization", "")
+    por_token = bool(METRICAS_TOKEN) and hmac.compare_digest(auth.encode(), f"Bearer {METRICAS_TOKEN}".encode())
+    if not por_token and not _usuario_basic(auth.encode("latin-1", "replace")):
+        return Response(status_code=401, headers={"WWW-Authenticate": "Basic"})
+    return Response(content=metricas.exponer(), media_type=metricas.CONTENT_TYPE)
+
+@app.get("/estado")
+def estado(user: str = Depends(require_auth)):
+    """Estado interno liviano (colas y pools) para monitoreo. Solo usuarios de /carga."""
+    return {
+        "correo": outbox.estado(),
+        "hash": ejecutor_hash.estadisticas(),
+        "sheets": _estado_sheets(),
+        "arranque": arranque.reporte(),
+    }
+
+# ---- perfiles bajo demanda (?perfil=1 / X-Perfil, ver perfilado.py) ----
+@app.get("/perfiles")
+def perfiles(user: str = Depends(require_auth)):
+    return {"perfiles": perfilado.listar()}
+
+@app.get("/perfiles/{nombre}")
+def perfil_descarga(nombre: str, formato: str = "pstats", orden: str = "cumulative",
+                    user: str = Depends(require_auth)):
+    """El .pstats tal cual (snakeviz / flameprof) o `formato=txt` con el top por `orden`."""
+    if formato == "txt":
+        try:
+            texto = perfilado.resumen(nombre, orden)
+        except KeyError:
+            return JSONResponse({"error": f"orden inválido: {orden}"}, status_code=400)
+        if texto is None:
+            return JSONResponse({"error": "Perfil no encontrado"}, status_code=404)
+        return Response(content=texto, media_type="text/plain; charset=utf-8")
+    p = perfilado.ruta(nombre)
+    if p is None:
+        return JSONResponse({"error": "Perfil no encontrado"}, status_code=404)
+    return FileResponse(p, media_type="application/octet-stream", filename=nombre)
+
+# =========================
+#  Buscar (existente)
+# =========================
+# =========================
+#  Resultados por POP (compartido por /buscar y /exportar_excel)
+# =========================
+COLUMNAS_BASES = [
+    "POP","Nombre","Latitud","Longitud","Comuna","Región",
+    "Tipo FDT","Tipo LLOO","ESA","Tipo","Soluc. Esp","Altura Solucion",
+    "Detalle Infra ((28-12-2021))","3G1900.1","3G900","LTE3500 A/B/C",
+    "NR3500","NR26000","LTE2600","LTE1900","LTE700",
+    "Tecnologías Actuales Totales","TAC LTE","LAC 3G"
+]
+COLUMNAS_DIRECTORIO = [
+    "POP", "Nombre", "Latitud", "Longitud", "Comuna", "Región",
+    "Tipo FDT", "Tipo LLOO", "Tipo", "Soluc. Esp", "Detalle Infra ((28-12-2021))",
+    "Tecnologías Totales Fin proyecto 2025", "CLASS 1", "CLASS 2", "CLASS 3"
+]
+# hojas en cache (get_data) y hojas grandes leídas por POP (leer_filas_por_pop)
+HOJAS_CACHE = ["Bases POP", "Directorio", "Proyecto_RANCO", "Base Hardware"]
+HOJAS_EXPORT = {
+    "export_5g": ("Export_5G", ["nRSectorCarrierRef"]),
+    "export_4g": ("Export_4G", ["latitud", "longitud", "Región"]),
+    "export_3g": ("Export_3G", ["latitude", "longitude", "Región"]),
+    "export_2g": ("Export_2G", ["Latitude", "Longitude"]),
+}
+SECCIONES = ["bases", "directorio", "proyecto_ranco", "hardware", *HOJAS_EXPORT]
+# página progresiva: estas van en el HTML, las demás se piden por sección (título, clave)
+SECCIONES_INMEDIATAS = ["bases", "directorio"]
+SECCIONES_DIFERIDAS = [
+    ("Proyecto RANCO", "proyecto_ranco"), ("Base Hardware", "hardware"),
+    ("Export 5G", "export_5g"), ("Export 4G", "export_4g"),
+    ("Export 3G", "export_3g"), ("Export 2G", "export_2g"),
+]
+PAGINA_FILAS = int(os.getenv("PAGINA_FILAS", "200"))
+
+def _norm_codigo(codigo: str) -> str:
+    return normalizacion.clave(codigo or "")
+
+def _filtrar_columnas(df: "pd.DataFrame", codigo: str, columnas: List[str]) -> List[dict]:
+    """Filas con POP == codigo (sin tildes/mayúsculas), solo con las columnas definidas que existan."""
+    df.columns = [c.strip() for c in df.columns]
+    cols_norm = normalizacion.columnas(df)
+    if "POP" not in cols_norm:
+        return []
+    mask = normalizacion.columna(df, cols_norm["POP"]) == _norm_codigo(codigo)
+    cols_ok = [c for c in columnas if c in df.columns]
+    return df.loc[mask, cols_ok].fillna("").to_dict(orient="records")
+
+def _ordenar_hardware(rows: List[dict]) -> List[dict]:
+    # --- ordenar Base Hardware por SITE ID (ascendente, natural; vacíos al final) ---
+    site_key = _find_key_ci(rows, "SITE ID")
+    if site_key:
+        rows.sort(key=lambda r: (r.get(site_key) in ("", None), _natural_key(r.get(site_key, ""))))
+    return rows
+
+def _componer_seccion(codigo: str, seccion: str) -> List[dict]:
+    """Una sección para un POP (solo lee la hoja que corresponde)."""
+    if seccion in ("bases", "directorio"):
+        hoja, columnas = (("Bases POP", COLUMNAS_BASES) if seccion == "bases"
+                          else ("Directorio", COLUMNAS_DIRECTORIO))
+        df = get_data(hoja)
+        with span("filtrar"):
+            return _filtrar_columnas(df, codigo, columnas)
+    if seccion in ("proyecto_ranco", "hardware"):
+        df = get_data("Proyecto_RANCO" if seccion == "proyecto_ranco" else "Base Hardware")
+        with span("filtrar"):
+            rows = filtrar_por_pop(df, codigo)
+        if seccion == "hardware":
+            with span("ordenar_hw"):
+                rows = _ordenar_hardware(rows)
+        return rows
+    hoja, excluir = HOJAS_EXPORT[seccion]
+    with span("leer_export"):
+        df = leer_filas_por_pop(SHEET_ID, hoja, codigo)
+    with span("filtrar"):
+        return filtrar_por_pop(df, codigo, excluir=excluir)
+
+def _componer_resultados(codigo: str) -> Dict[str, List[dict]]:
+    """Las ocho secciones para un POP."""
+    return {s: _componer_seccion(codigo, s) for s in SECCIONES}
+
+# ---- cache LRU de resultados y de Excel generados, por (POP normalizado, versiones) ----
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", str(32 * 1024 * 1024)))
+XLSX_CACHE_BYTES = int(os.getenv("XLSX_CACHE_BYTES", str(64 * 1024 * 1024)))
+XLSX_CACHE_ITEM_MAX = int(os.getenv("XLSX_CACHE_ITEM_MAX", str(8 * 1024 * 1024)))
+# las hojas Export_* se leen en vivo: acotamos cuánto puede quedar viejo un resultado si se editan a mano
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "300"))
+
+# ---- admisión a Sheets: un mismo POP en curso se calcula una vez (los demás esperan ese
+# resultado) y los cálculos que van a Sheets tienen cupo global y por usuario; sin cupo
+# se responde 503 + Retry-After al tiro en vez de encolar y agotar la cuota de todos
+SHEETS_MAX_CONCURRENTES = int(os.getenv("SHEETS_MAX_CONCURRENTES", "12"))
+SHEETS_MAX_POR_USUARIO = int(os.getenv("SHEETS_MAX_POR_USUARIO", "6"))   # una página = hasta 6 secciones
+SHEETS_RETRY_AFTER = int(os.getenv("SHEETS_RETRY_AFTER", "2"))
+# quien espera un cálculo ya en curso ocupa un hilo del threadpool: se acota cuánto y cuántos
+SHEETS_ESPERA_MAX = float(os.getenv("SHEETS_ESPERA_MAX", "30"))
+SHEETS_MAX_ESPERANDO = int(os.getenv("SHEETS_MAX_ESPERANDO", "16"))   # por clave
+MSG_OCUPADO_SHEETS = "Hay muchas consultas en curso, reintenta en unos segundos."
+_limite_sheets = LimiteConcurrencia(SHEETS_MAX_CONCURRENTES, caps={"usuario": SHEETS_MAX_POR_USUARIO})
+_coalescedor = Coalescedor(no_compartir=(Ocupado,),   # el cupo agotado es del usuario del líder
+                           espera=SHEETS_ESPERA_MAX, max_esperando=SHEETS_MAX_ESPERANDO)
+
+@app.exception_handler(Ocupado)
+async def _sheets_ocupado(request: Request, exc: Ocupado):
+    return JSONRapida({"error": MSG_OCUPADO_SHEETS}, status_code=503,
+                      headers={"Retry-After": str(SHEETS_RETRY_AFTER)})
+
+def _estado_sheets() -> Dict[str, int]:
+    return {"en_curso": _limite_sheets.en_curso, "rechazos": _limite_sheets.rechazos,
+            "calculos": _coalescedor.ejecuciones, "coalescidas": _coalescedor.compartidas,
+            "esperas_rechazadas": _coalescedor.rechazos,
+            "en_vuelo": _coalescedor.en_vuelo}
+
+def _usuario_request(request: Request) -> str | None:
+    """Clave de cupo: email de la sesión o, sin sesión, la IP."""
+    return request.session.get("user_email") or (request.client.host if request.client else None)
+
+_cache_lock = threading.Lock()
+result_cache: TTLCache = TTLCache(maxsize=RESULT_CACHE_BYTES, ttl=RESULT_CACHE_TTL, getsizeof=lambda e: e["size"])
+xlsx_cache: TTLCache = TTLCache(maxsize=XLSX_CACHE_BYTES, ttl=RESULT_CACHE_TTL, getsizeof=len)
+
+def _versiones() -> tuple:
+    # recarga perezosa de las hojas cacheadas vencidas ANTES de armar la clave
+    for h in HOJAS_CACHE:
+        get_data(h)
+    return tuple(data_version.get(h, 0) for h in HOJAS_CACHE + [v[0] for v in HOJAS_EXPORT.values()])
+
+def _last_modified() -> str:
+    ts = max([_BOOT_TS, *version_ts.values()])
+    return formatdate(ts, usegmt=True)
+
+def _entrada_cache(key: tuple, construir, usuario: str | None = None, cupo: bool = True) -> Dict[str, Any]:
+    """
+    {"data", "etag" (hash del contenido), "size"} desde result_cache o recién construido.
+    En un fallo, requests concurrentes con la misma clave comparten un solo `construir`
+    (Coalescedor) y solo ese toma cupo de Sheets (lanza Ocupado si no hay). cupo=False
+    para lo que sale de las hojas en memoria (get_data): no va a Sheets.
+    """
+    with _cache_lock:
+        entry = result_cache.get(key)
+    if entry is not None:
+        return entry
+
+    def construir_y_guardar() -> Dict[str, Any]:
+        with _cache_lock:   # otro líder pudo terminar justo antes
+            previa = result_cache.get(key)
+        if previa is not None:
+            return previa
+        with (_limite_sheets.cupo(usuario=usuario) if cupo else nullcontext()):
+            data = construir()
+        raw = dumps(data)
+        nueva = {"data": data, "etag": hashlib.blake2b(raw, digest_size=16).hexdigest(), "size": len(raw)}
+        with _cache_lock:
+            if nueva["size"] <= RESULT_CACHE_BYTES // 4:
+                result_cache[key] = nueva
+        return nueva
+
+    return _coalescedor.ejecutar(key, construir_y_guardar)
+
+def resultados_pop(codigo: str, usuario: str | None = None) -> Dict[str, Any]:
+    """
+    Resultados de las ocho secciones cacheados por (POP normalizado, versiones).
+    Devuelve {"data": {...}, "etag": hash del contenido, "size": bytes aprox.}.
+    """
+    return _entrada_cache((_norm_codigo(codigo), _versiones()), lambda: _componer_resultados(codigo), usuario)
+
+def resultados_secciones(codigo: str, secciones: List[str], usuario: str | None = None) -> Dict[str, Any]:
+    """
+    Solo las secciones pedidas (las hojas Export no se leen si no se piden). Si el
+    resultado completo del POP ya está en cache se usa ese; si no, cada sección se
+    cachea por separado con la misma clave de versiones.
+    """
+    if set(secciones) >= set(SECCIONES):
+        return resultados_pop(codigo, usuario)
+    norm, versiones = _norm_codigo(codigo), _versiones()
+    with _cache_lock:
+        completo = result_cache.get((norm, versiones))
+    if completo is not None:
+        return {"data": {s: completo["data"][s] for s in secciones},
+                "etag": completo["etag"] + "-" + ".".join(secciones)}
+    # solo las Export_* se leen de Sheets; el resto sale de get_data (ya recargado en _versiones)
+    partes = {s: _entrada_cache((norm, versiones, s), lambda s=s: _componer_seccion(codigo, s), usuario,
+                                cupo=s in HOJAS_EXPORT)
+              for s in secciones}
+    etag = hashlib.blake2b("".join(p["etag"] for p in partes.values()).encode(), digest_size=16).hexdigest()
+    return {"data": {s: p["data"] for s, p in partes.items()}, "etag": etag}
+
+def _etag_match(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match", "")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == wanted for t in inm.split(","))
+
+def _cache_headers(etag: str, debil: bool = True) -> Dict[str, str]:
+    """`etag` es el hash del contenido; se le suma el id de build (ver _build_id)."""
+    etag = f'"{etag}-{_BUILD_ID}"'
+    return {"ETag": "W/" + etag if debil else etag, "Last-Modified": _last_modified(),
+            "Cache-Control": "private, no-cache"}
+
 # =========================
 #  Buscar (existente)
 # =========================
 @app.get("/buscar", response_class=HTMLResponse)
+@perfilable
 def buscar_pop(
         request: Request,
         codigo: str = None,
+        completo: int = 0,   # 1 => todas las secciones renderizadas en el servidor (sin JS)
         user_email: str = Depends(current_user)  # ← NUEVO
 ):
     # ← NUEVO: si no hay sesión, redirige a login y vuelve al mismo URL tras loguear
@@ -410,107 +680,348 @@ def buscar_pop(
             }
         )
 
-    bases_result, directorio_result = [], []
-    proyecto_ranco_result = []
-    hardware_result, export_5g_result, export_4g_result, export_3g_result, export_2g_result = [], [], [], [], []
+    res = {k: [] for k in SECCIONES}
     error = None
+    headers: Dict[str, str] = {}
+    # progresivo: solo Bases POP / Directorio (en cache) van en el HTML; el resto lo pide
+    # la página a /api/buscar por sección y paginado
+    progresivo = not completo
 
+    status = 200
     try:
-        # Bases POP (solo columnas definidas)
-        df_bases = get_data("Bases POP")
-        df_bases.columns = [c.strip() for c in df_bases.columns]
-        columnas_bases = [
-            "POP","Nombre","Latitud","Longitud","Comuna","Región",
-            "Tipo FDT","Tipo LLOO","ESA","Tipo","Soluc. Esp","Altura Solucion",
-            "Detalle Infra ((28-12-2021))","3G1900.1","3G900","LTE3500 A/B/C",
-            "NR3500","NR26000","LTE2600","LTE1900","LTE700",
-            "Tecnologías Actuales Totales","TAC LTE","LAC 3G"
-        ]
-        # Mapa NORMALIZADO -> ORIGINAL
-        cols_norm_b = {_strip_accents(c.strip().upper()): c for c in df_bases.columns}
-        if "POP" in cols_norm_b:
-            pop_col_b = cols_norm_b["POP"]
-            mask_bases = df_bases[pop_col_b].astype(str).str.upper().str.strip() == _strip_accents(
-                codigo.upper().strip())
-            columnas_existentes_bases = [c for c in columnas_bases if c in df_bases.columns]
-            bases_result = df_bases.loc[mask_bases, columnas_existentes_bases].fillna("").to_dict(orient="records")
-
-        # Directorio
-        df_directorio = get_data("Directorio")
-        df_directorio.columns = [c.strip() for c in df_directorio.columns]
-
-        columnas_directorio = [
-            "POP", "Nombre", "Latitud", "Longitud", "Comuna", "Región",
-            "Tipo FDT", "Tipo LLOO", "Tipo", "Soluc. Esp", "Detalle Infra ((28-12-2021))",
-            "Tecnologías Totales Fin proyecto 2025", "CLASS 1", "CLASS 2", "CLASS 3"
-        ]
-
-        cols_norm_d = {_strip_accents(c.strip().upper()): c for c in df_directorio.columns}
-        if "POP" in cols_norm_d:
-            pop_col_d = cols_norm_d["POP"]
-            mask_dir = df_directorio[pop_col_d].astype(str).str.upper().str.strip() == _strip_accents(
-                codigo.upper().strip())
-            columnas_existentes_dir = [c for c in columnas_directorio if c in df_directorio.columns]
-            directorio_result = df_directorio.loc[mask_dir, columnas_existentes_dir].fillna("").to_dict(
-                orient="records")
-
-        # Proyecto_RANCO (nueva sección)
-        df_ranco = get_data("Proyecto_RANCO")
-        proyecto_ranco_result = filtrar_por_pop(df_ranco, codigo)
-
-        # Base Hardware
-        df_hardware = get_data("Base Hardware")
-        hardware_result = filtrar_por_pop(df_hardware, codigo)
-
-        # --- ordenar Base Hardware por SITE ID (ascendente, natural; vacíos al final) ---
-        site_key = _find_key_ci(hardware_result, "SITE ID")
-        if site_key:
-            hardware_result.sort(
-                key=lambda r: (r.get(site_key) in ("", None), _natural_key(r.get(site_key, "")))
-            )
-
-        # Export 5G
-        df_5g = leer_filas_por_pop(SHEET_ID, "Export_5G", codigo)
-        export_5g_result = filtrar_por_pop(df_5g, codigo, excluir=["nRSectorCarrierRef"])
-
-        # Export 4G
-        df_4g = leer_filas_por_pop(SHEET_ID, "Export_4G", codigo)
-        export_4g_result = filtrar_por_pop(df_4g, codigo, excluir=["latitud", "longitud", "Región"])
-
-        # Export 3G
-        df_3g = leer_filas_por_pop(SHEET_ID, "Export_3G", codigo)
-        export_3g_result = filtrar_por_pop(df_3g, codigo, excluir=["latitude", "longitude", "Región"])
-
-        # Export 2G
-        df_2g = leer_filas_por_pop(SHEET_ID, "Export_2G", codigo)
-        export_2g_result = filtrar_por_pop(df_2g, codigo, excluir=["Latitude", "Longitude"])
-
+        if progresivo:
+            entry = resultados_secciones(codigo, SECCIONES_INMEDIATAS, user_email)
+            res.update(entry["data"])
+        else:
+            entry = resultados_pop(codigo, user_email)
+            res = entry["data"]
+        headers = _cache_headers(entry["etag"])
+        if _etag_match(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    except Ocupado:
+        error, status = MSG_OCUPADO_SHEETS, 503
+        headers = {"Retry-After": str(SHEETS_RETRY_AFTER)}
     except Exception as e:
         error = str(e)
 
-    return templates.TemplateResponse(
-        "buscar.html",
-        {
-            "request": request,
-            "codigo": codigo,
-            "bases_result": bases_result,
-            "directorio_result": directorio_result,
-            "proyecto_ranco_result": proyecto_ranco_result,
-            "hardware_result": hardware_result,
-            "export_5g_result": export_5g_result,
-            "export_4g_result": export_4g_result,
-            "export_3g_result": export_3g_result,
-            "export_2g_result": export_2g_result,
-            "error": error,
-        }
-    )
+    with span("render"):
+        return templates.TemplateResponse(
+            "buscar.html",
+            {
+                "request": request,
+                "codigo": codigo,
+                "bases_result": res["bases"],
+                "directorio_result": res["directorio"],
+                "proyecto_ranco_result": res["proyecto_ranco"],
+                "hardware_result": res["hardware"],
+                "export_5g_result": res["export_5g"],
+                "export_4g_result": res["export_4g"],
+                "export_3g_result": res["export_3g"],
+                "export_2g_result": res["export_2g"],
+                "progresivo": progresivo,
+                "secciones_diferidas": SECCIONES_DIFERIDAS,
+                "pagina_filas": PAGINA_FILAS,
+                "error": error,
+            },
+            status_code=status,
+            headers=headers,
+        )
 
-# ========= Helpers Excel (comparativo + conversión a DF)” =========
+# =========================
+#  API JSON de búsqueda (sin plantilla)
+# =========================
+def _campos_por_seccion(campos: List[str]) -> Dict[str, List[str]]:
+    """
+    campos=POP,Nombre           => esos campos en todas las secciones ("*")
+    campos=hardware:POP,Site ID => solo para esa sección (el parámetro se puede repetir)
+    """
+    out: Dict[str, List[str]] = {}
+    for valor in campos:
+        seccion, sep, lista = valor.partition(":")
+        if not sep or seccion.strip().lower() not in SECCIONES:
+            seccion, lista = "*", valor
+        out.setdefault(seccion.strip().lower(), []).extend(c.strip() for c in lista.split(",") if c.strip())
+    return out
+
+@app.get("/api/buscar")
+@perfilable
+def api_buscar(request: Request, codigo: str = "", secciones: str = "", formato: str = "columnas",
+               offset: int = 0, limite: int = 0, user_email: str = Depends(current_user)):
+    """
+    Mismos resultados que /buscar en JSON.
+    secciones=bases,hardware (por defecto todas); campos=... (ver _campos_por_seccion);
+    formato=columnas ({"total", "columnas": {col: [valores]}}) | filas ({"total", "filas": [...]});
+    offset/limite: paginación por sección (limite=0 => todas las filas).
+    """
+    if not user_email:
+        return JSONRapida({"error": "No autenticado"}, status_code=401)
+    if not codigo.strip():
+        return JSONRapida({"error": "Falta parámetro codigo"}, status_code=400)
+    pedidas = [s.strip().lower() for s in secciones.split(",") if s.strip()] or list(SECCIONES)
+    desconocidas = [s for s in pedidas if s not in SECCIONES]
+    if desconocidas:
+        return JSONRapida({"error": f"Secciones desconocidas: {', '.join(desconocidas)}",
+                           "secciones_validas": list(SECCIONES)}, status_code=400)
+    campos = _campos_por_seccion(request.query_params.getlist("campos"))
+    armar = a_filas if formato == "filas" else a_columnas
+
+    entry = resultados_secciones(codigo, pedidas, user_email)
+    variante = hashlib.blake2b(str(request.query_params).encode(), digest_size=6).hexdigest()
+    headers = _cache_headers(f'{entry["etag"]}-{variante}')
+    if _etag_match(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    data = entry["data"]
+    return JSONRapida({
+        "codigo": _norm_codigo(codigo),
+        "secciones": {s: armar(data[s], campos.get(s) or campos.get("*"), max(0, offset), max(0, limite))
+                      for s in pedidas},
+    }, headers=headers)
 
-def _rows_to_df(rows: List[dict]) -> pd.DataFrame:
-    return pd.DataFrame(rows) if rows else pd.DataFrame()
+# =========================
+#  Búsqueda por lote (muchos POP de una vez)
+# =========================
+MAX_LOTE = int(os.getenv("MAX_LOTE", "500"))
+_SEP_CODIGOS = re.compile(r"[\s,;]+")
 
-def _comparativo_df(bases_rows: List[dict], dir_rows: List[dict],prefer_bases: List[str], prefer_dir: List[str]) -> pd.DataFrame:
+def _agrupar_por_pop(df: "pd.DataFrame", codigos: List[str], columnas: List[str] | None = None,
+                     excluir=None) -> Dict[str, List[dict]]:
+    """
+    Versión por lote de _filtrar_columnas (si se pasan `columnas`) o de filtrar_por_pop
+    (si no): un solo `isin` vectorizado sobre la columna POP y reparto de filas por POP.
+    `codigos` ya normalizados (_norm_codigo).
+    """
+    out: Dict[str, List[dict]] = {c: [] for c in codigos}
+    if df is None or df.empty:
+        return out
+    if columnas is not None:
+        df.columns = [c.strip() for c in df.columns]
+        cols_norm = normalizacion.columnas(df)
+        if "POP" not in cols_norm:
+            return out
+        vals = normalizacion.columna(df, cols_norm["POP"])
+        mask = vals.isin(codigos)
+        sub = df.loc[mask, [c for c in columnas if c in df.columns]].fillna("")
+    else:
+        norm_cols = [normalizacion.clave(c) for c in df.columns]
+        col_idx = next((i for i, c in enumerate(norm_cols) if "POP" in c), None)
+        if col_idx is None:
+            return out
+        vals = normalizacion.columna(df, df.columns[col_idx])
+        mask = vals.isin(codigos)
+        sub = df.loc[mask].copy()  # copia solo de las filas que calzan
+        sub.columns = norm_cols
+        if excluir:
+            excluir_upper = [normalizacion.clave(c) for c in excluir]
+            sub = sub[[c for c in sub.columns if c not in excluir_upper]]
+        sub = sub.replace({r"\n": " "}, regex=True).fillna("")
+    for pop, rec in zip(vals[mask].tolist(), sub.to_dict(orient="records")):
+        out[pop].append(rec)
+    return out
+
+def buscar_lote(codigos: List[str]) -> Dict[str, Dict[str, List[dict]]]:
+    """Las ocho secciones para varios POP: una pasada por hoja cacheada y un fetch por hoja Export."""
+    norm = list(dict.fromkeys(c for c in (_norm_codigo(x) for x in codigos) if c))
+    res: Dict[str, Dict[str, List[dict]]] = {c: {} for c in norm}
+    if not norm:
+        return res
+
+    def repartir(seccion: str, grupos: Dict[str, List[dict]]):
+        for c in norm:
+            res[c][seccion] = grupos.get(c, [])
+
+    repartir("bases", _agrupar_por_pop(get_data("Bases POP"), norm, columnas=COLUMNAS_BASES))
+    repartir("directorio", _agrupar_por_pop(get_data("Directorio"), norm, columnas=COLUMNAS_DIRECTORIO))
+    repartir("proyecto_ranco", _agrupar_por_pop(get_data("Proyecto_RANCO"), norm))
+    hardware = _agrupar_por_pop(get_data("Base Hardware"), norm)
+    repartir("hardware", {c: _ordenar_hardware(rows) for c, rows in hardware.items()})
+    for key, (hoja, excluir) in HOJAS_EXPORT.items():
+        repartir(key, _agrupar_por_pop(leer_filas_por_pops(SHEET_ID, hoja, norm), norm, excluir=excluir))
+    return res
+
+def _parse_codigos(texto: str) -> List[str]:
+    return [c for c in _SEP_CODIGOS.split(texto or "") if c]
+
+def _codigos_desde_archivo(nombre: str, data: bytes) -> List[str]:
+    """xlsx/csv: columna POP (o la primera); txt: cualquier separador."""
+    nombre = (nombre or "").lower()
+    if nombre.endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(filename=BytesIO(data), read_only=True, data_only=True)
+        rows = wb[wb.sheetnames[0]].iter_rows(values_only=True)
+    elif nombre.endswith(".csv"):
+        import csv
+        text = data.decode("utf-8-sig", errors="replace")
+        rows = csv.reader(io.StringIO(text), delimiter=";" if text.count(";") > text.count(",") else ",")
+    else:
+        return _parse_codigos(data.decode("utf-8-sig", errors="replace"))
+    rows = iter(rows)
+    header = ["" if v is None else str(v) for v in next(rows, [])]
+    cols_norm = _norm_cols_upper(header)
+    idx = cols_norm.index("POP") if "POP" in cols_norm else 0
+    out = [] if "POP" in cols_norm else header[:1]
+    for r in rows:
+        if r and idx < len(r) and r[idx] not in (None, ""):
+            out.append(str(r[idx]))
+    return out
+
+@perfilable
+def _respuesta_lote(codigos: List[str], usuario: str | None = None) -> JSONResponse:
+    if not codigos:
+        return JSONResponse({"error": "Falta lista de códigos POP"}, status_code=400)
+    if len(codigos) > MAX_LOTE:
+        return JSONResponse({"error": f"Máximo {MAX_LOTE} códigos por consulta"}, status_code=400)
+    with _limite_sheets.cupo(usuario=usuario):   # lee las cuatro hojas Export
+        res = buscar_lote(codigos)
+    encontrados = [c for c, secs in res.items() if any(secs.values())]
+    return JSONResponse({
+        "total": len(res),
+        "encontrados": encontrados,
+        "no_encontrados": [c for c in res if c not in set(encontrados)],
+        "resultados": res,
+    })
+
+@app.get("/api/buscar_lote")
+def buscar_lote_get(request: Request, user_email: str = Depends(current_user)):
+    """?codigos=A,B,C (o codigos repetido)."""
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    codigos = [c for v in request.query_params.getlist("codigos") for c in _parse_codigos(v)]
+    return _respuesta_lote(codigos, user_email)
+
+@app.post("/api/buscar_lote")
+async def buscar_lote_post(
+    codigos: str = Form(""),
+    archivo: UploadFile = File(None),   # .xlsx / .csv / .txt con códigos POP
+    user_email: str = Depends(current_user),
+):
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    lista = _parse_codigos(codigos)
+    if archivo is not None and archivo.filename:
+        lista += _codigos_desde_archivo(archivo.filename, await archivo.read())
+    return await run_in_threadpool(_respuesta_lote, lista, user_email)
+
+# =========================
+#  Autocompletado (POP / nombre de sitio)
+# =========================
+HOJAS_SUGERENCIAS = ["Bases POP", "Directorio"]
+_indice_sugerencias = IndiceVersionado(
+    lambda: PrefixIndex.desde_hojas(*(get_data(h) for h in HOJAS_SUGERENCIAS))
+)
+
+def _version_hojas(hojas: List[str]) -> tuple:
+    for h in hojas:
+        get_data(h)  # recarga perezosa => sube la versión si corresponde
+    return tuple(data_version.get(h, 0) for h in hojas)
+
+def sugerencias(q: str, limite: int = 10) -> List[Dict[str, str]]:
+    return _indice_sugerencias.obtener(_version_hojas(HOJAS_SUGERENCIAS)).buscar(q, limite)
+
+@app.get("/api/sugerencias")
+def api_sugerencias(q: str = "", limite: int = 10, user_email: str = Depends(current_user)):
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    return JSONResponse({"q": q, "sugerencias": sugerencias(q, max(1, min(limite, 50)))})
+
+# =========================
+#  Búsqueda geográfica (Latitud / Longitud)
+# =========================
+HOJAS_GEO = ["Bases POP", "Directorio"]
+MAX_CERCANOS = 200
+_indice_geo = IndiceVersionado(lambda: GeoIndex.desde_hojas(*(get_data(h) for h in HOJAS_GEO)))
+
+def indice_geo() -> GeoIndex:
+    return _indice_geo.obtener(_version_hojas(HOJAS_GEO))
+
+def _origen_geo(idx: GeoIndex, lat: str, lon: str, codigo: str):
+    """(lat, lon) desde los parámetros o desde las coordenadas del POP; error => JSONResponse."""
+    if codigo:
+        punto = idx.coordenadas(codigo)
+        if punto is None:
+            return JSONResponse({"error": f"POP {codigo} sin coordenadas válidas"}, status_code=404)
+        return punto
+    try:
+        punto = (float(str(lat).replace(",", ".")), float(str(lon).replace(",", ".")))
+    except ValueError:
+        return JSONResponse({"error": "Indica codigo o lat/lon numéricos"}, status_code=400)
+    if not (-90 <= punto[0] <= 90 and -180 <= punto[1] <= 180):
+        return JSONResponse({"error": "lat/lon fuera de rango"}, status_code=400)
+    return punto
+
+@app.get("/api/cercanos")
+def api_cercanos(lat: str = "", lon: str = "", codigo: str = "", k: int = 10,
+                 user_email: str = Depends(current_user)):
+    """Los k POP más cercanos a una coordenada o a otro POP (excluido del resultado)."""
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    idx = indice_geo()
+    punto = _origen_geo(idx, lat, lon, codigo)
+    if isinstance(punto, JSONResponse):
+        return punto
+    sitios = idx.cercanos(punto[0], punto[1], max(1, min(k, MAX_CERCANOS)), excluir=codigo)
+    return JSONResponse({"origen": {"lat": punto[0], "lon": punto[1], "codigo": codigo or None},
+                         "total": len(sitios), "sitios": sitios})
+
+@app.get("/api/radio")
+def api_radio(lat: str = "", lon: str = "", codigo: str = "", km: float = 5.0, limite: int = 1000,
+              user_email: str = Depends(current_user)):
+    """Todos los POP a <= km de una coordenada o de otro POP, ordenados por distancia."""
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    if km <= 0 or km > 2000:
+        return JSONResponse({"error": "km debe estar entre 0 y 2000"}, status_code=400)
+    idx = indice_geo()
+    punto = _origen_geo(idx, lat, lon, codigo)
+    if isinstance(punto, JSONResponse):
+        return punto
+    sitios = idx.en_radio(punto[0], punto[1], km, excluir=codigo, limite=max(1, limite))
+    return JSONResponse({"origen": {"lat": punto[0], "lon": punto[1], "codigo": codigo or None},
+                         "km": km, "total": len(sitios), "sitios": sitios})
+
+# =========================
+#  Búsqueda de texto (índice invertido sobre atributos del sitio)
+# =========================
+HOJAS_TEXTO = ["Bases POP", "Directorio"]
+MAX_TEXTO = 1000
+_indice_texto = IndiceVersionado(lambda: InvertedIndex.desde_hojas(*(get_data(h) for h in HOJAS_TEXTO)))
+
+def indice_texto() -> InvertedIndex:
+    return _indice_texto.obtener(_version_hojas(HOJAS_TEXTO))
+
+def _sitio_resumen(s: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "pop": s["pop"], "nombre": s["nombre"], "comuna": s["comuna"], "region": s["region"],
+        "tipo": s["tipo"], "tec": [f for f in FLAGS_TEC if tiene_flag(s[f])],
+    }
+
+@app.get("/api/busqueda_texto")
+def api_busqueda_texto(q: str = "", region: str = "", comuna: str = "", tipo: str = "", tec: str = "",
+                       offset: int = 0, limite: int = 100, user_email: str = Depends(current_user)):
+    """
+    q: términos (AND), "OR" entre grupos, campo:valor, -excluir, prefijo*.
+    region/comuna/tipo: filtros (coma => cualquiera de los valores); tec: flags (coma => todos).
+    Ej.: /api/busqueda_texto?q=detalle:monoposte&comuna=Maipú&tec=NR3500
+    """
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    if not any((q.strip(), region, comuna, tipo, tec)):
+        return JSONResponse({"error": "Falta consulta o filtro"}, status_code=400)
+    idx = indice_texto()
+    filtros = {"region": region, "comuna": comuna, "tipo": tipo}
+    flags = [t.strip() for t in tec.split(",") if t.strip()]
+    try:
+        ids = idx.buscar(q, filtros, tec=flags)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    offset, limite = max(0, offset), max(1, min(limite, MAX_TEXTO))
+    pagina = ids[offset:offset + limite].tolist()
+    return JSONResponse({"total": int(len(ids)), "offset": offset, "limite": limite,
+                         "sitios": [_sitio_resumen(idx.sitios[i]) for i in pagina]})
+
+# ========= Helpers Excel (comparativo + conversión a DF)” =========
+
+def _comparativo_df(bases_rows: List[dict], dir_rows: List[dict],prefer_bases: List[str], prefer_dir: List[str]) -> "pd.DataFrame":
     """
     Construye el comparativo respetando el orden:
       1) columnas en prefer_bases (si existen)
@@ -558,156 +1069,134 @@ def _comparativo_df(bases_rows: List[dict], dir_rows: List[dict],prefer_bases: L
         vals = [v for v in vals if v != ""]
         return " | ".join(vals)
 
+    import pandas as pd
     data = [{"Campo": c, "Bases POP": _val(bases_rows, c), "Directorio": _val(dir_rows, c)} for c in campos]
     return pd.DataFrame(data)
 
-def _format_sheet(ws):
-    """
-    Formatea la hoja:
-      - Fila 1 con cabecera (negrita + fondo)
-      - wrap_text en todas las celdas
-      - Autoancho de columnas (estimado por contenido)
-      - Altura de filas estimada según el wrap (parecido a auto-fit)
-    """
-    # 1) Cabecera estilizada si hay celdas
-    if ws.max_row >= 1 and ws.max_column >= 1:
-        for c in range(1, ws.max_column + 1):
-            cell = ws.cell(row=1, column=c)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill("solid", fgColor="F2F2F2")
-            cell.alignment = Alignment(wrap_text=True, vertical="center")
-
-    # 2) Habilitar wrap_text para TODO (cabecera + datos)
-    for r in range(1, ws.max_row + 1):
-        for c in range(1, ws.max_column + 1):
-            ws.cell(row=r, column=c).alignment = Alignment(
-                wrap_text=True, vertical="top"
-            )
-
-    # 3) Autoancho de columnas (estimado)
-    #    - Igual que antes, pero lo hacemos primero para usarlo al calcular alturas
-    maxw = 55  # ancho máximo para no desbordar demasiado
-    minw = 10
-    # Guardamos los anchos calculados para usarlos luego al estimar alturas
-    computed_widths = {}
-    for col in range(1, ws.max_column + 1):
-        letter = get_column_letter(col)
-        width = minw
-        for row in range(1, ws.max_row + 1):
-            v = ws.cell(row=row, column=col).value
-            if v is None:
-                continue
-            # Heurística: ~0.9 chars por punto + 2 de margen
-            width = max(width, min(maxw, len(str(v)) * 0.9 + 2))
-        ws.column_dimensions[letter].width = width
-        computed_widths[col] = width
-
-    # 4) Altura de filas “auto” (estimada)
-    #    - Excel no auto-ajusta filas vía openpyxl, así que calculamos un alto aproximado
-    #    - Suponemos ~1.1 chars por unidad de ancho de columna
-    base_height = 15          # altura de una línea
-    max_height = 150          # para no generar filas gigantes
-    for row in range(1, ws.max_row + 1):
-        max_lines = 1
-        for col in range(1, ws.max_column + 1):
-            v = ws.cell(row=row, column=col).value
-            if v is None:
-                continue
-            text = str(v)
-            # líneas explícitas por saltos de línea
-            hard_lines = text.split("\n")
-            # ancho "útil" (aprox) de la columna en caracteres
-            col_width = computed_widths.get(col, 10)
-            chars_per_line = max(1, int(col_width * 1.1))  # 1.1 ≈ heurística
-            est_lines = 0
-            for hl in hard_lines:
-                # número de líneas que ocupa ese tramo considerando el wrap
-                est_lines += max(1, (len(hl) + chars_per_line - 1) // chars_per_line)
-            max_lines = max(max_lines, est_lines)
-
-        ws.row_dimensions[row].height = min(max_height, base_height * max_lines)
 
+def _construir_excel(res: Dict[str, List[dict]]):
+    """Excel multi-hoja (write-only, estilos compartidos). Devuelve el archivo spooled."""
+    xl = ExcelStreamExporter()
+    df_comp = _comparativo_df(res["bases"], res["directorio"], prefer_bases=COLUMNAS_BASES, prefer_dir=COLUMNAS_DIRECTORIO)
+    if df_comp.empty:
+        df_comp = df_comp.reindex(columns=["Campo","Bases POP","Directorio"])
+    xl.add_dataframe("Bases POP vs Directorio", df_comp)
+    xl.add_records("Proyecto RANCO", res["proyecto_ranco"])
+    xl.add_records("Base Hardware", res["hardware"])
+    xl.add_records("Export 5G", res["export_5g"])
+    xl.add_records("Export 4G", res["export_4g"])
+    xl.add_records("Export 3G", res["export_3g"])
+    xl.add_records("Export 2G", res["export_2g"])
+    return xl.save()
 
 @app.get("/exportar_excel")
-def exportar_excel(codigo: str):
+@perfilable
+def exportar_excel(request: Request, codigo: str):
     if not codigo:
         return JSONResponse({"error": "Falta parámetro codigo"}, status_code=400)
 
-    # Bases POP
-    df_bases = get_data("Bases POP")
-    df_bases.columns = [c.strip() for c in df_bases.columns]
-    columnas_bases = [
-        "POP","Nombre","Latitud","Longitud","Comuna","Región",
-        "Tipo FDT","Tipo LLOO","ESA","Tipo","Soluc. Esp","Altura Solucion",
-        "Detalle Infra ((28-12-2021))","3G1900.1","3G900","LTE3500 A/B/C",
-        "NR3500","NR26000","LTE2600","LTE1900","LTE700",
-        "Tecnologías Actuales Totales","TAC LTE","LAC 3G"
-    ]
-    bases_rows = []
-    if "POP" in df_bases.columns:
-        norm = lambda s: _strip_accents(str(s)).upper().strip()
-        mask = df_bases["POP"].map(norm) == norm(codigo)   # ← corregido
-        cols_ok = [c for c in columnas_bases if c in df_bases.columns]
-        bases_rows = df_bases.loc[mask, cols_ok].fillna("").to_dict(orient="records")
-
-    # Directorio
-    df_dir = get_data("Directorio")
-    df_dir.columns = [c.strip() for c in df_dir.columns]
-    columnas_dir = [
-        "POP","Nombre","Latitud","Longitud","Comuna","Región",
-        "Tipo FDT","Tipo LLOO","Tipo","Soluc. Esp","Detalle Infra ((28-12-2021))",
-        "Tecnologías Totales Fin proyecto 2025","CLASS 1","CLASS 2","CLASS 3"
-    ]
-    dir_rows = []
-    if "POP" in df_dir.columns:
-        norm = lambda s: _strip_accents(str(s)).upper().strip()
-        mask = df_dir["POP"].map(norm) == norm(codigo)     # ← corregido
-        cols_ok = [c for c in columnas_dir if c in df_dir.columns]
-        dir_rows = df_dir.loc[mask, cols_ok].fillna("").to_dict(orient="records")
-
-    # Otras hojas
-    proyecto_ranco_rows = filtrar_por_pop(get_data("Proyecto_RANCO"), codigo)
-    hardware_rows = filtrar_por_pop(get_data("Base Hardware"), codigo)
-    # --- ordenar Base Hardware por SITE ID también en la exportación ---
-    site_key = _find_key_ci(hardware_rows, "SITE ID")
-    if site_key:
-        hardware_rows.sort(
-            key=lambda r: (r.get(site_key) in ("", None), _natural_key(r.get(site_key, "")))
-        )
-    export_5g_rows = filtrar_por_pop(leer_filas_por_pop(SHEET_ID, "Export_5G", codigo), codigo, excluir=["nRSectorCarrierRef"])
-    export_4g_rows = filtrar_por_pop(leer_filas_por_pop(SHEET_ID, "Export_4G", codigo), codigo, excluir=["latitud", "longitud", "Región"])
-    export_3g_rows = filtrar_por_pop(leer_filas_por_pop(SHEET_ID, "Export_3G", codigo), codigo, excluir=["latitude", "longitude", "Región"])
-    export_2g_rows = filtrar_por_pop(leer_filas_por_pop(SHEET_ID, "Export_2G", codigo), codigo, excluir=["Latitude", "Longitude"])
-
-    # Excel multi-hoja
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df_comp = _comparativo_df(bases_rows, dir_rows, prefer_bases=columnas_bases, prefer_dir=columnas_dir)
-        if df_comp.empty:
-            df_comp = pd.DataFrame(columns=["Campo","Bases POP","Directorio"])
-        df_comp.to_excel(writer, index=False, sheet_name="Bases POP vs Directorio")
-
-        _rows_to_df(proyecto_ranco_rows).to_excel(writer, index=False, sheet_name="Proyecto RANCO")
-        _rows_to_df(hardware_rows).to_excel(writer, index=False, sheet_name="Base Hardware")
-        _rows_to_df(export_5g_rows).to_excel(writer, index=False, sheet_name="Export 5G")
-        _rows_to_df(export_4g_rows).to_excel(writer, index=False, sheet_name="Export 4G")
-        _rows_to_df(export_3g_rows).to_excel(writer, index=False, sheet_name="Export 3G")
-        _rows_to_df(export_2g_rows).to_excel(writer, index=False, sheet_name="Export 2G")
-
-        wb = writer.book
-        for name in ["Bases POP vs Directorio","Proyecto RANCO","Base Hardware","Export 5G","Export 4G","Export 3G","Export 2G"]:
-            ws = wb[name]
-            if ws.max_row == 1 and ws.max_column == 1 and ws["A1"].value is None:
-                ws["A1"] = "Sin datos para este POP"
-            _format_sheet(ws)
-
-    output.seek(0)
+    with span("resultados"):
+        entry = resultados_pop(codigo, _usuario_request(request))
+    headers = _cache_headers(f'{entry["etag"]}-xlsx', debil=False)
+    if _etag_match(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
     filename = f"Sitio_{codigo.upper().strip()}.xlsx"
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename=\"{filename}\"'}
-    )
+    headers["Content-Disposition"] = f'attachment; filename=\"{filename}\"'
+
+    # mismo contenido => mismo libro (la clave es el hash del contenido)
+    with _cache_lock:
+        data = xlsx_cache.get(entry["etag"])
+    if data is not None:
+        return Response(content=data, media_type=XLSX_MEDIA_TYPE, headers=headers)
+
+    with span("excel"):
+        output = _construir_excel(entry["data"])
+    size = file_size(output)
+    if size <= XLSX_CACHE_ITEM_MAX:
+        data = output.read()
+        output.close()
+        with _cache_lock:
+            xlsx_cache[entry["etag"]] = data
+        return Response(content=data, media_type=XLSX_MEDIA_TYPE, headers=headers)
+
+    # libros grandes: no se cachean, se entregan en chunks desde el spool
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(iter_file(output), media_type=XLSX_MEDIA_TYPE, headers=headers)
+
+
+# ========= Exportación por lote (varios POP) =========
+MAX_LOTE_EXPORT = int(os.getenv("MAX_LOTE_EXPORT", "1000"))
+
+HOJAS_CONSOLIDADO = (
+    ("Bases POP", "bases"), ("Directorio", "directorio"), ("Proyecto RANCO", "proyecto_ranco"),
+    ("Base Hardware", "hardware"), ("Export 5G", "export_5g"), ("Export 4G", "export_4g"),
+    ("Export 3G", "export_3g"), ("Export 2G", "export_2g"),
+)
+
+def _codigos_por_zona(region: str = "", comuna: str = "") -> List[str]:
+    """POP de Bases POP cuya Región/Comuna coincide (sin tildes, sin mayúsculas; admite listas con coma)."""
+    df = get_data("Bases POP")
+    if df is None or df.empty:
+        return []
+    cols_norm = normalizacion.columnas(df)
+    if "POP" not in cols_norm:
+        return []
+    import pandas as pd
+    mask = pd.Series(True, index=df.index)
+    for campo, valor in (("REGION", region), ("COMUNA", comuna)):
+        buscados = {normalizacion.clave(v) for v in (valor or "").split(",") if v.strip()}
+        if not buscados:
+            continue
+        if campo not in cols_norm:
+            return []
+        vals = normalizacion.columna(df, cols_norm[campo])
+        mask &= vals.isin(buscados)
+    pops = df.loc[mask, cols_norm["POP"]].astype(str).str.strip()
+    return list(dict.fromkeys(p for p in pops if p))
+
+def _construir_consolidado(res: Dict[str, Dict[str, List[dict]]]):
+    """Un solo libro: una hoja por sección con las filas de todos los POP."""
+    xl = ExcelStreamExporter()
+    for titulo, seccion in HOJAS_CONSOLIDADO:
+        xl.add_records(titulo, [r for secs in res.values() for r in secs[seccion]])
+    return xl.save()
+
+def _libros_por_sitio(res: Dict[str, Dict[str, List[dict]]]):
+    # generador: cada libro se arma recién cuando el ZIP llega a esa entrada
+    for codigo, secs in res.items():
+        if any(secs.values()):
+            yield f"Sitio_{codigo}.xlsx", _construir_excel(secs)
+
+@app.get("/exportar_excel_lote")
+@perfilable
+def exportar_excel_lote(
+    codigos: str = "",
+    region: str = "",
+    comuna: str = "",
+    formato: str = "zip",   # "zip" (un .xlsx por sitio) | "xlsx" (libro consolidado)
+    user_email: str = Depends(current_user),
+):
+    if not user_email:
+        return JSONResponse({"error": "No autenticado"}, status_code=401)
+    lista = _parse_codigos(codigos) if codigos else _codigos_por_zona(region, comuna)
+    if not lista:
+        return JSONResponse({"error": "Sin POP: indica codigos o un filtro region/comuna válido"}, status_code=400)
+    if len(lista) > MAX_LOTE_EXPORT:
+        return JSONResponse({"error": f"Máximo {MAX_LOTE_EXPORT} POP por exportación ({len(lista)} pedidos)"},
+                            status_code=400)
+
+    with _limite_sheets.cupo(usuario=user_email):
+        res = buscar_lote(lista)   # una pasada por hoja para todos los sitios
+    sufijo = time.strftime("%Y%m%d_%H%M")
+    if formato == "xlsx":
+        output = _construir_consolidado(res)
+        headers = {"Content-Disposition": f'attachment; filename="Sitios_{sufijo}.xlsx"',
+                   "Content-Length": str(file_size(output))}
+        return StreamingResponse(iter_file(output), media_type=XLSX_MEDIA_TYPE, headers=headers)
+
+    headers = {"Content-Disposition": f'attachment; filename="Sitios_{sufijo}.zip"'}
+    return StreamingResponse(iter_zip(_libros_por_sitio(res)), media_type=ZIP_MEDIA_TYPE, headers=headers)
 
 
 
@@ -736,6 +1225,7 @@ async def carga_upload(
     file: UploadFile = File(None),   # opcional en PREVIEW, no en CONFIRM
     confirmar: str = Form("no"),
     token: str = Form(None),
+    ordenar_pop: str = Form("no"),   # solo Export: agrupa por POP + hoja índice
     user: str = Depends(require_auth),
 ):
     tipo = tipo.lower()
@@ -751,7 +1241,8 @@ async def carga_upload(
             if not (file.filename or "").lower().endswith(".xlsx"):
                 ctx["error"] = "Debes subir un archivo Excel (.xlsx)."
                 return templates.TemplateResponse("carga_form.html", ctx)
-            data = await file.read()
+            with span("lectura_archivo"):
+                data = await file.read()
             tok = save_temp_upload(data)
             ctx["token"] = tok
             xio = io.BytesIO(data)
@@ -770,11 +1261,14 @@ async def carga_upload(
 
     # ========= 2) Ramas por tipo =========
     try:
+        from openpyxl import load_workbook   # perezoso (arranque); lo usan ambas ramas
+
         # -------------------- EXPORT_* (múltiples hojas) --------------------
         if tipo == "export":
             wanted = ["Export_5G", "Export_4G", "Export_3G", "Export_2G"]
             xio.seek(0)
-            wb = load_workbook(filename=BytesIO(xio.read()), read_only=True, data_only=True)
+            with span("abrir_xlsx"):
+                wb = load_workbook(filename=BytesIO(xio.read()), read_only=True, data_only=True)
 
             # PREVIEW: muestra columnas + 20 filas por hoja, valida POP
             if confirmar != "si":
@@ -822,15 +1316,22 @@ async def carga_upload(
                 if w in wb.sheetnames:
                     ws = wb[w]
                     try:
-                        escribir_hoja_stream(SHEET_ID, w, iter_sheet_rows(ws), batch_rows=5000)
-                        write_summary[w] = f"Actualizado ✅ (stream) | Filas aprox: {ws.max_row}"
+                        with span("escritura_sheets"):
+                            if ordenar_pop == "si":
+                                escribir_hoja_stream_por_pop(SHEET_ID, w, iter_sheet_rows(ws), batch_rows=5000)
+                                write_summary[w] = f"Actualizado ✅ (stream, ordenado por POP) | Filas aprox: {ws.max_row}"
+                            else:
+                                eliminar_indice_pop(SHEET_ID, w)  # antes de limpiar: el índice anterior ya no sirve
+                                escribir_hoja_stream(SHEET_ID, w, iter_sheet_rows(ws), batch_rows=5000)
+                                write_summary[w] = f"Actualizado ✅ (stream) | Filas aprox: {ws.max_row}"
                         touched.append(w)
                     except Exception as e:
                         write_summary[w] = f"Error al escribir: {e}"
                 else:
                     write_summary[w] = "Saltado: No está en el archivo"
 
-                await asyncio.sleep(2)
+                with span("pausa_cuota"):
+                    await asyncio.sleep(2)
 
             invalidate_cache(touched)
             ctx["result"] = write_summary
@@ -847,7 +1348,8 @@ async def carga_upload(
         # -------------------- Hojas simples: bases/directorio/hardware/ranco --------------------
         else:
             xio.seek(0)
-            wb = load_workbook(filename=xio, read_only=True, data_only=True)
+            with span("abrir_xlsx"):
+                wb = load_workbook(filename=xio, read_only=True, data_only=True)
             ws0 = wb[wb.sheetnames[0]]
 
             # PREVIEW: no usamos pandas; extraemos headers + primeras filas con openpyxl
@@ -902,7 +1404,8 @@ async def carga_upload(
             target = target_map[tipo]
 
             try:
-                escribir_hoja_stream(SHEET_ID, target, iter_rows(), batch_rows=800)
+                with span("escritura_sheets"):
+                    escribir_hoja_stream(SHEET_ID, target, iter_rows(), batch_rows=800)
                 invalidate_cache([target])
                 ctx["result"] = {target: "Actualizado ✅ (stream)"}
                 if token:
@@ -925,3 +1428,6 @@ async def carga_upload(
         """
         send_mail(subject, body)
         return templates.TemplateResponse("carga_form.html", ctx)
+
+
+arranque.marcar("rutas")
@@ -0,0 +1,213 @@
+# metricas.py
+"""
+Métricas en memoria (por proceso) expuestas en formato texto de Prometheus.
+
+    SHEETS_LLAMADAS.inc(metodo="values.batchGet")
+    SHEETS_LATENCIA.observe(0.21, metodo="values.batchGet")
+
+Contadores e histogramas con etiquetas, sin lock en el camino caliente: cada hilo
+escribe en su propio dict (shard) y `exponer` suma los shards. Los shards de hilos
+que ya terminaron se pliegan en uno "retirado" para no crecer sin límite (el
+threadpool de anyio recicla hilos). Costo por operación: ver
+benchmarks/bench_metricas.py. Los "medidores" se calculan recién al exponer.
+METRICAS=0 las desactiva (inc/observe vuelven de inmediato).
+"""
+from __future__ import annotations
+import os
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+HABILITADAS = os.getenv("METRICAS", "1") not in ("0", "false", "no")
+
+# segundos: de 1 ms a 1 min (Sheets API, requests)
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_REGISTRO: List["_Metrica"] = []
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: Sequence[str], valores: Tuple[str, ...], extra: str = "") -> str:
+    partes = [f'{n}="{_escape("" if v is None else v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()          # solo para registrar / plegar shards
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, dict]] = []
+        self._retirado: dict = {}
+        _REGISTRO.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.d
+        except AttributeError:
+            d = self._local.d = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), d))
+            return d
+
+    def _combinar(self, destino: dict, origen: dict):  # pragma: no cover (lo define cada tipo)
+        raise NotImplementedError
+
+    def _snapshot(self) -> dict:
+        """Suma de todos los shards (los de hilos muertos se pliegan en _retirado)."""
+        total: dict = {}
+        with self._lock:
+            vivos = []
+            for hilo, d in self._shards:
+                if hilo.is_alive():
+                    vivos.append((hilo, d))
+                else:
+                    self._combinar(self._retirado, d)
+            self._shards = vivos
+            self._combinar(total, self._retirado)
+            for _, d in vivos:
+                self._combinar(total, d)
+        return total
+
+    def _clave(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        # valores ya como str (los callers pasan str(status), etc.); sin generador: es el camino caliente
+        return tuple(map(labels.get, self.etiquetas)) if self.etiquetas else ()
+
+    def lineas(self) -> Iterable[str]:
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **labels: str):
+        if not HABILITADAS:
+            return
+        k = self._clave(labels)
+        d = self._shard()
+        d[k] = d.get(k, 0) + valor
+
+    def _combinar(self, destino: dict, origen: dict):
+        for k, v in list(origen.items()):
+            destino[k] = destino.get(k, 0) + v
+
+    def valor(self, **labels: str) -> float:
+        return self._snapshot().get(self._clave(labels), 0)
+
+    def lineas(self) -> Iterable[str]:
+        yield from super().lineas()
+        for k, v in self._snapshot().items():
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, k)} {v:g}"
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valor: float, **labels: str):
+        if not HABILITADAS:
+            return
+        k = self._clave(labels)
+        d = self._shard()
+        # serie => [conteo por bucket (no acumulado) + overflow..., suma]
+        s = d.get(k)
+        if s is None:
+            s = d[k] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect_left(self.buckets, valor)] += 1
+        s[-1] += valor
+
+    def _combinar(self, destino: dict, origen: dict):
+        for k, s in list(origen.items()):
+            s = list(s)
+            acc = destino.get(k)
+            if acc is None:
+                destino[k] = s
+            else:
+                for i, v in enumerate(s):
+                    acc[i] += v
+
+    def lineas(self) -> Iterable[str]:
+        yield from super().lineas()
+        for k, s in self._snapshot().items():
+            conteos, suma = s[:-1], s[-1]
+            total = sum(conteos)  # coherente con los buckets aunque otro hilo esté observando
+            acumulado = 0
+            for b, c in zip(self.buckets, conteos):
+                acumulado += c
+                le = 'le="%g"' % b
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, k, le)} {acumulado}"
+            le = 'le="+Inf"'
+            yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, k, le)} {total}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, k)} {suma:g}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, k)} {total}"
+
+
+class Medidor(_Metrica):
+    """Gauge calculado al exponer: fn() => {(valores de etiquetas...): número}."""
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, fn: Callable[[], Dict[Tuple[str, ...], float]],
+                 etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.fn = fn
+
+    def lineas(self) -> Iterable[str]:
+        try:
+            valores = self.fn()
+        except Exception:
+            return
+        yield from super().lineas()
+        for k, v in valores.items():
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, k)} {float(v):g}"
+
+
+def exponer() -> str:
+    """Todas las métricas en formato texto de Prometheus (0.0.4)."""
+    out: List[str] = []
+    for m in _REGISTRO:
+        out.extend(m.lineas())
+    return "\n".join(out) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =========================
+#  Métricas de la app
+# =========================
+# Google Sheets API (gspread + API v4)
+SHEETS_LLAMADAS = Contador("sheets_api_llamadas_total", "Llamadas HTTP a la API de Sheets", ("metodo", "status"))
+SHEETS_BYTES = Contador("sheets_api_bytes_total", "Bytes recibidos/enviados a la API de Sheets", ("metodo", "sentido"))
+SHEETS_LATENCIA = Histograma("sheets_api_latencia_segundos", "Latencia por llamada a la API de Sheets", ("metodo",))
+SHEETS_429 = Contador("sheets_api_429_total", "Respuestas 429 (cuota) de la API de Sheets", ("metodo",))
+
+# cache de hojas (get_data)
+CACHE_ACIERTOS = Contador("cache_hojas_aciertos_total", "get_data servido desde cache", ("hoja",))
+CACHE_FALLOS = Contador("cache_hojas_fallos_total", "get_data que recargó desde Sheets", ("hoja",))
+CACHE_RECARGA = Histograma("cache_hojas_recarga_segundos", "Tiempo de recarga de una hoja", ("hoja",))
+
+# lectura por POP
+POP_FILAS_LEIDAS = Contador("lector_pop_filas_leidas_total", "Filas recorridas por PopFilteredReader", ("hoja", "modo"))
+POP_FILAS_COINCIDEN = Contador("lector_pop_filas_coinciden_total", "Filas devueltas por PopFilteredReader", ("hoja", "modo"))
+
+# escritura en streaming
+ESCRITURA_FILAS = Contador("escritura_filas_total", "Filas escritas por StreamingWriter", ("hoja",))
+ESCRITURA_LOTES = Contador("escritura_lotes_total", "Lotes (values.update) escritos por StreamingWriter", ("hoja",))
+ESCRITURA_DURACION = Histograma("escritura_duracion_segundos", "Duración total de StreamingWriter.write_rows", ("hoja",))
+
+# requests
+HTTP_LATENCIA = Histograma("http_request_latencia_segundos", "Latencia por ruta", ("metodo", "ruta", "status"))
@@ -0,0 +1,220 @@
+# middleware.py
+"""
+Middleware ASGI puro de la app. Reemplaza a SessionMiddleware + los dos
+@app.middleware("http") (enforce_session_ttl / log_and_block), que metían dos capas
+de BaseHTTPMiddleware (task + cola) en cada request, incluidos los StreamingResponse.
+"""
+from __future__ import annotations
+import json
+import logging
+import time
+import uuid
+from base64 import b64decode, b64encode
+from typing import Callable, Optional
+from urllib.parse import quote
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import URL, MutableHeaders
+from starlette.requests import HTTPConnection
+
+import metricas
+import perfilado
+import registro
+import tiempos
+
+log = registro.obtener("http")
+
+# Rutas que NO requieren sesión (no se revisa TTL)
+RUTAS_PUBLICAS = ("/static", "/auth")
+RUTAS_PUBLICAS_EXACTAS = ("/", "/favicon.ico")
+
+
+class AppMiddleware:
+    """
+    - Una línea de log JSON por request (status, ms, spans, request_id, usuario) vía
+      registro.py (cola + hilo escritor, sin print en el event loop). Los exitosos se
+      muestrean según LOG_SAMPLE_OK; errores y requests lentos se loguean siempre.
+    - Request id: el header X-Request-ID entrante (si es razonable) o uno nuevo; se
+      devuelve en la respuesta.
+    - Perfilado bajo demanda (perfilado.py): si el request lo pide y `autorizar_perfil(scope)`
+      devuelve un usuario, las funciones @perfilable corren bajo cProfile y el nombre del
+      .pstats vuelve en el header X-Perfil.
+    - Temporizador por request (tiempos.py) emitido como header Server-Timing.
+    - HEAD/OPTIONS responden {"status": "ok"} sin pasar por la app.
+    - Sesión firmada en cookie (mismo formato que starlette.SessionMiddleware, las
+      cookies existentes siguen siendo válidas) expuesta en scope["session"].
+    - TTL deslizante sobre session["login_ts"]: vencido => limpia y redirige a login.
+    - La cookie se re-firma solo si la sesión cambió o si pasó `refresh_fraction`
+      del TTL desde la última firma (no en cada request).
+    """
+    def __init__(self, app, secret_key: str, session_cookie: str = "session",
+                 max_age: int = 1800, ttl_seconds: int = 1800, refresh_fraction: float = 0.25,
+                 path: str = "/", same_site: str = "lax", https_only: bool = False,
+                 autorizar_perfil: Optional[Callable[[dict], Optional[str]]] = None):
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.ttl_seconds = ttl_seconds
+        self.refresh_after = ttl_seconds * refresh_fraction
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+        self.autorizar_perfil = autorizar_perfil
+
+    # ---------- sesión ----------
+    def _load_session(self, scope) -> tuple[dict, float | None]:
+        """Devuelve (sesión, timestamp de firma) o ({}, None) si no hay cookie válida."""
+        cookies = HTTPConnection(scope).cookies
+        raw = cookies.get(self.session_cookie)
+        if not raw:
+            return {}, None
+        try:
+            data, signed_at = self.signer.unsign(raw.encode("utf-8"), max_age=self.max_age, return_timestamp=True)
+            return json.loads(b64decode(data)), signed_at.timestamp()
+        except (BadSignature, ValueError):
+            return {}, None
+
+    def _cookie_header(self, session: dict) -> str:
+        if session:
+            data = self.signer.sign(b64encode(json.dumps(session).encode("utf-8"))).decode("utf-8")
+            return f"{self.session_cookie}={data}; path={self.path}; Max-Age={self.max_age}; {self.security_flags}"
+        return (f"{self.session_cookie}=null; path={self.path}; "
+                f"expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}")
+
+    @staticmethod
+    def _requiere_sesion(path: str) -> bool:
+        return not (path.startswith(RUTAS_PUBLICAS) or path in RUTAS_PUBLICAS_EXACTAS)
+
+    async def _redirect_login(self, scope, send):
+        nxt = quote(str(URL(scope=scope)), safe="")
+        await send({
+            "type": "http.response.start",
+            "status": 302,
+            "headers": [
+                (b"location", f"/auth/login?next={nxt}".encode("latin-1")),
+                (b"content-length", b"0"),
+                (b"set-cookie", self._cookie_header({}).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    def _log_salida(method: str, path: str, status: int, t: tiempos.Temporizador, session: dict):
+        ms = round(t.transcurrido() * 1000, 1)
+        if status < 400 and not registro.muestrear_ok(ms):
+            return
+        datos = {"metodo": method, "ruta": path, "status": status, "ms": ms, "spans": t.resumen()}
+        nivel = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+        log.log(nivel, "request", extra={"datos": datos, "usuario": session.get("user_email")})
+
+    @staticmethod
+    def _request_id(scope) -> str:
+        for k, v in scope.get("headers", ()):
+            if k == b"x-request-id":
+                rid = v.decode("latin-1").strip()
+                if 0 < len(rid) <= 64 and rid.isprintable():
+                    return rid
+                break
+        return uuid.uuid4().hex[:16]
+
+    def _perfil(self, scope, method: str, path: str) -> Optional[perfilado.Perfil]:
+        if self.autorizar_perfil is None or not perfilado.pedido(scope):
+            return None
+        usuario = self.autorizar_perfil(scope)
+        if not usuario:
+            log.warning("perfil pedido sin autorización", extra={"datos": {"metodo": method, "ruta": path}})
+            return None
+        log.info("perfilando request", extra={"datos": {"metodo": method, "ruta": path, "admin": usuario}})
+        return perfilado.Perfil(usuario)
+
+    # ---------- ASGI ----------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+
+        if method in ("HEAD", "OPTIONS"):
+            body = b'{"status":"ok"}'
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        temporizador, token = tiempos.iniciar()
+        rid = self._request_id(scope)
+        token_rid = registro.iniciar_request(rid)
+        try:
+            await self._con_sesion(scope, receive, send, method, path, temporizador, rid)
+        finally:
+            registro.terminar_request(token_rid)
+            tiempos.terminar(token)
+
+    async def _con_sesion(self, scope, receive, send, method, path, temporizador, rid):
+        session, signed_at = self._load_session(scope)
+        had_cookie = signed_at is not None
+        initial = json.dumps(session, sort_keys=True) if session else ""
+        scope["session"] = session
+        registro.set_usuario(session.get("user_email"))
+        perfil = self._perfil(scope, method, path)
+
+        if self._requiere_sesion(path) and session.get("user_email") and session.get("login_ts"):
+            try:
+                elapsed = time.time() - float(session["login_ts"])
+                if elapsed > self.ttl_seconds:
+                    session.clear()
+                    await self._redirect_login(scope, send)
+                    self._log_salida(method, path, 302, temporizador, session)
+                    return
+                if elapsed > self.refresh_after:
+                    session["login_ts"] = time.time()  # sesión deslizante (re-firma abajo)
+            except (TypeError, ValueError):
+                session.clear()
+                await self._redirect_login(scope, send)
+                self._log_salida(method, path, 302, temporizador, session)
+                return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                sess = scope["session"]
+                changed = (json.dumps(sess, sort_keys=True) if sess else "") != initial
+                stale = bool(sess) and signed_at is not None and (time.time() - signed_at) > self.refresh_after
+                if changed or stale:
+                    if sess or had_cookie:
+                        headers.append("Set-Cookie", self._cookie_header(sess))
+                headers.append("Server-Timing", temporizador.server_timing())
+                headers.append("X-Request-ID", rid)
+                if perfil is not None:
+                    try:
+                        nombre = perfil.guardar()  # el endpoint sync ya terminó: el perfil está completo
+                    except Exception:   # disco lleno, PERFIL_DIR sin permisos...: la respuesta sale igual
+                        log.exception("no se pudo guardar el perfil", extra={"datos": {"ruta": path}})
+                        nombre = None
+                    if nombre:
+                        headers.append("X-Perfil", nombre)
+            await send(message)
+
+        token_perfil = perfilado.activar(perfil) if perfil is not None else None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            log.exception("error no manejado", extra={"datos": {"metodo": method, "ruta": path}})
+            raise
+        finally:
+            if token_perfil is not None:
+                perfilado.desactivar(token_perfil)
+            # después del último chunk: incluye el tiempo de streaming
+            self._log_salida(method, path, status, temporizador, scope["session"])
+            # plantilla de la ruta (no el path real) para no explotar la cardinalidad
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            metricas.HTTP_LATENCIA.observe(temporizador.transcurrido(), metodo=method, ruta=ruta, status=str(status))
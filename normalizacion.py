@@ -0,0 +1,137 @@
+# normalizacion.py
+"""
+Normalización de texto compartida: sin tildes + mayúsculas + sin espacios en los extremos.
+
+Misma semántica que el antiguo `_strip_accents(s).upper().strip()` de main (NFD y se
+descartan las marcas Mn: "Ñuñoa" => "NUNOA"), pero sin recorrer cada carácter con
+unicodedata:
+  - tabla de traducción precalculada para el plano básico (str.translate, en C; los
+    strings ASCII ni siquiera la usan);
+  - escalar memoizado para encabezados, códigos POP y términos de búsqueda;
+  - Series: cada valor DISTINTO se normaliza una vez (pd.factorize) y se reparte;
+  - columnas ya normalizadas cacheadas por DataFrame: las hojas de main.get_data no se
+    modifican (una recarga crea otro DataFrame), así que la columna POP de una hoja de
+    20k filas se normaliza una vez por versión y no en cada búsqueda.
+
+    normalizacion.clave("  Peñalolén ")        => "PENALOLEN"
+    normalizacion.compacta("Av.  Grecia ")     => "AV. GRECIA"   (además colapsa espacios)
+    normalizacion.serie(df["Región"])          => Series normalizada (mismo índice)
+    normalizacion.columna(df, "POP")           => como serie(df["POP"]), cacheada por DataFrame
+    normalizacion.columnas(df)                 => {clave(col): col}
+"""
+from __future__ import annotations
+import threading
+import unicodedata
+import weakref
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _sin_tildes_unicodedata(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+@lru_cache(maxsize=None)
+def tabla() -> Dict[int, Optional[str]]:
+    """ord(c) => c sin tildes (None = marca combinante) para U+0080..U+FFFF. ~60 ms, una vez."""
+    out: Dict[int, Optional[str]] = {}
+    for cp in range(0x80, 0x10000):
+        c = chr(cp)
+        if unicodedata.category(c) == "Mn":
+            out[cp] = None
+            continue
+        r = _sin_tildes_unicodedata(c)
+        if r != c:
+            out[cp] = r
+    return out
+
+
+def sin_tildes(s: str) -> str:
+    """Quita tildes y diacríticos (equivalente a NFD sin marcas Mn)."""
+    if s.isascii():
+        return s
+    if max(s) > "\uffff":   # fuera del plano básico (raro): camino exacto con unicodedata
+        return _sin_tildes_unicodedata(s)
+    return s.translate(tabla())
+
+
+def _clave(s: Any) -> str:
+    s = "" if s is None else str(s)
+    return (s if s.isascii() else sin_tildes(s)).upper().strip()
+
+
+@lru_cache(maxsize=65536)
+def clave(s: Any) -> str:
+    """Sin tildes, mayúsculas y sin espacios en los extremos (None => "")."""
+    return _clave(s)
+
+
+@lru_cache(maxsize=65536)
+def compacta(s: Any) -> str:
+    """Como clave() pero además colapsa los espacios internos ("A  B" => "A B")."""
+    return " ".join(_clave(s).split())
+
+
+@lru_cache(maxsize=4096)
+def email(e: Any) -> str:
+    """Emails: minúsculas y sin espacios en los extremos (las tildes se conservan: son otra cuenta)."""
+    return ("" if e is None else str(e)).strip().lower()
+
+
+# =========================
+#  Vectorizado (pandas)
+# =========================
+def serie(s: "pd.Series") -> "pd.Series":
+    """clave() de cada valor (str(v), como el antiguo .map); mismo índice y nombre."""
+    import numpy as np
+    import pandas as pd
+    codigos, unicos = pd.factorize(s.astype(str))
+    norm = np.array([_clave(u) for u in unicos], dtype=object)
+    return pd.Series(norm[codigos], index=s.index, name=s.name, dtype=object)
+
+
+def columnas(df: "pd.DataFrame") -> Dict[str, Hashable]:
+    """{clave(columna): columna} (la primera gana si dos columnas normalizan igual)."""
+    out: Dict[str, Hashable] = {}
+    for c in df.columns:
+        out.setdefault(clave(c), c)
+    return out
+
+
+# id(df) => (weakref al df, {columna: serie normalizada}); la entrada se borra con el df
+_cache: Dict[int, Tuple[weakref.ref, Dict[Hashable, "pd.Series"]]] = {}
+_lock = threading.RLock()   # el callback del weakref puede correr (GC) con el lock tomado
+
+
+def _olvidar(k: int, ref: weakref.ref):
+    with _lock:
+        if k in _cache and _cache[k][0] is ref:
+            del _cache[k]
+
+
+def columna(df: "pd.DataFrame", col: Hashable) -> "pd.Series":
+    """serie(df[col]) cacheada mientras viva `df`. Solo para DataFrames que no se modifican."""
+    k = id(df)
+    with _lock:
+        entrada = _cache.get(k)
+        if entrada is None or entrada[0]() is not df:
+            ref = weakref.ref(df, lambda r, k=k: _olvidar(k, r))
+            entrada = _cache[k] = (ref, {})
+        hit = entrada[1].get(col)
+    if hit is not None and len(hit) == len(df):
+        return hit
+    s = df[col]
+    if s.ndim == 2:   # columnas repetidas: la primera
+        s = s.iloc[:, 0]
+    norm = serie(s)
+    with _lock:
+        entrada[1][col] = norm
+    return norm
+
+
+def estado_cache() -> Dict[str, int]:
+    with _lock:
+        return {"dataframes": len(_cache), "columnas": sum(len(e[1]) for e in _cache.values())}
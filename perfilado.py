@@ -0,0 +1,176 @@
+# perfilado.py
+"""
+Perfilado bajo demanda de un request puntual (solo admins de /carga).
+
+    curl -u admin@x.cl:clave -b bi_session=... 'https://.../buscar?codigo=ABC123&perfil=1' -D -
+    => X-Perfil: 20261019-101500123_buscar_pop_3f2a.pstats
+    curl -u admin@x.cl:clave https://.../perfiles/20261019-101500123_buscar_pop_3f2a.pstats -o p.pstats
+    snakeviz p.pstats        # o flameprof / gprof2dot para un flame graph
+
+Se pide con `?perfil=1` o el header `X-Perfil: 1`; el middleware lo acepta solo si el
+autorizador (main: credenciales Basic de /carga o sesión de un usuario de /carga)
+devuelve un usuario. Las funciones marcadas con @perfilable corren entonces bajo
+cProfile (determinista) en su propio hilo, así que el perfil baja hasta
+conector_sheets / pandas. El .pstats se guarda en PERFIL_DIR (se conservan los
+últimos PERFIL_MAX) y su nombre vuelve en el header X-Perfil.
+
+Sin el switch el costo es un ContextVar.get() por llamada a una función marcada.
+
+cProfile no admite dos perfiles activos a la vez (en 3.12+ `enable()` lanza ValueError
+con otro profiler activo en el proceso): se perfila de a un request por vez y el resto
+corre sin perfil, con un warning en el log.
+"""
+from __future__ import annotations
+import cProfile
+import functools
+import io
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextvars import ContextVar, Token
+from typing import Callable, List, Optional
+from urllib.parse import parse_qsl
+
+import registro
+
+log = registro.obtener("perfilado")
+
+PERFIL_DIR = os.getenv("PERFIL_DIR", os.path.join(tempfile.gettempdir(), "buscador_perfiles"))
+PERFIL_MAX = int(os.getenv("PERFIL_MAX", "20"))
+
+_NOMBRE_OK = re.compile(r"^[\w.-]+\.pstats$")
+_actual: ContextVar[Optional["Perfil"]] = ContextVar("perfil", default=None)
+_lock = threading.Lock()
+_en_uso = threading.Lock()     # un solo cProfile activo por proceso
+_perfilando_en: Optional[int] = None   # hilo que lo tiene (anidadas en ese hilo ya quedan perfiladas)
+
+
+class Perfil:
+    """Un perfil por request: acumula las funciones @perfilable que corren en él."""
+    def __init__(self, usuario: str):
+        self.usuario = usuario
+        self.stats: Optional[pstats.Stats] = None
+        self.funciones: List[str] = []
+        self._lock = threading.Lock()
+
+    def ejecutar(self, fn: Callable, *args, **kwargs):
+        global _perfilando_en
+        if _perfilando_en == threading.get_ident():
+            return fn(*args, **kwargs)
+        if not _en_uso.acquire(blocking=False):
+            log.warning("perfil omitido: ya hay otro en curso", extra={"datos": {"funcion": fn.__name__}})
+            return fn(*args, **kwargs)
+        _perfilando_en = threading.get_ident()
+        try:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError as e:   # otra herramienta de profiling activa en el proceso
+                log.warning("perfil omitido", extra={"datos": {"funcion": fn.__name__, "error": str(e)}})
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                self._acumular(fn, prof)
+        finally:
+            _perfilando_en = None
+            _en_uso.release()
+
+    def _acumular(self, fn: Callable, prof: cProfile.Profile):
+        with self._lock:
+            self.funciones.append(fn.__name__)
+            if self.stats is None:
+                self.stats = pstats.Stats(prof)
+            else:
+                self.stats.add(prof)
+
+    def guardar(self) -> Optional[str]:
+        """Escribe el .pstats en PERFIL_DIR y devuelve su nombre (None si no se perfiló nada)."""
+        with self._lock:
+            if self.stats is None:
+                return None
+            os.makedirs(PERFIL_DIR, exist_ok=True)
+            ahora = time.time()
+            nombre = "{}{:03d}_{}_{}.pstats".format(  # el nombre ordena por fecha (listar / _podar)
+                time.strftime("%Y%m%d-%H%M%S", time.localtime(ahora)), int(ahora % 1 * 1000),
+                "-".join(dict.fromkeys(self.funciones)), uuid.uuid4().hex[:4])
+            self.stats.dump_stats(os.path.join(PERFIL_DIR, nombre))
+        _podar()
+        return nombre
+
+
+def _podar():
+    with _lock:
+        for n in listar()[PERFIL_MAX:]:
+            try:
+                os.remove(os.path.join(PERFIL_DIR, n))
+            except OSError:
+                pass
+
+
+# =========================
+#  Switch por request
+# =========================
+def pedido(scope) -> bool:
+    """¿El request pide perfil? (`perfil=1` en la query o header `X-Perfil`)."""
+    qs = scope.get("query_string", b"")
+    if b"perfil=" in qs and dict(parse_qsl(qs.decode("latin-1"))).get("perfil") not in (None, "", "0"):
+        return True
+    for k, v in scope.get("headers", ()):
+        if k == b"x-perfil":
+            return v.strip() not in (b"", b"0")
+    return False
+
+
+def activar(perfil: Perfil) -> Token:
+    return _actual.set(perfil)
+
+
+def desactivar(token: Token):
+    _actual.reset(token)
+
+
+def perfilable(fn: Callable) -> Callable:
+    """Marca un endpoint sync (o una función) para correr bajo cProfile si el request lo pidió."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        perfil = _actual.get()
+        if perfil is None:
+            return fn(*args, **kwargs)
+        return perfil.ejecutar(fn, *args, **kwargs)
+    return wrapper
+
+
+# =========================
+#  Archivos guardados
+# =========================
+def listar() -> List[str]:
+    """Nombres de los .pstats guardados, del más nuevo al más viejo."""
+    try:
+        nombres = [n for n in os.listdir(PERFIL_DIR) if _NOMBRE_OK.match(n)]
+    except FileNotFoundError:
+        return []
+    return sorted(nombres, reverse=True)
+
+
+def ruta(nombre: str) -> Optional[str]:
+    """Ruta del .pstats si el nombre es válido y existe (evita path traversal)."""
+    if not _NOMBRE_OK.match(nombre):
+        return None
+    p = os.path.join(PERFIL_DIR, nombre)
+    return p if os.path.isfile(p) else None
+
+
+def resumen(nombre: str, orden: str = "cumulative", limite: int = 60) -> Optional[str]:
+    """Texto de pstats (top `limite` funciones por `orden`) para ver sin herramientas."""
+    p = ruta(nombre)
+    if p is None:
+        return None
+    out = io.StringIO()
+    pstats.Stats(p, stream=out).strip_dirs().sort_stats(orden).print_stats(limite)
+    return out.getvalue()
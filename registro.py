@@ -0,0 +1,173 @@
+# registro.py
+"""
+Logging estructurado sin I/O en el camino del request.
+
+    log = registro.obtener("sheets")
+    log.info("hoja recargada", extra={"datos": {"hoja": "Bases POP", "filas": 1200}})
+
+Los loggers de la app ("app.*") escriben a una cola en memoria (QueueHandler) y un
+hilo de fondo (QueueListener) serializa a JSON y escribe en stdout: el event loop
+nunca se bloquea en el pipe de logs de la plataforma. Si la cola se llena, los
+registros se descartan (y se cuentan) en lugar de frenar el request.
+
+Cada línea lleva request_id y usuario del request en curso (contextvars, como
+tiempos.py), así que los logs emitidos desde el threadpool quedan asociados.
+
+Variables de entorno:
+    LOG_LEVEL       nivel mínimo (INFO)
+    LOG_SAMPLE_OK   fracción de requests exitosos que se loguean (1 = todos; 0.1 = 10%)
+    LOG_LENTO_MS    requests más lentos que esto se loguean siempre (1000)
+    LOG_COLA_MAX    tamaño de la cola en memoria (10000)
+"""
+from __future__ import annotations
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_OK = float(os.getenv("LOG_SAMPLE_OK", "1"))
+LOG_LENTO_MS = float(os.getenv("LOG_LENTO_MS", "1000"))
+LOG_COLA_MAX = int(os.getenv("LOG_COLA_MAX", "10000"))
+
+# contexto del request en curso: {"request_id": ..., "usuario": ...} (mutable, como el Temporizador)
+_contexto: ContextVar[Optional[Dict[str, Optional[str]]]] = ContextVar("registro_contexto", default=None)
+
+
+# =========================
+#  Contexto del request
+# =========================
+def iniciar_request(request_id: str) -> Token:
+    return _contexto.set({"request_id": request_id, "usuario": None})
+
+
+def terminar_request(token: Token):
+    _contexto.reset(token)
+
+
+def set_usuario(usuario: Optional[str]):
+    """Asocia el usuario al request en curso (lo llama el middleware al leer la sesión)."""
+    ctx = _contexto.get()
+    if ctx is not None:
+        ctx["usuario"] = usuario
+
+
+def muestrear_ok(ms: float) -> bool:
+    """¿Se loguea este request exitoso? Los lentos siempre; el resto según LOG_SAMPLE_OK."""
+    if ms >= LOG_LENTO_MS or LOG_SAMPLE_OK >= 1:
+        return True
+    return random.random() < LOG_SAMPLE_OK
+
+
+# =========================
+#  Handlers
+# =========================
+class _FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro (corre en el hilo del listener, no en el request)."""
+    def format(self, record: logging.LogRecord) -> str:
+        d = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.msg,
+        }
+        rid = getattr(record, "request_id", None)
+        if rid:
+            d["request_id"] = rid
+        usuario = getattr(record, "usuario", None)
+        if usuario:
+            d["usuario"] = usuario
+        datos = getattr(record, "datos", None)
+        if datos:
+            d.update(datos)
+        if record.exc_text:
+            d["error"] = record.exc_text
+        return json.dumps(d, ensure_ascii=False, default=str)
+
+
+class _ColaHandler(QueueHandler):
+    """QueueHandler que no formatea en el hilo del request y descarta si la cola está llena."""
+    descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # solo lo que depende del contexto actual o puede mutar; el JSON lo arma el listener
+        ctx = _contexto.get()
+        if ctx is not None:
+            record.request_id = ctx["request_id"]
+            if getattr(record, "usuario", None) is None:
+                record.usuario = ctx["usuario"]
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _ColaHandler.descartados += 1
+
+
+class _SalidaStdout(logging.StreamHandler):
+    """StreamHandler que resuelve sys.stdout al escribir (uvicorn/tests pueden reemplazarlo)."""
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    def emit(self, record: logging.LogRecord):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+_cola: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_COLA_MAX)
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+_raiz = logging.getLogger("app")
+
+
+def configurar():
+    """Arranca el hilo escritor (idempotente). Se llama al importar el módulo."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        salida = _SalidaStdout()
+        salida.setFormatter(_FormatoJSON())
+        _listener = QueueListener(_cola, salida, respect_handler_level=False)
+        _listener.start()
+        _raiz.handlers[:] = [_ColaHandler(_cola)]
+        _raiz.setLevel(LOG_LEVEL)
+        _raiz.propagate = False   # no duplicar en el root logger (uvicorn)
+        atexit.register(detener)
+
+
+def detener():
+    """Vacía la cola y detiene el hilo escritor (atexit)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def obtener(nombre: str) -> logging.Logger:
+    """Logger hijo de "app" (p. ej. obtener("sheets") => "app.sheets")."""
+    return _raiz.getChild(nombre)
+
+
+def estado_cola() -> Tuple[int, int]:
+    """(registros en cola, descartados por cola llena)."""
+    return _cola.qsize(), _ColaHandler.descartados
+
+
+configurar()
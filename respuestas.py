@@ -0,0 +1,90 @@
+# respuestas.py
+"""
+Serialización JSON rápida para la API (orjson si está instalado, json si no) y
+formato columnar para tablas de resultados.
+"""
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from starlette.responses import Response
+
+from normalizacion import compacta
+
+try:  # opcional: 3-10x más rápido que json y ya entrega bytes
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _por_defecto(o: Any) -> Any:
+    # escalares / arreglos numpy como números y listas (igual que OPT_SERIALIZE_NUMPY); el resto, texto
+    tolist = getattr(o, "tolist", None)
+    return tolist() if callable(tolist) else str(o)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=_por_defecto, separators=(",", ":")).encode("utf-8")
+
+
+class JSONRapida(Response):
+    """Como JSONResponse pero sin jsonable_encoder ni indentación: serializa directo a bytes."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+_clave = compacta   # nombres de sección / columna sin tildes ni mayúsculas
+
+
+def columnas_de(rows: Sequence[Dict[str, Any]]) -> List[str]:
+    """Columnas en orden de aparición (como ExcelStreamExporter.add_records)."""
+    cols: List[str] = []
+    seen = set()
+    for r in rows:
+        for k in r:
+            if k not in seen:
+                seen.add(k)
+                cols.append(k)
+    return cols
+
+
+def elegir_campos(disponibles: List[str], pedidos: Optional[List[str]]) -> List[str]:
+    """Campos pedidos (sin distinguir mayúsculas ni tildes), en el orden pedido; None => todos."""
+    if not pedidos:
+        return disponibles
+    por_clave = {_clave(c): c for c in disponibles}
+    return [por_clave[_clave(p)] for p in pedidos if _clave(p) in por_clave]
+
+
+def _pagina(rows: Sequence[Dict[str, Any]], offset: int, limite: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"total": len(rows)}
+    if offset or limite:
+        out["offset"], out["limite"] = offset, limite
+    return out
+
+
+def a_columnas(rows: Sequence[Dict[str, Any]], campos: Optional[List[str]] = None,
+               offset: int = 0, limite: int = 0) -> Dict[str, Any]:
+    """[{a:1,b:2},{a:3,b:4}] => {"total": 2, "columnas": {"a": [1,3], "b": [2,4]}}.
+    Las columnas salen de todas las filas (no solo de la página) para que sean estables al paginar."""
+    cols = elegir_campos(columnas_de(rows), campos)
+    out = _pagina(rows, offset, limite)
+    pag = rows[offset:offset + limite] if limite else rows[offset:]
+    out["columnas"] = {c: [r.get(c, "") for r in pag] for c in cols}
+    return out
+
+
+def a_filas(rows: Sequence[Dict[str, Any]], campos: Optional[List[str]] = None,
+            offset: int = 0, limite: int = 0) -> Dict[str, Any]:
+    out = _pagina(rows, offset, limite)
+    pag = rows[offset:offset + limite] if limite else rows[offset:]
+    if not campos:
+        out["filas"] = list(pag)
+    else:
+        cols = elegir_campos(columnas_de(rows), campos)
+        out["filas"] = [{c: r.get(c, "") for c in cols} for r in pag]
+    return out
@@ -0,0 +1,484 @@
+# sheets_fake.py
+"""
+Backend falso de Google Sheets, en proceso, para benchmarks y pruebas de carga offline.
+
+    SHEETS_BACKEND=fake SHEETS_FAKE_DIR=./datos_fake uvicorn main:app
+
+Implementa solo lo que usa conector_sheets:
+  - gspread: open_by_key, worksheet / add_worksheet / del_worksheet, y en la hoja
+    row_values, get_all_values, batch_get (rangos relativos), clear, resize,
+    update_cells (set_with_dataframe), row_count / col_count.
+  - API v4 values: get, batchGet, update, append (con .execute()).
+
+Las hojas salen de SHEETS_FAKE_DIR (perezoso, al abrir el libro):
+    <dir>/<sheet_id>/<hoja>.csv    una pestaña por CSV
+    <dir>/<sheet_id>.xlsx          una pestaña por hoja del libro
+    <dir>/<hoja>.csv               (si no hay nada por id: vale para cualquier sheet_id)
+o se cargan en memoria con `FakeSheets.cargar(sheet_id, hoja, filas)`. Las escrituras
+quedan en memoria (no se vuelcan a disco). Como la API real, todo valor sale como
+str y se recortan filas/celdas vacías al final de cada rango.
+
+Costo simulado por llamada (determinista con la misma semilla):
+    SHEETS_FAKE_LATENCIA_MS   latencia fija por llamada (0)
+    SHEETS_FAKE_MS_POR_KB     costo por KB enviado + recibido (JSON) (0)
+    SHEETS_FAKE_JITTER_MS     ± ruido uniforme (0)
+    SHEETS_FAKE_PROB_429      probabilidad de 429 por llamada (0)
+    SHEETS_FAKE_429_CADA      un 429 cada N llamadas (0 = nunca)
+    SHEETS_FAKE_CUOTA_MIN     llamadas por minuto antes de 429, ventana deslizante (0 = sin cuota)
+    SHEETS_FAKE_SEMILLA       semilla del RNG (0)
+
+Los 429 se levantan con el mismo tipo que la API real (gspread.exceptions.APIError o
+googleapiclient.errors.HttpError) y cada llamada se reporta al callback `medir` (las
+métricas de conector_sheets), así que /metricas funciona igual que contra Google.
+"""
+from __future__ import annotations
+import csv
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httplib2
+import requests
+from googleapiclient.errors import HttpError
+from gspread.exceptions import APIError, WorksheetNotFound
+
+Medir = Callable[[str, float, int, int, int], None]   # (metodo, segundos, status, enviados, recibidos)
+
+_A1 = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+
+def _col_num(letras: str) -> int:
+    n = 0
+    for ch in letras.upper():
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _separar_hoja(rango: str) -> Tuple[Optional[str], str]:
+    """"'Bases POP'!A1:C" => ("Bases POP", "A1:C"); "A1:C" => (None, "A1:C")."""
+    if "!" not in rango:
+        return None, rango
+    hoja, celdas = rango.rsplit("!", 1)
+    if len(hoja) >= 2 and hoja[0] == hoja[-1] == "'":
+        hoja = hoja[1:-1].replace("''", "'")
+    return hoja, celdas
+
+
+def _parse_celdas(celdas: str) -> Tuple[int, int, Optional[int], Optional[int]]:
+    """A1 => (fila0, col0, fila1, col1), 1-based e inclusivo; None = hasta el final.
+
+    "A2:C" => (2, 1, None, 3); "1:1" => (1, 1, 1, None); "A5" => (5, 1, 5, 1).
+    Como la API, rechaza extremos que mezclan celda y fila sola ("A5:9")."""
+    a, _, b = celdas.partition(":")
+    ma, mb = _A1.match(a), _A1.match(b or a)
+    if not ma or not mb or not a or (b and bool(ma.group(1)) != bool(mb.group(1))):
+        raise ValueError(f"rango inválido: {celdas}")
+    c0 = _col_num(ma.group(1)) if ma.group(1) else 1
+    r0 = int(ma.group(2)) if ma.group(2) else 1
+    c1 = _col_num(mb.group(1)) if mb.group(1) else None
+    r1 = int(mb.group(2)) if mb.group(2) else None
+    if r0 < 1 or (r1 is not None and r1 < 1):
+        raise ValueError(f"rango inválido: {celdas}")
+    if not b:   # una sola celda (o fila / columna sola)
+        c1 = c0 if ma.group(1) else None
+        r1 = r0 if ma.group(2) else None
+    return r0, c0, r1, c1
+
+
+def _texto(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _recortar(filas: List[List[str]]) -> List[List[str]]:
+    """Como la API: sin celdas vacías al final de cada fila ni filas vacías al final."""
+    out = []
+    for f in filas:
+        n = len(f)
+        while n and f[n - 1] == "":
+            n -= 1
+        out.append(f[:n] if n < len(f) else f)
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+
+def _tam(obj: Any) -> int:
+    """Bytes del payload JSON (solo valores / respuestas; los objetos de metadata no cuentan)."""
+    if not obj or not isinstance(obj, (list, dict)):
+        return 0
+    return len(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _letras(n: int) -> str:
+    out = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        out = chr(65 + r) + out
+    return out
+
+
+# =========================
+#  Datos
+# =========================
+class _Hoja:
+    """Grilla de una pestaña: valores (str) + tamaño de la grilla (como row_count/col_count)."""
+    def __init__(self, titulo: str, filas: int = 0, cols: int = 0, datos: Optional[List[List[str]]] = None):
+        self.titulo = titulo
+        self.datos: List[List[str]] = datos or []
+        self.filas = max(filas, len(self.datos))
+        self.cols = max([cols] + [len(f) for f in self.datos])
+        self.lock = threading.RLock()
+
+    def leer(self, r0: int, c0: int, r1: Optional[int], c1: Optional[int]) -> List[List[str]]:
+        with self.lock:
+            r1 = len(self.datos) if r1 is None else min(r1, len(self.datos))
+            return _recortar([list(f[c0 - 1:c1]) for f in self.datos[r0 - 1:r1]])
+
+    def escribir(self, r0: int, c0: int, valores: List[List[Any]]):
+        with self.lock:
+            for i, fila in enumerate(valores):
+                r = r0 - 1 + i
+                while len(self.datos) <= r:
+                    self.datos.append([])
+                destino = self.datos[r]
+                fin = c0 - 1 + len(fila)
+                if len(destino) < fin:
+                    destino.extend([""] * (fin - len(destino)))
+                destino[c0 - 1:fin] = [_texto(v) for v in fila]
+                self.cols = max(self.cols, fin)
+            self.filas = max(self.filas, len(self.datos))
+
+    def ultima_fila(self) -> int:
+        with self.lock:
+            return len(_recortar(self.datos))
+
+    def limpiar(self):
+        with self.lock:
+            self.datos = []
+
+    def redimensionar(self, filas: Optional[int], cols: Optional[int]):
+        with self.lock:
+            if filas is not None:
+                self.filas = filas
+                del self.datos[filas:]
+            if cols is not None:
+                self.cols = cols
+                for f in self.datos:
+                    del f[cols:]
+
+
+class _Libro:
+    def __init__(self, sheet_id: str):
+        self.id = sheet_id
+        self.hojas: Dict[str, _Hoja] = {}
+        self.lock = threading.Lock()
+
+
+def _leer_archivos(directorio: str, sheet_id: str) -> Dict[str, List[List[str]]]:
+    """{hoja: filas} desde <dir>/<id>/*.csv, <dir>/<id>.xlsx o <dir>/*.csv."""
+    if not directorio:
+        return {}
+    out: Dict[str, List[List[str]]] = {}
+    xlsx = os.path.join(directorio, f"{sheet_id}.xlsx")
+    if os.path.isfile(xlsx):
+        from openpyxl import load_workbook
+        wb = load_workbook(xlsx, read_only=True, data_only=True)
+        for ws in wb.worksheets:
+            out[ws.title] = [[_texto(v) for v in fila] for fila in ws.iter_rows(values_only=True)]
+        wb.close()
+        return out
+    carpeta = os.path.join(directorio, sheet_id)
+    archivos = glob.glob(os.path.join(carpeta, "*.csv")) or glob.glob(os.path.join(directorio, "*.csv"))
+    for path in archivos:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            out[os.path.splitext(os.path.basename(path))[0]] = [list(r) for r in csv.reader(f)]
+    return out
+
+
+# =========================
+#  Backend
+# =========================
+class FakeSheets:
+    """Estado compartido (libros en memoria) + simulación de costo y 429 por llamada."""
+    def __init__(self, directorio: str = "", latencia_ms: float = 0, ms_por_kb: float = 0,
+                 jitter_ms: float = 0, prob_429: float = 0, cada_429: int = 0, cuota_min: int = 0,
+                 semilla: int = 0, medir: Optional[Medir] = None, dormir: Callable[[float], None] = time.sleep):
+        self.directorio = directorio
+        self.latencia_ms = latencia_ms
+        self.ms_por_kb = ms_por_kb
+        self.jitter_ms = jitter_ms
+        self.prob_429 = prob_429
+        self.cada_429 = cada_429
+        self.cuota_min = cuota_min
+        self.medir = medir
+        self.dormir = dormir
+        self._rng = random.Random(semilla)
+        self._libros: Dict[str, _Libro] = {}
+        self._lock = threading.Lock()
+        self._recientes: deque = deque()   # timestamps para la cuota por minuto
+        self.llamadas = 0
+        self.rechazadas = 0
+        self.cliente = _FakeClient(self)
+        self.values = _FakeValues(self)
+
+    @classmethod
+    def desde_entorno(cls, medir: Optional[Medir] = None) -> "FakeSheets":
+        e = os.getenv
+        return cls(
+            directorio=e("SHEETS_FAKE_DIR", ""),
+            latencia_ms=float(e("SHEETS_FAKE_LATENCIA_MS", "0")),
+            ms_por_kb=float(e("SHEETS_FAKE_MS_POR_KB", "0")),
+            jitter_ms=float(e("SHEETS_FAKE_JITTER_MS", "0")),
+            prob_429=float(e("SHEETS_FAKE_PROB_429", "0")),
+            cada_429=int(e("SHEETS_FAKE_429_CADA", "0")),
+            cuota_min=int(e("SHEETS_FAKE_CUOTA_MIN", "0")),
+            semilla=int(e("SHEETS_FAKE_SEMILLA", "0")),
+            medir=medir,
+        )
+
+    # ---------- datos ----------
+    def libro(self, sheet_id: str) -> _Libro:
+        with self._lock:
+            lb = self._libros.get(sheet_id)
+            if lb is None:
+                lb = self._libros[sheet_id] = _Libro(sheet_id)
+                for titulo, filas in _leer_archivos(self.directorio, sheet_id).items():
+                    lb.hojas[titulo] = _Hoja(titulo, datos=filas)
+            return lb
+
+    def hoja(self, sheet_id: str, titulo: str) -> Optional[_Hoja]:
+        return self.libro(sheet_id).hojas.get(titulo)
+
+    def cargar(self, sheet_id: str, titulo: str, filas: Iterable[Iterable[Any]]):
+        """Crea/reemplaza una pestaña en memoria (la primera fila es el header)."""
+        lb = self.libro(sheet_id)
+        with lb.lock:
+            lb.hojas[titulo] = _Hoja(titulo, datos=[[_texto(v) for v in f] for f in filas])
+
+    def cargar_df(self, sheet_id: str, titulo: str, df):
+        self.cargar(sheet_id, titulo, [list(df.columns), *df.fillna("").astype(str).values.tolist()])
+
+    # ---------- costo / 429 ----------
+    def _toca_429(self) -> bool:
+        with self._lock:
+            self.llamadas += 1
+            if self.cada_429 and self.llamadas % self.cada_429 == 0:
+                return True
+            if self.cuota_min:
+                ahora = time.monotonic()
+                while self._recientes and ahora - self._recientes[0] >= 60:
+                    self._recientes.popleft()
+                if len(self._recientes) >= self.cuota_min:
+                    return True
+                self._recientes.append(ahora)
+            return bool(self.prob_429) and self._rng.random() < self.prob_429
+
+    def _demora(self, nbytes: int) -> float:
+        ms = self.latencia_ms + nbytes / 1024 * self.ms_por_kb
+        if self.jitter_ms:
+            with self._lock:
+                ms += self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(ms, 0) / 1000
+
+    def llamar(self, api: str, metodo: str, fn: Callable[[], Any], enviado: Any = None) -> Any:
+        """Ejecuta `fn` como una llamada a la API: 429 simulado, demora por latencia + bytes, métricas."""
+        t0 = time.perf_counter()
+        enviados = _tam(enviado)
+        recibidos, status = 0, 200
+        try:
+            if self._toca_429():
+                status = 429
+                self.rechazadas += 1
+                self.dormir(self._demora(enviados))
+                raise _error(api, 429, "RESOURCE_EXHAUSTED", f"Quota exceeded (fake) en {metodo}")
+            try:
+                resultado = fn()
+            except (APIError, HttpError) as e:
+                status = getattr(getattr(e, "resp", None), "status", None) or getattr(e, "code", 500)
+                raise
+            recibidos = _tam(resultado)
+            self.dormir(self._demora(enviados + recibidos))
+            return resultado
+        finally:
+            if self.medir is not None:
+                self.medir(metodo, time.perf_counter() - t0, int(status), enviados, recibidos)
+
+
+def _error(api: str, status: int, estado: str, mensaje: str) -> Exception:
+    cuerpo = json.dumps({"error": {"code": status, "message": mensaje, "status": estado}}).encode()
+    if api == "values":
+        return HttpError(httplib2.Response({"status": status}), cuerpo)
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = cuerpo
+    return APIError(resp)
+
+
+# =========================
+#  Superficie gspread
+# =========================
+class _FakeClient:
+    def __init__(self, fake: FakeSheets):
+        self._fake = fake
+
+    def open_by_key(self, sheet_id: str) -> "_FakeSpreadsheet":
+        lb = self._fake.llamar("gspread", "spreadsheets.get", lambda: self._fake.libro(sheet_id))
+        return _FakeSpreadsheet(self._fake, lb)
+
+
+class _FakeSpreadsheet:
+    def __init__(self, fake: FakeSheets, libro: _Libro):
+        self._fake = fake
+        self._libro = libro
+        self.id = libro.id
+
+    def worksheet(self, title: str) -> "_FakeWorksheet":
+        def buscar():
+            h = self._libro.hojas.get(title)
+            if h is None:
+                raise WorksheetNotFound(title)
+            return h
+        return _FakeWorksheet(self._fake, self, self._fake.llamar("gspread", "spreadsheets.get", buscar))
+
+    def worksheets(self) -> List["_FakeWorksheet"]:
+        return [_FakeWorksheet(self._fake, self, h) for h in list(self._libro.hojas.values())]
+
+    def add_worksheet(self, title: str, rows: int, cols: int, index: Optional[int] = None) -> "_FakeWorksheet":
+        def crear():
+            with self._libro.lock:
+                if title in self._libro.hojas:
+                    raise _error("gspread", 400, "INVALID_ARGUMENT", f'A sheet with the name "{title}" already exists.')
+                h = self._libro.hojas[title] = _Hoja(title, int(rows), int(cols))
+                return h
+        return _FakeWorksheet(self._fake, self, self._fake.llamar("gspread", "spreadsheets.batchUpdate", crear))
+
+    def del_worksheet(self, worksheet: "_FakeWorksheet"):
+        def borrar():
+            with self._libro.lock:
+                self._libro.hojas.pop(worksheet.title, None)
+        self._fake.llamar("gspread", "spreadsheets.batchUpdate", borrar)
+
+
+class _FakeWorksheet:
+    def __init__(self, fake: FakeSheets, spreadsheet: _FakeSpreadsheet, hoja: _Hoja):
+        self._fake = fake
+        self._hoja = hoja
+        self.spreadsheet = spreadsheet
+        self.spreadsheet_id = spreadsheet.id
+
+    @property
+    def title(self) -> str:
+        return self._hoja.titulo
+
+    @property
+    def row_count(self) -> int:
+        return self._hoja.filas
+
+    @property
+    def col_count(self) -> int:
+        return self._hoja.cols
+
+    def row_values(self, row: int, **_) -> List[str]:
+        filas = self._fake.llamar("gspread", "values.get", lambda: self._hoja.leer(row, 1, row, None))
+        return filas[0] if filas else []
+
+    def get_all_values(self, **_) -> List[List[str]]:
+        filas = self._fake.llamar("gspread", "values.get", lambda: self._hoja.leer(1, 1, None, None))
+        n = max((len(f) for f in filas), default=0)   # gspread rellena a rectángulo
+        return [f + [""] * (n - len(f)) for f in filas]
+
+    def batch_get(self, ranges: Iterable[str], **_) -> List[List[List[str]]]:
+        def leer():
+            return [self._hoja.leer(*_parse_celdas(_separar_hoja(r)[1])) for r in ranges if r]
+        return self._fake.llamar("gspread", "values.batchGet", leer)
+
+    def clear(self):
+        self._fake.llamar("gspread", "values.clear", self._hoja.limpiar)
+
+    def resize(self, rows: Optional[int] = None, cols: Optional[int] = None):
+        self._fake.llamar("gspread", "spreadsheets.batchUpdate", lambda: self._hoja.redimensionar(rows, cols))
+
+    def update_cells(self, cell_list, value_input_option: str = "RAW"):
+        celdas = [(c.row, c.col, c.value) for c in cell_list]
+
+        def escribir():
+            for r, c, v in celdas:
+                self._hoja.escribir(r, c, [[v]])
+        return self._fake.llamar("gspread", "values.batchUpdate", escribir, enviado=[v for _, _, v in celdas])
+
+
+# =========================
+#  Superficie API v4 (spreadsheets().values())
+# =========================
+class _Peticion:
+    def __init__(self, fn: Callable[[], Any]):
+        self._fn = fn
+
+    def execute(self, **_) -> Any:
+        return self._fn()
+
+
+class _FakeValues:
+    def __init__(self, fake: FakeSheets):
+        self._fake = fake
+
+    def _hoja_de(self, sheet_id: str, rango: str) -> Tuple[_Hoja, str]:
+        titulo, celdas = _separar_hoja(rango)
+        h = self._fake.hoja(sheet_id, titulo) if titulo is not None else None
+        if h is None:
+            raise _error("values", 400, "INVALID_ARGUMENT", f"Unable to parse range: {rango}")
+        return h, celdas
+
+    def _leer(self, sheet_id: str, rango: str) -> Dict[str, Any]:
+        h, celdas = self._hoja_de(sheet_id, rango)
+        out: Dict[str, Any] = {"range": rango, "majorDimension": "ROWS"}
+        try:
+            limites = _parse_celdas(celdas)
+        except ValueError:
+            raise _error("values", 400, "INVALID_ARGUMENT", f"Unable to parse range: {rango}") from None
+        valores = h.leer(*limites)
+        if valores:
+            out["values"] = valores
+        return out
+
+    def get(self, spreadsheetId: str, range: str, **_) -> _Peticion:
+        return _Peticion(lambda: self._fake.llamar("values", "values.get", lambda: self._leer(spreadsheetId, range)))
+
+    def batchGet(self, spreadsheetId: str, ranges: List[str], **_) -> _Peticion:
+        def leer():
+            return {"spreadsheetId": spreadsheetId, "valueRanges": [self._leer(spreadsheetId, r) for r in ranges]}
+        return _Peticion(lambda: self._fake.llamar("values", "values.batchGet", leer))
+
+    def update(self, spreadsheetId: str, range: str, body: Dict[str, Any], valueInputOption: str = "RAW", **_) -> _Peticion:
+        def escribir():
+            h, celdas = self._hoja_de(spreadsheetId, range)
+            r0, c0, _, _ = _parse_celdas(celdas)
+            valores = body.get("values", [])
+            h.escribir(r0, c0, valores)
+            return {"spreadsheetId": spreadsheetId, "updatedRange": range,
+                    "updatedRows": len(valores), "updatedCells": sum(len(f) for f in valores)}
+        return _Peticion(lambda: self._fake.llamar("values", "values.update", escribir, enviado=body))
+
+    def append(self, spreadsheetId: str, range: str, body: Dict[str, Any], valueInputOption: str = "RAW",
+               insertDataOption: str = "INSERT_ROWS", **_) -> _Peticion:
+        def agregar():
+            h, celdas = self._hoja_de(spreadsheetId, range)
+            _, c0, _, _ = _parse_celdas(celdas)
+            valores = body.get("values", [])
+            with h.lock:
+                r0 = h.ultima_fila() + 1
+                h.escribir(r0, c0, valores)
+            ancho = max((len(f) for f in valores), default=1)
+            rng = f"'{h.titulo}'!{_letras(c0)}{r0}:{_letras(c0 + ancho - 1)}{r0 + len(valores) - 1}"
+            return {"spreadsheetId": spreadsheetId, "updates": {"updatedRange": rng, "updatedRows": len(valores)}}
+        return _Peticion(lambda: self._fake.llamar("values", "values.append", agregar, enviado=body))
@@ -0,0 +1,93 @@
+# tests/conftest.py
+"""
+Fixtures comunes: la app corre contra sheets_fake.FakeSheets (sin red ni credenciales).
+
+    def test_algo(fake, cliente):       # cliente = TestClient con sesión de usuario
+        fake.cargar(SHEET_ID, "Bases POP", [["POP", "Nombre"], ["P1", "Uno"]])
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ["SHEETS_BACKEND"] = "fake"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["SECRET_KEY"] = "tests-secret"
+os.environ["UPLOAD_USERS"] = "carga@test:clave"
+os.environ["USUARIOS_JOURNAL"] = os.path.join(tempfile.mkdtemp(), "usuarios.journal")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+USUARIO_CARGA = ("carga@test", "clave")
+
+
+@pytest.fixture
+def fake():
+    """FakeSheets vacío enchufado al cliente; caches de main limpias antes y después."""
+    import conector_sheets
+    import main
+    from conector_sheets import client
+    from sheets_fake import FakeSheets
+
+    previo = client._fake
+    fk = FakeSheets()
+    client.usar_backend(fk)
+    conector_sheets._sin_indice.clear()
+    _limpiar(main)
+    yield fk
+    _limpiar(main)
+    client.usar_backend(previo)
+
+
+def _limpiar(main):
+    main.invalidate_cache(list(main.data_cache))
+    with main._cache_lock:
+        main.result_cache.clear()
+        main.xlsx_cache.clear()
+    main.TEMP_UPLOADS.clear()
+
+
+def cookie_sesion(email: str):
+    """(nombre, valor) de una cookie de sesión firmada como AppMiddleware (sin pasar por login)."""
+    from middleware import AppMiddleware
+    mw = AppMiddleware(None, secret_key=os.environ["SECRET_KEY"], session_cookie="bi_session")
+    nombre, _, resto = mw._cookie_header({"user_email": email, "login_ts": time.time()}).partition("=")
+    return nombre, resto.split(";", 1)[0]
+
+
+@pytest.fixture
+def cliente(fake):
+    import main
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as c:
+        c.cookies.set(*cookie_sesion("usuario@test"))
+        yield c
+
+
+POPS = ["P001", "P002", "P003", "P004", "P005"]
+EXPORT_HEADERS = ["POP", "Celda", "Banda", "Región"]
+
+
+def filas_export(hoja: str):
+    """Filas intercaladas por POP (la carga "ordenar por POP" las agrupa e indexa)."""
+    return [[pop, f"{hoja}-{pop}-{i}", str(700 + i), "RM"] for i in range(3) for pop in POPS]
+
+
+@pytest.fixture
+def datos(fake):
+    """Hojas mínimas de la app; las Export_* cargadas ordenadas por POP (con hoja `_idx`)."""
+    import main
+    import usuarios
+    from conector_sheets import escribir_hoja_stream_por_pop
+
+    fake.cargar(main.SHEET_ID, "Bases POP", [["POP", "Nombre", "Comuna", "Región"]] +
+                [[p, f"Sitio {p}", "Maipú", "RM"] for p in POPS])
+    fake.cargar(main.SHEET_ID, "Directorio", [["POP", "Nombre", "Tipo"]] + [[p, f"Dir {p}", "Torre"] for p in POPS])
+    fake.cargar(main.SHEET_ID, "Proyecto_RANCO", [["POP", "Estado"]] + [[p, "OK"] for p in POPS])
+    fake.cargar(main.SHEET_ID, "Base Hardware", [["POP", "SITE ID"]] + [[p, f"S{i}"] for i, p in enumerate(POPS)])
+    fake.cargar(main.SHEET_ID, usuarios.USERS_SHEET, [usuarios.COLUMNS])
+    for hoja, _ in main.HOJAS_EXPORT.values():
+        escribir_hoja_stream_por_pop(main.SHEET_ID, hoja, [EXPORT_HEADERS, *filas_export(hoja)])
+    return fake
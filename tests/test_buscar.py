@@ -0,0 +1,148 @@
+# tests/test_buscar.py
+"""/buscar y /api/buscar con las hojas Export_* leídas por su hoja índice (`<hoja>_idx`)."""
+import pytest
+
+import conector_sheets
+from conftest import POPS, filas_export
+
+
+@pytest.fixture
+def solo_indice(monkeypatch):
+    """Falla si el lector cae al escaneo: la lectura tiene que salir del índice."""
+    def escaneo(self, *a, **kw):
+        raise AssertionError(f"{self.sheet_name}: se escaneó en vez de usar el índice")
+    monkeypatch.setattr(conector_sheets.PopFilteredReader, "_leer_por_escaneo", escaneo)
+
+
+def test_export_tiene_indice(datos):
+    import main
+    for hoja, _ in main.HOJAS_EXPORT.values():
+        idx = datos.hoja(main.SHEET_ID, conector_sheets.nombre_indice(hoja))
+        assert idx is not None
+        assert [f[0] for f in idx.datos[1:]] == sorted(POPS)
+
+
+def test_api_buscar_export_por_indice(datos, cliente, solo_indice):
+    r = cliente.get("/api/buscar", params={"codigo": "p003", "secciones": "export_4g,export_2g",
+                                           "formato": "filas"})
+    assert r.status_code == 200, r.text
+    sec = r.json()["secciones"]
+    for clave, hoja in (("export_4g", "Export_4G"), ("export_2g", "Export_2G")):
+        esperadas = sorted(f[1] for f in filas_export(hoja) if f[0] == "P003")
+        assert sec[clave]["total"] == 3
+        assert sorted(f["CELDA"] for f in sec[clave]["filas"]) == esperadas
+
+
+def test_buscar_completo_por_indice(datos, cliente, solo_indice):
+    r = cliente.get("/buscar", params={"codigo": "P002", "completo": 1})
+    assert r.status_code == 200
+    assert "Export_5G-P002-0" in r.text
+    assert "Export_3G-P002-2" in r.text
+    assert "Export_5G-P001-0" not in r.text
+
+
+def test_buscar_progresivo_y_secciones(datos, cliente, solo_indice):
+    r = cliente.get("/buscar", params={"codigo": "P005"})
+    assert r.status_code == 200
+    assert "Sitio P005" in r.text
+    r = cliente.get("/api/buscar", params={"codigo": "P005", "secciones": "export_5g", "offset": 0, "limite": 2})
+    assert r.status_code == 200
+    assert r.json()["secciones"]["export_5g"]["total"] == 3
+
+
+def test_buscar_sin_sesion_redirige(datos):
+    import main
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as c:
+        r = c.get("/buscar", params={"codigo": "P001"}, follow_redirects=False)
+    assert r.status_code == 302
+
+
+@pytest.mark.parametrize("ruta,params", [
+    ("/buscar", {"codigo": "P001"}),
+    ("/api/buscar", {"codigo": "P001", "secciones": "bases,export_4g"}),
+])
+def test_etag_304_y_cambia_con_datos_y_build(datos, cliente, monkeypatch, ruta, params):
+    import main
+    r = cliente.get(ruta, params=params)
+    etag = r.headers["ETag"]
+    assert r.status_code == 200 and main._BUILD_ID in etag
+    r = cliente.get(ruta, params=params, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.headers["ETag"] == etag
+
+    # una carga cambia los datos y sube data_version: el ETag viejo ya no valida
+    datos.cargar(main.SHEET_ID, "Bases POP", [["POP", "Nombre", "Comuna", "Región"],
+                                             ["P001", "Sitio renombrado", "Maipú", "RM"]])
+    main.invalidate_cache(["Bases POP"])
+    r = cliente.get(ruta, params=params, headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+    etag = r.headers["ETag"]
+
+    # mismo contenido pero otro deploy: tampoco 304
+    monkeypatch.setattr(main, "_BUILD_ID", "otrobuild")
+    r = cliente.get(ruta, params=params, headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+
+
+# ---------- /api/buscar: forma del JSON ----------
+def test_a_columnas_y_a_filas():
+    from respuestas import a_columnas, a_filas
+    rows = [{"POP": "P1", "Nombre": "Uno"}, {"POP": "P2", "Extra": 3}, {"POP": "P3", "Nombre": "Tres"}]
+    assert a_columnas(rows) == {"total": 3, "columnas": {"POP": ["P1", "P2", "P3"],
+                                                          "Nombre": ["Uno", "", "Tres"], "Extra": ["", 3, ""]}}
+    # columnas estables al paginar: salen de todas las filas, no solo de la página
+    assert a_columnas(rows, offset=2, limite=1) == {"total": 3, "offset": 2, "limite": 1, "columnas": {
+        "POP": ["P3"], "Nombre": ["Tres"], "Extra": [""]}}
+    assert a_columnas(rows, ["nombre", "pop", "noexiste"])["columnas"] == {"Nombre": ["Uno", "", "Tres"],
+                                                                           "POP": ["P1", "P2", "P3"]}
+    assert a_filas(rows, offset=1) == {"total": 3, "offset": 1, "limite": 0, "filas": rows[1:]}
+    assert a_filas(rows, ["POP"], limite=2)["filas"] == [{"POP": "P1"}, {"POP": "P2"}]
+
+
+def test_dumps_con_y_sin_orjson(monkeypatch):
+    import json
+    import numpy as np
+    import respuestas
+    obj = {"txt": "Maipú", "n": 1, "f": 1.5, "np": np.int64(7), "ids": np.arange(3), "lista": [None, True]}
+    esperado = {"txt": "Maipú", "n": 1, "f": 1.5, "np": 7, "ids": [0, 1, 2], "lista": [None, True]}
+    assert json.loads(respuestas.dumps(obj)) == esperado
+    monkeypatch.setattr(respuestas, "orjson", None)
+    assert json.loads(respuestas.dumps(obj)) == esperado
+
+
+def test_api_buscar_forma(datos, cliente):
+    r = cliente.get("/api/buscar", params={"codigo": " p004 ", "secciones": "bases,export_3g"})
+    assert r.status_code == 200 and r.headers["content-type"] == "application/json"
+    body = r.json()
+    assert body["codigo"] == "P004"
+    assert list(body["secciones"]) == ["bases", "export_3g"]
+    bases = body["secciones"]["bases"]
+    assert bases["total"] == 1 and bases["columnas"]["Nombre"] == ["Sitio P004"]
+    exp = body["secciones"]["export_3g"]
+    assert exp["total"] == 3 and all(len(v) == 3 for v in exp["columnas"].values())
+
+
+def test_api_buscar_campos_y_paginacion(datos, cliente):
+    r = cliente.get("/api/buscar", params=[("codigo", "P001"), ("secciones", "bases,export_2g"),
+                                           ("formato", "filas"), ("offset", 1), ("limite", 1),
+                                           ("campos", "POP"), ("campos", "export_2g:celda,banda")])
+    sec = r.json()["secciones"]
+    assert sec["bases"] == {"total": 1, "offset": 1, "limite": 1, "filas": []}
+    assert sec["export_2g"]["total"] == 3
+    assert [list(f) for f in sec["export_2g"]["filas"]] == [["CELDA", "BANDA"]]
+
+
+@pytest.mark.parametrize("params,status", [
+    ({"codigo": ""}, 400),
+    ({"codigo": "P001", "secciones": "bases,nada"}, 400),
+])
+def test_api_buscar_errores(datos, cliente, params, status):
+    r = cliente.get("/api/buscar", params=params)
+    assert r.status_code == status and "error" in r.json()
+
+
+def test_api_buscar_sin_sesion(datos):
+    import main
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as c:
+        assert c.get("/api/buscar", params={"codigo": "P001"}).status_code == 401
@@ -0,0 +1,104 @@
+# tests/test_carga.py
+"""/carga: preview + confirmar, rama Export_* (varias hojas) y rama de hoja simple."""
+import io
+import re
+
+import pytest
+
+from conftest import USUARIO_CARGA
+
+TOKEN = re.compile(r'name="token" value="([^"]+)"')
+
+
+def _xlsx(hojas):
+    from openpyxl import Workbook
+    wb = Workbook()
+    wb.remove(wb.active)
+    for titulo, filas in hojas.items():
+        ws = wb.create_sheet(titulo)
+        for f in filas:
+            ws.append(f)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _preview(c, tipo, contenido, **data):
+    r = c.post(f"/carga/{tipo}", auth=USUARIO_CARGA, data=data,
+               files={"file": (f"{tipo}.xlsx", contenido, "application/octet-stream")})
+    assert r.status_code == 200
+    assert 'class="error"' not in r.text, r.text
+    m = TOKEN.search(r.text)
+    assert m, "el preview no trae token de confirmación"
+    return m.group(1)
+
+
+def _confirmar(c, tipo, token, **data):
+    r = c.post(f"/carga/{tipo}", auth=USUARIO_CARGA, data={"confirmar": "si", "token": token, **data})
+    assert r.status_code == 200
+    assert 'class="error"' not in r.text, r.text
+    return r
+
+
+@pytest.fixture
+def sin_pausa(monkeypatch):
+    """La rama Export duerme 2 s entre hojas (cuota de Sheets); en los tests no."""
+    import main
+
+    async def no_dormir(_):
+        return None
+    monkeypatch.setattr(main.asyncio, "sleep", no_dormir)
+
+
+def test_carga_requiere_basic(cliente):
+    assert cliente.post("/carga/ranco").status_code == 401
+
+
+@pytest.mark.parametrize("tipo,hoja", [("ranco", "Proyecto_RANCO"), ("bases", "Bases POP")])
+def test_carga_hoja_simple(datos, cliente, tipo, hoja):
+    import main
+    filas = [["POP", "Estado"], ["N001", "Nuevo"], ["N002", None]]
+    antes = [f[:] for f in datos.hoja(main.SHEET_ID, hoja).datos]
+    token = _preview(cliente, tipo, _xlsx({"Hoja1": filas}))
+    assert datos.hoja(main.SHEET_ID, hoja).datos == antes  # el preview no escribe
+    v0 = main.data_version.get(hoja, 0)
+
+    r = _confirmar(cliente, tipo, token)
+    assert "Actualizado" in r.text
+    escritas = [[v for v in f if v] for f in datos.hoja(main.SHEET_ID, hoja).datos[:3]]
+    assert escritas == [["POP", "Estado"], ["N001", "Nuevo"], ["N002"]]
+    assert main.data_version[hoja] > v0
+    assert token not in main.TEMP_UPLOADS
+
+
+def test_carga_sin_pop_no_escribe(datos, cliente):
+    import main
+    antes = [f[:] for f in datos.hoja(main.SHEET_ID, "Proyecto_RANCO").datos]
+    token = _preview(cliente, "ranco", _xlsx({"Hoja1": [["Sitio", "Estado"], ["X", "Y"]]}))
+    r = cliente.post("/carga/ranco", auth=USUARIO_CARGA, data={"confirmar": "si", "token": token})
+    assert "falta columna POP" in r.text
+    assert datos.hoja(main.SHEET_ID, "Proyecto_RANCO").datos == antes
+
+
+@pytest.mark.parametrize("ordenar", ["si", "no"])
+def test_carga_export(datos, cliente, sin_pausa, ordenar):
+    import main
+    from conector_sheets import nombre_indice
+    filas = [["POP", "Celda"], ["B", "b1"], ["A", "a1"], ["B", "b2"]]
+    token = _preview(cliente, "export", _xlsx({"Export_4G": filas, "Export_2G": filas}))
+
+    r = _confirmar(cliente, "export", token, ordenar_pop=ordenar)
+    assert "Saltado" in r.text  # Export_5G / Export_3G no venían en el archivo
+    for hoja in ("Export_4G", "Export_2G"):
+        datos_hoja = datos.hoja(main.SHEET_ID, hoja).datos
+        idx = datos.hoja(main.SHEET_ID, nombre_indice(hoja))
+        if ordenar == "si":
+            assert [f[0] for f in datos_hoja[1:4]] == ["A", "B", "B"]
+            assert idx is not None and [f[0] for f in idx.datos[1:]] == ["A", "B"]
+        else:
+            assert [f[0] for f in datos_hoja[1:4]] == ["B", "A", "B"]
+            assert idx is None  # el índice anterior ya no sirve
+
+    # la búsqueda ve lo recién cargado (por índice o por escaneo)
+    j = cliente.get("/api/buscar", params={"codigo": "b", "secciones": "export_4g", "formato": "filas"}).json()
+    assert sorted(f["CELDA"] for f in j["secciones"]["export_4g"]["filas"]) == ["b1", "b2"]
@@ -0,0 +1,225 @@
+# tests/test_concurrencia.py
+"""LimiteConcurrencia (cupos global / por clave) y Coalescedor (singleflight)."""
+import threading
+import time
+
+import pytest
+
+from concurrencia import Coalescedor, LimiteConcurrencia, Ocupado
+
+
+def _en_hilos(n, fn):
+    """Corre fn(i) en n hilos a la vez; devuelve {i: resultado o excepción}."""
+    out = {}
+    barrera = threading.Barrier(n)
+
+    def correr(i):
+        barrera.wait()
+        try:
+            out[i] = fn(i)
+        except Exception as e:
+            out[i] = e
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(10)
+    return out
+
+
+# ---------- LimiteConcurrencia ----------
+def test_limite_global():
+    lim = LimiteConcurrencia(2)
+    a, b = lim.adquirir(), lim.adquirir()
+    with pytest.raises(Ocupado, match="global"):
+        lim.adquirir()
+    assert lim.rechazos == 1
+    lim.liberar(a)
+    lim.liberar(lim.adquirir())
+    lim.liberar(b)
+    assert lim.en_curso == 0
+
+
+def test_limite_por_clave():
+    lim = LimiteConcurrencia(10, caps={"usuario": 1})
+    with lim.cupo(usuario="a"):
+        with pytest.raises(Ocupado, match="usuario"):
+            lim.adquirir(usuario="a")
+        with lim.cupo(usuario="b"):
+            assert lim.en_curso == 2
+        with lim.cupo(usuario=None):   # sin clave: solo cuenta el global
+            pass
+    assert lim.en_curso == 0
+    lim.liberar(lim.adquirir(usuario="a"))
+
+
+def test_cupo_libera_con_error():
+    lim = LimiteConcurrencia(1, caps={"usuario": 1})
+    with pytest.raises(ValueError):
+        with lim.cupo(usuario="a"):
+            raise ValueError
+    assert lim.en_curso == 0
+    lim.liberar(lim.adquirir(usuario="a"))
+
+
+# ---------- Coalescedor ----------
+def test_coalescedor_una_ejecucion():
+    co = Coalescedor()
+    llamadas = []
+
+    def lento():
+        llamadas.append(1)
+        time.sleep(0.2)
+        return object()
+
+    out = _en_hilos(8, lambda i: co.ejecutar("k", lento))
+    assert len(llamadas) == 1
+    assert len({id(v) for v in out.values()}) == 1
+    assert co.ejecuciones == 1 and co.compartidas == 7
+    assert co.en_vuelo == 0
+    co.ejecutar("k", lento)   # terminado el vuelo, la clave vuelve a ejecutar
+    assert len(llamadas) == 2
+
+
+def test_coalescedor_claves_distintas():
+    co = Coalescedor()
+    out = _en_hilos(4, lambda i: co.ejecutar(i, lambda: (time.sleep(0.05), i)[1]))
+    assert out == {0: 0, 1: 1, 2: 2, 3: 3}
+    assert co.ejecuciones == 4
+
+
+def test_coalescedor_error_compartido_en_copias():
+    co = Coalescedor()
+
+    def falla():
+        time.sleep(0.2)
+        raise KeyError("x")
+
+    out = _en_hilos(5, lambda i: co.ejecutar("k", falla))
+    errores = list(out.values())
+    assert all(isinstance(e, KeyError) for e in errores)
+    assert len({id(e) for e in errores}) == 5   # nunca la misma instancia en dos hilos
+    assert co.en_vuelo == 0
+
+
+def test_coalescedor_ocupado_no_se_comparte():
+    """El cupo agotado del usuario del líder no se reparte a los seguidores de otros usuarios."""
+    lim = LimiteConcurrencia(10, caps={"usuario": 1})
+    co = Coalescedor(no_compartir=(Ocupado,))
+    ocupado_a = lim.adquirir(usuario="a")   # "a" ya está en su tope
+    empezo = threading.Event()
+
+    def calcular(usuario):
+        def fn():
+            empezo.set()
+            with lim.cupo(usuario=usuario):
+                time.sleep(0.1)
+                return usuario
+        return fn
+
+    out = {}
+
+    def pedir(u):
+        try:
+            out[u] = co.ejecutar("pop", calcular(u))
+        except Ocupado as e:
+            out[u] = e
+    lider = threading.Thread(target=pedir, args=("a",))
+    lider.start()
+    empezo.wait(5)
+    seguidor = threading.Thread(target=pedir, args=("b",))
+    seguidor.start()
+    lider.join(5)
+    seguidor.join(5)
+    lim.liberar(ocupado_a)
+    assert isinstance(out["a"], Ocupado)
+    assert out["b"] == "b"
+
+
+def test_coalescedor_espera_acotada():
+    """Un líder colgado no retiene a los seguidores: pasado `espera` reciben Ocupado."""
+    co = Coalescedor(espera=0.1)
+    suelta = threading.Event()
+    lider = threading.Thread(target=co.ejecutar, args=("k", lambda: suelta.wait(5)))
+    lider.start()
+    while not co.en_vuelo:
+        time.sleep(0.01)
+    t0 = time.monotonic()
+    with pytest.raises(Ocupado, match="a tiempo"):
+        co.ejecutar("k", lambda: "no debería correr")
+    assert time.monotonic() - t0 < 2
+    suelta.set()
+    lider.join(5)
+    assert co.rechazos == 1 and co.en_vuelo == 0
+
+
+def test_coalescedor_tope_de_seguidores():
+    co = Coalescedor(max_esperando=2)
+    suelta = threading.Event()
+    lider = threading.Thread(target=co.ejecutar, args=("k", lambda: (suelta.wait(5), "ok")[1]))
+    lider.start()
+    while not co.en_vuelo:
+        time.sleep(0.01)
+    out = {}
+
+    def seguir(i):
+        try:
+            out[i] = co.ejecutar("k", lambda: "otro")
+        except Ocupado as e:
+            out[i] = e
+    hilos = [threading.Thread(target=seguir, args=(i,)) for i in range(4)]
+    for h in hilos:
+        h.start()
+    while co.rechazos < 2:
+        time.sleep(0.01)
+    suelta.set()
+    for h in hilos:
+        h.join(5)
+    lider.join(5)
+    assert list(out.values()).count("ok") == 2
+    assert sum(isinstance(v, Ocupado) for v in out.values()) == 2
+
+
+def test_resultados_pop_coalescidos(datos):
+    """Muchos /buscar del mismo POP en frío: una sola composición contra Sheets."""
+    import main
+    for h in main.HOJAS_CACHE:
+        main.get_data(h)
+    datos.latencia_ms = 50
+    e0, c0 = main._coalescedor.ejecuciones, main._coalescedor.compartidas
+    out = _en_hilos(6, lambda i: main.resultados_pop("P001", f"u{i}")["etag"])
+    assert len(set(out.values())) == 1
+    assert main._coalescedor.ejecuciones - e0 == 1
+    assert main._coalescedor.compartidas - c0 == 5
+
+
+def test_sin_cupo_503(datos, cliente, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "_limite_sheets", LimiteConcurrencia(1))
+    ocupado = main._limite_sheets.adquirir()
+    try:
+        r = cliente.get("/api/buscar", params={"codigo": "P004"})
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == str(main.SHEETS_RETRY_AFTER)
+        r = cliente.get("/buscar", params={"codigo": "P004", "completo": 1})
+        assert r.status_code == 503
+    finally:
+        main._limite_sheets.liberar(ocupado)
+    assert cliente.get("/api/buscar", params={"codigo": "P004"}).status_code == 200
+
+
+def test_secciones_en_memoria_sin_cupo(datos, cliente, monkeypatch):
+    """Bases POP / Directorio salen de get_data: se sirven aunque no haya cupo de Sheets."""
+    import main
+    for h in main.HOJAS_CACHE:
+        main.get_data(h)
+    monkeypatch.setattr(main, "_limite_sheets", LimiteConcurrencia(1))
+    ocupado = main._limite_sheets.adquirir()
+    try:
+        r = cliente.get("/buscar", params={"codigo": "P003"})
+        assert r.status_code == 200 and "Sitio P003" in r.text
+        r = cliente.get("/api/buscar", params={"codigo": "P003", "secciones": "directorio,hardware"})
+        assert r.status_code == 200
+        assert cliente.get("/api/buscar", params={"codigo": "P003", "secciones": "export_4g"}).status_code == 503
+    finally:
+        main._limite_sheets.liberar(ocupado)
@@ -0,0 +1,117 @@
+# tests/test_conector_sheets.py
+"""PopFilteredReader: lectura por la hoja índice (`<hoja>_idx`) y caída al escaneo."""
+import pytest
+
+import conector_sheets
+from conector_sheets import PopFilteredReader, escribir_hoja_stream_por_pop, nombre_indice
+
+SHEET = "libro-tests"
+HEADERS = ["POP", "Celda"]
+FILAS = [["B", "b1"], ["A", "a1"], ["C", "c1"], ["B", "b2"], ["A", "a2"], ["B", "b3"]]
+
+
+@pytest.fixture
+def hoja(fake):
+    escribir_hoja_stream_por_pop(SHEET, "Export_4G", [HEADERS, *FILAS])
+    return fake
+
+
+@pytest.fixture
+def escaneos(monkeypatch):
+    """Cuenta las caídas al escaneo (el camino lento)."""
+    n = []
+    original = PopFilteredReader._leer_por_escaneo
+
+    def contar(self, *a, **kw):
+        n.append(self.sheet_name)
+        return original(self, *a, **kw)
+    monkeypatch.setattr(PopFilteredReader, "_leer_por_escaneo", contar)
+    return n
+
+
+def _celdas(df):
+    return sorted(df["Celda"].tolist())
+
+
+def test_indice_agrupado(hoja):
+    datos = hoja.hoja(SHEET, "Export_4G").datos
+    assert [f[0] for f in datos[1:]] == ["A", "A", "B", "B", "B", "C"]
+    assert hoja.hoja(SHEET, nombre_indice("Export_4G")).datos == [
+        ["POP", "first_row", "row_count"], ["A", "2", "2"], ["B", "4", "3"], ["C", "7", "1"]]
+
+
+def test_lee_por_indice(hoja, escaneos):
+    df = conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", " b ")
+    assert list(df.columns) == HEADERS
+    assert _celdas(df) == ["b1", "b2", "b3"]
+    assert escaneos == []
+
+
+def test_lee_varios_por_indice(hoja, escaneos):
+    df = conector_sheets.leer_filas_por_pops(SHEET, "Export_4G", ["a", "C", "zz"])
+    assert _celdas(df) == ["a1", "a2", "c1"]
+    assert escaneos == []
+
+
+def test_pop_ausente(hoja, escaneos):
+    df = conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", "ZZ")
+    assert df.empty and list(df.columns) == HEADERS
+    assert escaneos == []
+
+
+def test_sin_indice_escanea(fake, escaneos):
+    fake.cargar(SHEET, "Export_4G", [HEADERS, *FILAS])
+    assert _celdas(conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", "B")) == ["b1", "b2", "b3"]
+    assert escaneos == ["Export_4G"]
+
+
+def test_indice_desactualizado_escanea(hoja, escaneos):
+    # la hoja se recargó sin ordenar pero el índice quedó: no debe devolver filas de otro POP
+    hoja.cargar(SHEET, "Export_4G", [HEADERS, *FILAS])
+    assert _celdas(conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", "B")) == ["b1", "b2", "b3"]
+    assert escaneos == ["Export_4G"]
+
+
+def test_rango_rechazado_escanea(hoja, escaneos):
+    # índice con una fila imposible: el batchGet responde 400 y se escanea en vez de fallar
+    hoja.cargar(SHEET, nombre_indice("Export_4G"), [["POP", "first_row", "row_count"], ["B", "0", "3"]])
+    assert _celdas(conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", "B")) == ["b1", "b2", "b3"]
+    assert escaneos == ["Export_4G"]
+
+
+def test_rango_rechazado_es_400(hoja):
+    from googleapiclient.errors import HttpError
+    with pytest.raises(HttpError) as e:
+        conector_sheets.client.values_api.batchGet(spreadsheetId=SHEET, ranges=["'Export_4G'!A3:5"]).execute()
+    assert e.value.resp.status == 400
+
+
+def test_sin_indice_no_se_consulta_cada_vez(fake, monkeypatch):
+    fake.cargar(SHEET, "Export_4G", [HEADERS, *FILAS])
+    gets = []
+    original = fake.values.get
+    monkeypatch.setattr(fake.values, "get", lambda **kw: (gets.append(kw["range"]), original(**kw))[1])
+    for _ in range(3):
+        conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", "A")
+    assert gets == [f"'{nombre_indice('Export_4G')}'!A2:C"]
+    # una carga ordenada desde este proceso vuelve a habilitar el índice
+    escribir_hoja_stream_por_pop(SHEET, "Export_4G", [HEADERS, *FILAS])
+    conector_sheets.leer_filas_por_pop(SHEET, "Export_4G", "A")
+    assert len(gets) == 2
+
+
+def test_indice_viejo_se_borra_antes_de_limpiar(hoja, monkeypatch):
+    """Mientras la hoja de datos se reescribe no queda un índice que apunte a ella."""
+    idx = nombre_indice("Export_4G")
+    vistos = []
+    original = conector_sheets.StreamingWriter.write_rows
+
+    def espiar(self, rows, batch_rows=2000):
+        if self.sheet_name == "Export_4G":
+            vistos.append(hoja.hoja(SHEET, idx) is not None)
+        return original(self, rows, batch_rows=batch_rows)
+    monkeypatch.setattr(conector_sheets.StreamingWriter, "write_rows", espiar)
+
+    escribir_hoja_stream_por_pop(SHEET, "Export_4G", [HEADERS, ["Z", "z1"], *FILAS])
+    assert vistos == [False]
+    assert hoja.hoja(SHEET, idx).datos[-1] == ["Z", "8", "1"]   # índice nuevo, escrito al final
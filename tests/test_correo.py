@@ -0,0 +1,123 @@
+# tests/test_correo.py
+"""Outbox de correo contra un servidor SMTP mínimo en localhost (sin TLS ni login)."""
+import socketserver
+import threading
+import time
+
+import pytest
+
+import correo
+
+
+class _ServidorSMTP(socketserver.ThreadingTCPServer):
+    """Habla lo justo de SMTP; `politica(rcpt, veces)` decide la respuesta a cada RCPT TO."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, politica):
+        super().__init__(("127.0.0.1", 0), _Sesion)
+        self.politica = politica
+        self.conexiones = 0
+        self.entregados = []          # (destinatario, momento)
+        self.intentos = {}            # destinatario -> veces que se intentó
+
+
+class _Sesion(socketserver.StreamRequestHandler):
+    def _responder(self, linea):
+        self.wfile.write((linea + "\r\n").encode())
+
+    def handle(self):
+        srv = self.server
+        srv.conexiones += 1
+        self._responder("220 local")
+        rcpts = []
+        while True:
+            linea = self.rfile.readline().decode().strip()
+            if not linea:
+                return
+            cmd = linea[:4].upper()
+            if cmd == "RCPT":
+                rcpt = linea.split("<", 1)[1].rstrip(">")
+                srv.intentos[rcpt] = srv.intentos.get(rcpt, 0) + 1
+                codigo = srv.politica(rcpt, srv.intentos[rcpt])
+                if codigo == 250:
+                    rcpts.append(rcpt)
+                self._responder(f"{codigo} rcpt")
+            elif cmd == "DATA":
+                self._responder("354 datos")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                srv.entregados += [(r, time.monotonic()) for r in rcpts]
+                rcpts = []
+                self._responder("250 ok")
+            elif cmd == "QUIT":
+                self._responder("221 chau")
+                return
+            else:   # EHLO/HELO/MAIL/RSET/NOOP
+                if cmd == "RSET":
+                    rcpts = []
+                self._responder("250 ok")
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    servidores = []
+
+    def levantar(politica=lambda rcpt, veces: 250):
+        srv = _ServidorSMTP(politica)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servidores.append(srv)
+        monkeypatch.setattr(correo, "SMTP_HOST", "127.0.0.1")
+        monkeypatch.setattr(correo, "SMTP_PORT", srv.server_address[1])
+        monkeypatch.setattr(correo, "SMTP_TLS", "none")
+        monkeypatch.setattr(correo, "SMTP_USER", "")
+        return srv
+    yield levantar
+    for srv in servidores:
+        srv.shutdown()
+        srv.server_close()
+
+
+def _esperar(cond, timeout=10):
+    fin = time.monotonic() + timeout
+    while not cond() and time.monotonic() < fin:
+        time.sleep(0.02)
+    return cond()
+
+
+def test_reutiliza_una_conexion(smtp):
+    srv = smtp()
+    ob = correo.Outbox()
+    for i in range(5):
+        ob.enqueue("app@test", [f"u{i}@test"], "Subject: hola\r\n\r\ncuerpo")
+        time.sleep(0.05)    # llegan de a uno, no como una sola ráfaga
+    assert _esperar(lambda: ob.enviados == 5)
+    assert srv.conexiones == 1
+    assert sorted(r for r, _ in srv.entregados) == [f"u{i}@test" for i in range(5)]
+    ob.cerrar()
+
+
+def test_reintento_no_frena_la_cola_y_descarta_permanentes(smtp, monkeypatch):
+    monkeypatch.setattr(correo, "MAIL_BACKOFF_MAX", 0.5)
+    monkeypatch.setattr(correo, "MAIL_RETRIES", 3)
+
+    def politica(rcpt, veces):
+        if rcpt == "tarde@test":
+            return 451 if veces == 1 else 250   # temporal: sale al segundo intento
+        if rcpt == "siempre@test":
+            return 451                          # temporal hasta agotar reintentos
+        if rcpt == "malo@test":
+            return 550                          # permanente: no se reintenta
+        return 250
+    srv = smtp(politica)
+    ob = correo.Outbox()
+    for rcpt in ("tarde@test", "siempre@test", "malo@test", "bien@test"):
+        ob.enqueue("app@test", [rcpt], "Subject: x\r\n\r\ny")
+
+    assert _esperar(lambda: ob.enviados == 2 and ob.fallidos == 2)
+    entregas = dict(srv.entregados)
+    # "bien" no esperó el backoff de "tarde"
+    assert entregas["bien@test"] < entregas["tarde@test"]
+    assert srv.intentos == {"tarde@test": 2, "siempre@test": 3, "malo@test": 1, "bien@test": 1}
+    assert ob.depth() == 0
+    ob.cerrar()
@@ -0,0 +1,149 @@
+# tests/test_exportar.py
+"""Exportación a Excel: motor write-only (exportador_excel.py), /exportar_excel y el lote ZIP/xlsx."""
+import io
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import main
+from conftest import POPS, filas_export
+from exportador_excel import SIN_DATOS, ExcelStreamExporter, file_size, iter_file, iter_zip
+
+
+def _libro(data: bytes):
+    return load_workbook(io.BytesIO(data), read_only=True)
+
+
+def _valores(ws):
+    return [list(r) for r in ws.iter_rows(values_only=True)]
+
+
+# ---------- motor ----------
+def test_exporter_hojas_y_vacios():
+    import pandas as pd
+    xl = ExcelStreamExporter()
+    xl.add_sheet("Datos", ["A", "B", "C"], [[1, None, "x"], [float("nan"), pd.NA, pd.NaT], [2, "y", "z", "sobra"]])
+    xl.add_records("Registros", [{"POP": "P1", "Nombre": "Uno"}, {"POP": "P2", "Extra": "e"}])
+    xl.add_records("Vacía", [])
+    f = xl.save()
+    data = f.read()
+    f.close()
+
+    wb = load_workbook(io.BytesIO(data))   # modo normal: estilos y anchos visibles
+    assert wb.sheetnames == ["Datos", "Registros", "Vacía"]
+    assert _valores(wb["Datos"]) == [["A", "B", "C"], [1, None, "x"], [None, None, None], [2, "y", "z"]]
+    assert _valores(wb["Registros"]) == [["POP", "Nombre", "Extra"], ["P1", "Uno", None], ["P2", None, "e"]]
+    assert _valores(wb["Vacía"]) == [[SIN_DATOS]]
+    assert wb["Datos"]["A1"].font.bold and not wb["Datos"]["A2"].font.bold
+    assert wb["Datos"]["A2"].alignment.wrap_text
+
+
+def test_iter_file_en_chunks():
+    xl = ExcelStreamExporter()
+    xl.add_sheet("H", ["N"], ([i] for i in range(2000)))
+    f = xl.save()
+    total = file_size(f)
+    chunks = list(iter_file(f, chunk=1024))
+    assert f.closed
+    assert len(chunks) > 1 and all(len(c) <= 1024 for c in chunks)
+    data = b"".join(chunks)
+    assert len(data) == total
+    assert len(_valores(_libro(data)["H"])) == 2001
+
+
+class _Archivo(io.BytesIO):
+    cerrados = []
+
+    def close(self):
+        _Archivo.cerrados.append(self.getvalue())
+        super().close()
+
+
+def test_iter_zip_incremental_y_legible():
+    armados = []
+    _Archivo.cerrados.clear()
+
+    def entradas():   # generador: cada archivo se arma recién cuando el ZIP lo pide
+        for i in range(3):
+            armados.append(i)
+            yield f"f{i}.bin", _Archivo(bytes([i]) * 5000)
+    gen = iter_zip(entradas(), chunk=1000)
+    primero = next(gen)
+    assert armados == [0] and primero
+    data = primero + b"".join(gen)
+    assert armados == [0, 1, 2]
+    assert _Archivo.cerrados == [bytes([i]) * 5000 for i in range(3)]   # cada entrada se cierra al copiarla
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["f0.bin", "f1.bin", "f2.bin"]
+        assert zf.read("f2.bin") == b"\x02" * 5000
+
+
+# ---------- /exportar_excel ----------
+def test_exportar_excel(datos, cliente):
+    r = cliente.get("/exportar_excel", params={"codigo": "p002"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == main.XLSX_MEDIA_TYPE
+    assert 'filename="Sitio_P002.xlsx"' in r.headers["content-disposition"]
+    wb = _libro(r.content)
+    assert wb.sheetnames == ["Bases POP vs Directorio", "Proyecto RANCO", "Base Hardware",
+                             "Export 5G", "Export 4G", "Export 3G", "Export 2G"]
+    celdas = sorted(f[1] for f in _valores(wb["Export 4G"])[1:])
+    assert celdas == sorted(f[1] for f in filas_export("Export_4G") if f[0] == "P002")
+
+    # segunda vez: mismo libro desde xlsx_cache; con If-None-Match, 304
+    assert cliente.get("/exportar_excel", params={"codigo": "P002"}).content == r.content
+    r304 = cliente.get("/exportar_excel", params={"codigo": "P002"}, headers={"If-None-Match": r.headers["ETag"]})
+    assert r304.status_code == 304
+
+
+def test_exportar_excel_grande_se_transmite(datos, cliente, monkeypatch):
+    monkeypatch.setattr(main, "XLSX_CACHE_ITEM_MAX", 0)
+    r = cliente.get("/exportar_excel", params={"codigo": "P003"})
+    assert r.status_code == 200
+    assert int(r.headers["content-length"]) == len(r.content)
+    assert "Export 2G" in _libro(r.content).sheetnames
+    assert not main.xlsx_cache
+
+
+def test_exportar_excel_sin_codigo(cliente):
+    assert cliente.get("/exportar_excel", params={"codigo": ""}).status_code == 400
+
+
+# ---------- /exportar_excel_lote ----------
+def test_lote_zip_un_libro_por_sitio(datos, cliente):
+    r = cliente.get("/exportar_excel_lote", params={"codigos": "p001, P003;NOEXISTE"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == main.ZIP_MEDIA_TYPE
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+        assert zf.testzip() is None
+        # un POP sin datos no genera libro
+        assert sorted(zf.namelist()) == ["Sitio_P001.xlsx", "Sitio_P003.xlsx"]
+        ws = _libro(zf.read("Sitio_P003.xlsx"))["Export 5G"]
+    assert sorted(f[1] for f in _valores(ws)[1:]) == sorted(
+        f[1] for f in filas_export("Export_5G") if f[0] == "P003")
+
+
+def test_lote_xlsx_consolidado_por_region(datos, cliente):
+    r = cliente.get("/exportar_excel_lote", params={"region": "rm", "formato": "xlsx"})
+    assert r.status_code == 200
+    assert int(r.headers["content-length"]) == len(r.content)
+    wb = _libro(r.content)
+    assert [t for t, _ in main.HOJAS_CONSOLIDADO] == wb.sheetnames
+    assert sorted({f[0] for f in _valores(wb["Export 4G"])[1:]}) == POPS
+    assert len(_valores(wb["Bases POP"])) == len(POPS) + 1
+
+
+@pytest.mark.parametrize("params", [{}, {"region": "Atacama"}, {"codigos": "P1,P2,P3"}])
+def test_lote_pedidos_invalidos(datos, cliente, monkeypatch, params):
+    monkeypatch.setattr(main, "MAX_LOTE_EXPORT", 2)
+    r = cliente.get("/exportar_excel_lote", params=params)
+    assert r.status_code == 400
+
+
+def test_lote_sin_sesion(datos):
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as c:
+        r = c.get("/exportar_excel_lote", params={"codigos": "P001"}, follow_redirects=False)
+    assert r.status_code == 401
@@ -0,0 +1,211 @@
+# tests/test_indices.py
+"""Índices en memoria (indices.py)."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_main_no_carga_numpy_ni_pandas():
+    """numpy / pandas se importan al construir el primer índice, no al arrancar."""
+    codigo = "import sys, main; print(sorted(m for m in ('numpy', 'pandas') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=dict(os.environ, LOG_LEVEL="ERROR"),
+                         capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "[]"
+
+
+# ---------- autocompletado (PrefixIndex) ----------
+def _df(filas):
+    import pandas as pd
+    return pd.DataFrame(filas[1:], columns=filas[0])
+
+
+def test_prefix_pop_nombre_y_palabra():
+    from indices import PrefixIndex
+    idx = PrefixIndex.desde_hojas(
+        _df([["POP", "Nombre"], ["MAI01", "Cerro Maipú"], ["SCL02", "Maitencillo"], ["VAL03", "Valparaíso"]]),
+        _df([["pop", "NOMBRE"], ["VAL03", "otro"], ["ANT04", "Antofagasta Centro"]]),
+    )
+    assert len(idx) == 4
+    pops = lambda q, **kw: [s["pop"] for s in idx.buscar(q, **kw)]
+    # POP primero, luego nombre completo, luego palabra del nombre
+    assert pops("mai") == ["MAI01", "SCL02"]
+    assert pops("maipu") == ["MAI01"]                 # sin tildes
+    assert pops("centro") == ["ANT04"]               # palabra interior del nombre
+    assert pops("val") == ["VAL03"]
+    assert idx.buscar("val")[0]["nombre"] == "Valparaíso"   # gana la primera hoja con valor
+    assert pops("ma", limite=1) == ["MAI01"]
+    assert pops("") == [] and pops("zzz") == []
+
+
+def test_prefix_ignora_pop_vacio_o_nulo():
+    from indices import PrefixIndex
+    idx = PrefixIndex.desde_hojas(_df([["POP", "Nombre"], [None, "Sin código"], ["", "Vacío"],
+                                       [float("nan"), "NaN"], ["P1", "Uno"]]))
+    assert [s["pop"] for s in idx.sitios] == ["P1"]
+
+
+def test_indice_versionado_se_rehace_al_cambiar_version():
+    from indices import IndiceVersionado
+    construidos = []
+    iv = IndiceVersionado(lambda: construidos.append(1) or len(construidos))
+    assert iv.obtener((1,)) == 1 and iv.obtener((1,)) == 1
+    assert iv.obtener((2,)) == 2
+    assert len(construidos) == 2
+
+
+def test_api_sugerencias(datos, cliente):
+    import main
+    r = cliente.get("/api/sugerencias", params={"q": "sitio p00", "limite": 3})
+    assert r.status_code == 200
+    assert [s["pop"] for s in r.json()["sugerencias"]] == ["P001", "P002", "P003"]
+    datos.cargar(main.SHEET_ID, "Bases POP", [["POP", "Nombre"], ["P009", "Nuevo"]])
+    main.invalidate_cache(["Bases POP"])
+    assert [s["pop"] for s in cliente.get("/api/sugerencias", params={"q": "nuev"}).json()["sugerencias"]] == ["P009"]
+
+
+# ---------- geográfico (GeoIndex) ----------
+def _haversine(lat1, lon1, lat2, lon2):
+    import math
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+
+def _sitios_geo(n=400, semilla=7):
+    import random
+    rnd = random.Random(semilla)
+    sitios = [{"pop": f"S{i:03d}", "nombre": "", "comuna": "", "region": "",
+               "lat": f"{rnd.uniform(-45, -18):.5f}", "lon": f"{rnd.uniform(-75, -67):.5f}"} for i in range(n)]
+    sitios[0]["lat"] = sitios[0]["lat"].replace(".", ",")   # coma decimal
+    malos = [("", "-70"), ("abc", "-70"), ("0", "0"), ("95", "-70"), ("-33", "-190")]
+    sitios += [{"pop": f"X{i}", "nombre": "", "comuna": "", "region": "", "lat": la, "lon": lo}
+               for i, (la, lo) in enumerate(malos)]
+    return sitios
+
+
+def _fuerza_bruta(sitios, lat, lon):
+    out = []
+    for s in sitios:
+        try:
+            la, lo = float(s["lat"].replace(",", ".")), float(s["lon"])
+        except ValueError:
+            continue
+        if abs(la) <= 90 and abs(lo) <= 180 and (la, lo) != (0, 0):
+            out.append((_haversine(lat, lon, la, lo), s["pop"]))
+    return sorted(out)
+
+
+def test_haversine_valores_conocidos():
+    from indices import KM_POR_GRADO, haversine_km
+    assert haversine_km(0, 0, [1.0], [0.0])[0] == pytest.approx(KM_POR_GRADO, rel=1e-4)
+    assert haversine_km(0, 0, [0.0], [180.0])[0] == pytest.approx(6371.0088 * 3.14159265, rel=1e-6)
+    # Santiago - Valparaíso
+    assert haversine_km(-33.4489, -70.6693, [-33.0472], [-71.6127])[0] == pytest.approx(
+        _haversine(-33.4489, -70.6693, -33.0472, -71.6127), abs=1e-6)
+
+
+@pytest.mark.parametrize("celda", [0.1, 0.25, 2.0])
+def test_geo_cercanos_y_radio_igual_a_fuerza_bruta(celda):
+    from indices import GeoIndex
+    sitios = _sitios_geo()
+    idx = GeoIndex(sitios, celda=celda)
+    assert len(idx) == 400 and idx.descartados == 5
+    for lat, lon in ((-33.45, -70.66), (-18.0, -67.0), (-50.0, -80.0), (10.0, 10.0)):
+        esperado = _fuerza_bruta(sitios, lat, lon)
+        for k in (1, 7, 50):
+            got = idx.cercanos(lat, lon, k)
+            assert [s["pop"] for s in got] == [p for _, p in esperado[:k]]
+            assert [s["distancia_km"] for s in got] == [round(d, 3) for d, _ in esperado[:k]]
+        for km in (0.0, 25.0, 150.0, 900.0):
+            got = idx.en_radio(lat, lon, km)
+            assert [s["pop"] for s in got] == [p for d, p in esperado if d <= km]
+    assert len(idx.cercanos(-33.45, -70.66, 10_000)) == 400
+
+
+def test_geo_excluye_el_origen():
+    from indices import GeoIndex
+    idx = GeoIndex(_sitios_geo())
+    lat, lon = idx.coordenadas("s010")
+    assert idx.cercanos(lat, lon, 1)[0]["pop"] == "S010"
+    assert idx.cercanos(lat, lon, 1, excluir="S010")[0]["pop"] != "S010"
+    assert all(s["pop"] != "S010" for s in idx.en_radio(lat, lon, 300, excluir="s010"))
+    assert idx.coordenadas("X0") is None
+
+
+def test_api_cercanos_y_radio(fake, cliente):
+    import main
+    fake.cargar(main.SHEET_ID, "Bases POP", [["POP", "Nombre", "Latitud", "Longitud"],
+                                             ["STGO", "Santiago", "-33,4489", "-70,6693"],
+                                             ["VALPO", "Valparaíso", "-33.0472", "-71.6127"],
+                                             ["ANTOF", "Antofagasta", "-23.6509", "-70.3975"],
+                                             ["SINXY", "Sin coordenadas", "", ""]])
+    fake.cargar(main.SHEET_ID, "Directorio", [["POP", "Nombre"]])
+    r = cliente.get("/api/cercanos", params={"codigo": "stgo", "k": 5})
+    assert r.status_code == 200
+    body = r.json()
+    assert [s["pop"] for s in body["sitios"]] == ["VALPO", "ANTOF"]
+    assert body["sitios"][0]["distancia_km"] == round(_haversine(-33.4489, -70.6693, -33.0472, -71.6127), 3)
+    r = cliente.get("/api/radio", params={"lat": "-33.45", "lon": "-70.66", "km": 150})
+    assert [s["pop"] for s in r.json()["sitios"]] == ["STGO", "VALPO"]
+    assert cliente.get("/api/cercanos", params={"codigo": "SINXY"}).status_code == 404
+    assert cliente.get("/api/cercanos", params={"lat": "x", "lon": "1"}).status_code == 400
+    assert cliente.get("/api/radio", params={"lat": "1", "lon": "1", "km": 0}).status_code == 400
+
+
+# ---------- texto completo (InvertedIndex) ----------
+@pytest.fixture(scope="module")
+def idx_texto():
+    from indices import InvertedIndex
+    return InvertedIndex.desde_hojas(_df([
+        ["POP", "Nombre", "Comuna", "Región", "Tipo", "DETALLE INFRA ((28-12-2021))", "NR3500", "LTE700"],
+        ["A1", "Cerro Alto", "Maipú", "RM", "Torre", "Monoposte 30m", "SI", ""],
+        ["A2", "Plaza Maipú", "Maipú", "RM", "Rooftop", "Mástil", "", "X"],
+        ["B1", "Alto Hospicio", "Alto Hospicio", "Tarapacá", "Torre", "Torre arriostrada", "SI", "SI"],
+        ["C1", "Costanera", "Valparaíso", "Valparaíso", "Torre", "Monoposte", "NO", "SI"],
+    ]))
+
+
+@pytest.mark.parametrize("consulta,filtros,tec,esperado", [
+    ("", None, (), ["A1", "A2", "B1", "C1"]),
+    ("alto", None, (), ["A1", "B1"]),
+    ("alto torre", None, (), ["A1", "B1"]),
+    ("alto -hospicio", None, (), ["A1"]),
+    ("comuna:maipu", None, (), ["A1", "A2"]),
+    ('nombre:"alto hospicio"', None, (), ["B1"]),
+    ("nombre:maipu", None, (), ["A2"]),
+    ("mono*", None, (), ["A1", "C1"]),
+    ("costanera OR hospicio", None, (), ["B1", "C1"]),
+    ("rooftop | costanera", None, (), ["A2", "C1"]),
+    ("a1", None, (), ["A1"]),                                   # el código POP también es token
+    ("", {"region": "rm,tarapaca"}, (), ["A1", "A2", "B1"]),
+    ("torre", {"comuna": "maipu"}, (), ["A1"]),
+    ("tec:nr3500", None, (), ["A1", "B1"]),
+    ("costanera OR plaza", None, ("LTE700",), ["A2", "C1"]),
+    ("costanera OR plaza", None, ("LTE700", "NR3500"), []),   # tec filtra TODO el resultado
+])
+def test_texto_consultas(idx_texto, consulta, filtros, tec, esperado):
+    ids = idx_texto.buscar(consulta, filtros, tec=tec)
+    assert sorted(idx_texto.sitios[i]["pop"] for i in ids.tolist()) == esperado
+
+
+def test_texto_campo_desconocido(idx_texto):
+    with pytest.raises(ValueError, match="Campo desconocido"):
+        idx_texto.buscar("color:rojo")
+    with pytest.raises(ValueError):
+        idx_texto.buscar("", {"color": "rojo"})
+
+
+def test_api_busqueda_texto(datos, cliente):
+    r = cliente.get("/api/busqueda_texto", params={"q": "maipu", "limite": 2, "offset": 1})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["total"] == 5 and body["offset"] == 1 and len(body["sitios"]) == 2
+    assert set(body["sitios"][0]) == {"pop", "nombre", "comuna", "region", "tipo", "tec"}
+    assert cliente.get("/api/busqueda_texto", params={"q": "x:y"}).status_code == 400
+    assert cliente.get("/api/busqueda_texto").status_code == 400
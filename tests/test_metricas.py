@@ -0,0 +1,115 @@
+# tests/test_metricas.py
+"""Métricas en memoria (metricas.py) y el endpoint /metricas (formato Prometheus + autenticación)."""
+import re
+import threading
+
+import pytest
+
+import metricas
+from conftest import USUARIO_CARGA
+
+# línea de muestra del formato texto 0.0.4: nombre{etiquetas} valor
+_MUESTRA = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="(\\.|[^"\\])*",?)*\})? -?[0-9.e+]+(Inf)?$')
+
+
+def _validar_formato(texto: str):
+    assert texto.endswith("\n")
+    tipos = {}
+    for linea in texto.splitlines():
+        if linea.startswith("# HELP "):
+            continue
+        if linea.startswith("# TYPE "):
+            _, _, nombre, tipo = linea.split(" ")
+            assert tipo in ("counter", "gauge", "histogram")
+            tipos[nombre] = tipo
+            continue
+        assert _MUESTRA.match(linea), linea
+        nombre = re.split(r"[{ ]", linea, 1)[0]
+        assert nombre in tipos or re.sub(r"_(bucket|sum|count)$", "", nombre) in tipos, linea
+    return tipos
+
+
+@pytest.fixture
+def registro_limpio():
+    """Métricas creadas en el test no quedan en el registro global."""
+    antes = list(metricas._REGISTRO)
+    yield
+    metricas._REGISTRO[:] = antes
+
+
+def test_contador_suma_hilos_y_pliega_los_terminados(registro_limpio):
+    c = metricas.Contador("t_total", "prueba", ("k",))
+
+    def trabajar():
+        for _ in range(1000):
+            c.inc(k="a")
+    hilos = [threading.Thread(target=trabajar) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    c.inc(2, k='b"x')
+    assert c.valor(k="a") == 4000
+    lineas = list(c.lineas())
+    assert len(c._shards) == 1            # los shards de hilos muertos se plegaron
+    assert 't_total{k="a"} 4000' in lineas
+    assert 't_total{k="b\\"x"} 2' in lineas
+
+
+def test_histograma_buckets_acumulados(registro_limpio):
+    h = metricas.Histograma("t_seg", "prueba", ("ruta",), buckets=(0.1, 1))
+    for v in (0.05, 0.1, 0.5, 3):
+        h.observe(v, ruta="/x")
+    lineas = list(h.lineas())
+    assert lineas[2:] == ['t_seg_bucket{ruta="/x",le="0.1"} 2', 't_seg_bucket{ruta="/x",le="1"} 3',
+                          't_seg_bucket{ruta="/x",le="+Inf"} 4', 't_seg_sum{ruta="/x"} 3.65',
+                          't_seg_count{ruta="/x"} 4']
+
+
+def test_medidor_que_falla_no_rompe_la_exposicion(registro_limpio):
+    metricas.Medidor("t_roto", "falla", lambda: 1 / 0)
+    metricas.Medidor("t_ok", "ok", lambda: {("a",): 1.5}, ("campo",))
+    texto = metricas.exponer()
+    assert "t_roto" not in texto
+    assert 't_ok{campo="a"} 1.5' in texto
+    _validar_formato(texto)
+
+
+# ---------- /metricas ----------
+def _coinciden(hoja):
+    return sum(v for k, v in metricas.POP_FILAS_COINCIDEN._snapshot().items() if k[0] == hoja)
+
+
+def test_metricas_formato_y_series_de_la_app(datos, cliente):
+    antes = _coinciden("Export_4G")   # los contadores son del proceso: se mide la diferencia
+    cliente.get("/api/buscar", params={"codigo": "P001", "secciones": "bases,export_4g"})
+    r = cliente.get("/metricas", auth=USUARIO_CARGA)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == metricas.CONTENT_TYPE
+    tipos = _validar_formato(r.text)
+    assert tipos["http_request_latencia_segundos"] == "histogram"
+    assert tipos["sheets_api_llamadas_total"] == "counter"
+    assert 'ruta="/api/buscar"' in r.text
+    assert re.search(r'^cache_hojas_filas\{hoja="Bases POP"\} 5$', r.text, re.M)
+    assert re.search(r'^lector_pop_filas_coinciden_total\{hoja="Export_4G",modo="[a-z_]+"\} \d+$', r.text, re.M)
+    assert _coinciden("Export_4G") - antes == 3
+
+
+@pytest.mark.parametrize("token,headers,auth,status", [
+    ("", {}, None, 401),
+    ("", {}, ("carga@test", "mala"), 401),
+    ("", {"Authorization": "Bearer "}, None, 401),            # sin token configurado, Bearer no sirve
+    ("tok", {"Authorization": "Bearer tok"}, None, 200),
+    ("tok", {"Authorization": "Bearer otro"}, None, 401),
+    ("tok", {}, USUARIO_CARGA, 200),
+])
+def test_metricas_autenticacion(fake, monkeypatch, token, headers, auth, status):
+    import main
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(main, "METRICAS_TOKEN", token)
+    with TestClient(main.app) as c:
+        r = c.get("/metricas", headers=headers, auth=auth)
+    assert r.status_code == status
+    if status == 401:
+        assert r.headers["www-authenticate"] == "Basic"
+        assert "# TYPE" not in r.text
@@ -0,0 +1,87 @@
+# tests/test_middleware.py
+"""AppMiddleware: sesión en cookie firmada, TTL deslizante y re-firma solo cuando hace falta."""
+import json
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from middleware import AppMiddleware
+
+TTL = 1800   # refresh_fraction 0.25 => se re-firma pasados 450 s
+
+
+async def _eco(scope, receive, send):
+    """App mínima: /login guarda el usuario en la sesión; el resto devuelve la sesión."""
+    if scope["path"] == "/login":
+        scope["session"].update(user_email="ana@test", login_ts=time.time())
+    body = json.dumps(scope["session"]).encode()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+@pytest.fixture
+def mw():
+    return AppMiddleware(_eco, secret_key="s3cr3t", session_cookie="bi_session", max_age=TTL, ttl_seconds=TTL)
+
+
+def _cookie(mw, sesion, hace=0):
+    """Valor de la cookie firmada como si se hubiese emitido hace `hace` segundos."""
+    firmado_en = int(time.time()) - hace
+    original = mw.signer.get_timestamp
+    mw.signer.get_timestamp = lambda: firmado_en
+    try:
+        return mw._cookie_header(sesion).split(";", 1)[0].partition("=")[2]
+    finally:
+        mw.signer.get_timestamp = original
+
+
+def _get(mw, ruta, cookie=None, **kw):
+    headers = kw.pop("headers", {})
+    if cookie:
+        headers["cookie"] = f"bi_session={cookie}"
+    return TestClient(mw).get(ruta, headers=headers, follow_redirects=False, **kw)   # sin lifespan
+
+
+def test_login_firma_y_la_sesion_vuelve(mw):
+    r = _get(mw, "/login")
+    assert "bi_session=" in r.headers["set-cookie"]
+    cookie = r.headers["set-cookie"].split(";", 1)[0].partition("=")[2]
+    r = _get(mw, "/datos", cookie)
+    assert r.json()["user_email"] == "ana@test"
+    assert "set-cookie" not in r.headers   # recién firmada y sin cambios: no se re-firma
+
+
+def test_cookie_vieja_se_refirma(mw):
+    login_ts = time.time() - 600
+    cookie = _cookie(mw, {"user_email": "ana@test", "login_ts": login_ts}, hace=600)
+    r = _get(mw, "/datos", cookie)
+    assert r.status_code == 200
+    nueva = r.headers["set-cookie"].split(";", 1)[0].partition("=")[2]
+    assert nueva != cookie
+    sesion, firmada = mw._load_session({"type": "http", "headers": [(b"cookie", f"bi_session={nueva}".encode())]})
+    assert sesion["user_email"] == "ana@test"
+    assert sesion["login_ts"] > login_ts            # TTL deslizante
+    assert time.time() - firmada < 5
+
+
+def test_sesion_vencida_redirige_a_login(mw):
+    cookie = _cookie(mw, {"user_email": "ana@test", "login_ts": time.time() - TTL - 1})
+    r = _get(mw, "/datos", cookie)
+    assert r.status_code == 302
+    assert r.headers["location"].startswith("/auth/login?next=")
+    assert "bi_session=null" in r.headers["set-cookie"]
+
+
+def test_cookie_adulterada_se_ignora(mw):
+    cookie = _cookie(mw, {"user_email": "ana@test", "login_ts": time.time()})
+    r = _get(mw, "/datos", cookie[:-2] + "xx")
+    assert r.json() == {}
+
+
+def test_request_id_y_server_timing(mw):
+    r = _get(mw, "/datos", headers={"X-Request-ID": "abc-123"})
+    assert r.headers["x-request-id"] == "abc-123"
+    assert "server-timing" in r.headers
+    assert len(_get(mw, "/datos", headers={"X-Request-ID": "x" * 100}).headers["x-request-id"]) == 16
@@ -0,0 +1,82 @@
+# tests/test_perfilado.py
+"""Perfilado bajo demanda: un cProfile por vez, anidados y fallas al guardar el .pstats."""
+import threading
+import time
+
+import pytest
+
+import perfilado
+from conftest import USUARIO_CARGA
+
+
+@pytest.fixture(autouse=True)
+def perfil_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(perfilado, "PERFIL_DIR", str(tmp_path))
+    return tmp_path
+
+
+@perfilado.perfilable
+def _interna(x):
+    return x * 2
+
+
+@perfilado.perfilable
+def _externa(x):
+    time.sleep(0.1)
+    return _interna(x) + 1
+
+
+def _en_perfil(perfil, fn, *args):
+    token = perfilado.activar(perfil)
+    try:
+        return fn(*args)
+    finally:
+        perfilado.desactivar(token)
+
+
+def test_anidadas_quedan_en_el_perfil_de_afuera():
+    perfil = perfilado.Perfil("admin@test")
+    assert _en_perfil(perfil, _externa, 3) == 7
+    assert perfil.funciones == ["_externa"]
+    assert any(f[2] == "_interna" for f in perfil.stats.stats)
+    assert perfil.guardar().endswith(".pstats")
+
+
+def test_concurrentes_no_chocan():
+    """Dos requests perfilados a la vez: uno se perfila, el otro corre igual sin perfil."""
+    perfiles = [perfilado.Perfil("a@test"), perfilado.Perfil("b@test")]
+    out = {}
+    barrera = threading.Barrier(2)
+
+    def correr(i):
+        barrera.wait()
+        try:
+            out[i] = _en_perfil(perfiles[i], _externa, i)
+        except Exception as e:
+            out[i] = e
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(2)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(5)
+    assert out == {0: 1, 1: 3}
+    # _externa quedó perfilada en uno solo (el otro pudo alcanzar a perfilar _interna)
+    assert sorted("_externa" in p.funciones for p in perfiles) == [False, True]
+    # liberado el cProfile, el siguiente vuelve a perfilar
+    perfil = perfilado.Perfil("c@test")
+    _en_perfil(perfil, _externa, 1)
+    assert perfil.stats is not None
+
+
+def test_request_perfilado_y_guardar_fallido(datos, cliente, monkeypatch):
+    params = {"codigo": "P001", "perfil": 1}
+    r = cliente.get("/buscar", params=params, auth=USUARIO_CARGA)
+    assert r.status_code == 200
+    assert r.headers["X-Perfil"] in perfilado.listar()
+
+    def sin_disco(self):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(perfilado.Perfil, "guardar", sin_disco)
+    r = cliente.get("/buscar", params=params, auth=USUARIO_CARGA)
+    assert r.status_code == 200 and "Sitio P001" in r.text
+    assert "X-Perfil" not in r.headers
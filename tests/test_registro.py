@@ -0,0 +1,104 @@
+# tests/test_registro.py
+"""Logging estructurado (registro.py): JSON por línea, contexto del request y cola que no bloquea."""
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+
+import pytest
+
+import registro
+
+
+@pytest.fixture
+def lineas(capsys):
+    """Devuelve una función que espera (acotado) y entrega las líneas JSON escritas por el listener."""
+    nivel = registro._raiz.level
+    registro._raiz.setLevel(logging.INFO)   # setLevel limpia la cache de niveles de los hijos
+    capsys.readouterr()
+    acumulado = []
+
+    def leer(marca: str, timeout: float = 5):
+        fin = time.monotonic() + timeout
+        while time.monotonic() < fin:
+            acumulado.extend(json.loads(l) for l in capsys.readouterr().out.splitlines() if l.startswith("{"))
+            encontradas = [d for d in acumulado if marca in json.dumps(d, ensure_ascii=False)]
+            if encontradas:
+                return encontradas
+            time.sleep(0.02)
+        raise AssertionError(f"no se escribió ningún log con {marca!r}")
+    yield leer
+    registro._raiz.setLevel(nivel)
+
+
+def test_linea_json_con_datos_y_args(lineas):
+    log = registro.obtener("prueba")
+    lista = ["antes"]
+    log.warning("valor %s", lista, extra={"datos": {"hoja": "Bases POP", "filas": 12}})
+    lista[0] = "despues"   # el mensaje se arma en el hilo que loguea, no en el listener
+    d, = lineas("valor ")
+    assert d["msg"] == "valor ['antes']"
+    assert d["nivel"] == "WARNING" and d["logger"] == "app.prueba"
+    assert d["hoja"] == "Bases POP" and d["filas"] == 12
+    assert d["ts"].endswith("+00:00")
+
+
+def test_contexto_del_request_llega_al_threadpool(lineas):
+    log = registro.obtener("prueba")
+    token = registro.iniciar_request("rid-123")
+    try:
+        registro.set_usuario("ana@test")
+        ctx = contextvars.copy_context()   # como run_in_threadpool
+        hilo = threading.Thread(target=ctx.run, args=(log.info, "desde el pool"))
+        hilo.start()
+        hilo.join()
+    finally:
+        registro.terminar_request(token)
+    log.info("fuera del request")
+    d, = lineas("desde el pool")
+    assert d["request_id"] == "rid-123" and d["usuario"] == "ana@test"
+    d, = lineas("fuera del request")
+    assert "request_id" not in d and "usuario" not in d
+
+
+def test_excepcion_con_traceback(lineas):
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        registro.obtener("prueba").exception("falló el cálculo")
+    d, = lineas("falló el cálculo")
+    assert d["nivel"] == "ERROR"
+    assert "ZeroDivisionError" in d["error"] and "Traceback" in d["error"]
+
+
+def test_cola_llena_descarta_sin_bloquear(monkeypatch):
+    monkeypatch.setattr(registro._ColaHandler, "descartados", 0)
+    log = logging.getLogger("prueba.cola_llena")
+    monkeypatch.setattr(log, "handlers", [registro._ColaHandler(queue.Queue(maxsize=2))])
+    monkeypatch.setattr(log, "propagate", False)
+    t0 = time.monotonic()
+    for i in range(50):
+        log.error("mensaje %d", i)
+    assert time.monotonic() - t0 < 1
+    assert registro._ColaHandler.descartados == 48
+
+
+def test_muestreo_de_exitosos(monkeypatch):
+    monkeypatch.setattr(registro, "LOG_SAMPLE_OK", 0.0)
+    monkeypatch.setattr(registro, "LOG_LENTO_MS", 500)
+    assert not registro.muestrear_ok(10)
+    assert registro.muestrear_ok(800)        # lentos siempre
+    monkeypatch.setattr(registro, "LOG_SAMPLE_OK", 1.0)
+    assert registro.muestrear_ok(10)
+
+
+def test_log_de_request_del_middleware(fake, cliente, lineas):
+    r = cliente.get("/no-existe", headers={"X-Request-ID": "rid-mw-1"})
+    assert r.status_code == 404
+    d = next(d for d in lineas("rid-mw-1") if d["msg"] == "request")
+    assert d["nivel"] == "WARNING" and d["status"] == 404
+    assert d["ruta"] == "/no-existe" and d["metodo"] == "GET"
+    assert d["usuario"] == "usuario@test"
+    assert isinstance(d["ms"], float) and isinstance(d["spans"], dict)
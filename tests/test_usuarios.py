@@ -0,0 +1,123 @@
+# tests/test_usuarios.py
+"""Cache de usuarios: escrituras de una fila, journal entre workers y logins sin esperar a Sheets."""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import usuarios
+
+
+@pytest.fixture
+def hoja_usuarios(fake, tmp_path, monkeypatch):
+    monkeypatch.setattr(usuarios, "JOURNAL_PATH", str(tmp_path / "usuarios.journal"))
+    monkeypatch.setattr(usuarios, "_JOURNAL_INO", 0)
+    monkeypatch.setattr(usuarios, "_JOURNAL_OFFSET", 0)
+    fake.cargar(usuarios.SHEET_ID, usuarios.USERS_SHEET, [
+        usuarios.COLUMNS,
+        ["ana@test", "Ana", "h1", "customer", "TRUE", "", "", ""],
+        ["beto@test", "Beto", "h2", "admin", "TRUE", "", "", ""],
+    ])
+    usuarios._load_rows(force=True)
+    return fake
+
+
+def _journal():
+    with open(usuarios.JOURNAL_PATH, encoding="utf-8") as f:
+        return [json.loads(l) for l in f]
+
+
+def _fila(fake, n):
+    return fake.hoja(usuarios.SHEET_ID, usuarios.USERS_SHEET).datos[n - 1]
+
+
+def test_actualiza_una_fila(hoja_usuarios):
+    usuarios.update_user(" BETO@test ", name="Roberto")
+    assert _fila(hoja_usuarios, 3)[:2] == ["beto@test", "Roberto"]
+    assert _fila(hoja_usuarios, 2)[:2] == ["ana@test", "Ana"]
+    assert usuarios.get_user("beto@test")["name"] == "Roberto"
+    (entrada,) = _journal()
+    assert entrada["n"] == 3 and entrada["row"]["email"] == "beto@test"
+    assert "rows" not in entrada   # solo la fila cambiada, nunca la tabla completa
+
+
+def test_crea_usuario_al_final(hoja_usuarios):
+    usuarios.create_user("cami@test", "clave-larga", name="Cami", password_hash="h3")
+    assert _fila(hoja_usuarios, 4)[0] == "cami@test"
+    assert usuarios._ROW_NUM["cami@test"] == 4
+    with pytest.raises(ValueError):
+        usuarios.create_user("CAMI@test", "clave-larga", password_hash="h3")
+
+
+def test_token_de_reset(hoja_usuarios):
+    token = usuarios.start_password_reset("ana@test")
+    assert usuarios.check_reset_token(token)["email"] == "ana@test"
+    usuarios.complete_password_reset(token, "nueva-clave", password_hash="h9")
+    with pytest.raises(ValueError):
+        usuarios.check_reset_token(token)
+    assert usuarios.get_user("ana@test")["password_hash"] == "h9"
+
+
+def test_login_no_espera_escritura(hoja_usuarios):
+    hoja_usuarios.latencia_ms = 600
+    escritura = threading.Thread(target=usuarios.update_user, args=("ana@test",), kwargs={"name": "Ana M"})
+    escritura.start()
+    time.sleep(0.1)
+    t0 = time.perf_counter()
+    assert usuarios.get_user("beto@test")["name"] == "Beto"
+    assert time.perf_counter() - t0 < 0.3
+    escritura.join(5)
+    hoja_usuarios.latencia_ms = 0
+    assert usuarios.get_user("ana@test")["name"] == "Ana M"
+
+
+def test_journal_de_otro_worker(hoja_usuarios):
+    fila = dict(usuarios.get_user("ana@test"), name="Desde otro worker")
+    with open(usuarios.JOURNAL_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"row": fila, "n": 2}) + "\n")
+    assert usuarios.get_user("ana@test")["name"] == "Desde otro worker"
+
+
+def test_journal_rota_tras_refresco(hoja_usuarios, monkeypatch):
+    usuarios.update_user("ana@test", name="Ana R")
+    ino = os.stat(usuarios.JOURNAL_PATH).st_ino
+    usuarios._refresh_from_sheets()   # reciente: se conserva
+    assert os.stat(usuarios.JOURNAL_PATH).st_size > 0
+    monkeypatch.setattr(usuarios, "REFRESH_SECS", 0)
+    usuarios._refresh_from_sheets()
+    st = os.stat(usuarios.JOURNAL_PATH)
+    assert st.st_size == 0 and st.st_ino != ino
+    usuarios.update_user("beto@test", name="Beto R")   # los lectores siguen desde el archivo nuevo
+    assert [e["row"]["email"] for e in _journal()] == ["beto@test"]
+    assert usuarios.get_user("ana@test")["name"] == "Ana R"
+    assert usuarios.get_user("beto@test")["name"] == "Beto R"
+
+
+def test_layout_inesperado_reescribe_una_vez(fake, tmp_path, monkeypatch):
+    monkeypatch.setattr(usuarios, "JOURNAL_PATH", str(tmp_path / "usuarios.journal"))
+    fake.cargar(usuarios.SHEET_ID, usuarios.USERS_SHEET, [["name", "email"], ["Ana", "ana@test"]])
+    usuarios._load_rows(force=True)
+    usuarios.update_user("ana@test", role="admin")
+    assert fake.hoja(usuarios.SHEET_ID, usuarios.USERS_SHEET).datos[0] == usuarios.COLUMNS
+    (entrada,) = _journal()
+    assert entrada["reescrita"] and entrada["row"]["email"] == "ana@test"
+    usuarios.update_user("ana@test", name="Ana 2")   # ya con layout COLUMNS: fila suelta
+    assert _fila(fake, 2)[:4] == ["ana@test", "Ana 2", "", "admin"]
+
+
+def test_fila_movida_no_pisa_a_otro(hoja_usuarios):
+    """La hoja se reordena a mano entre el refresco y la escritura: beto no cae sobre la fila de ana."""
+    hoja_usuarios.cargar(usuarios.SHEET_ID, usuarios.USERS_SHEET, [
+        usuarios.COLUMNS,
+        ["beto@test", "Beto", "h2", "admin", "TRUE", "", "", ""],
+        ["ana@test", "Ana", "h1", "customer", "TRUE", "", "", ""],
+    ])
+    assert usuarios._ROW_NUM["beto@test"] == 3   # la cache todavía cree el orden anterior
+    usuarios.set_password("beto@test", "clave-nueva", password_hash="h-nuevo")
+    filas = {f[0]: f for f in hoja_usuarios.hoja(usuarios.SHEET_ID, usuarios.USERS_SHEET).datos[1:]}
+    assert filas["ana@test"][2] == "h1"
+    assert filas["beto@test"][2] == "h-nuevo"
+    assert usuarios.get_user("ana@test")["password_hash"] == "h1"
+    assert usuarios.get_user("beto@test")["password_hash"] == "h-nuevo"
@@ -0,0 +1,80 @@
+# tiempos.py
+"""
+Temporizador por request (contextvar) con spans por etapa.
+
+    with span("leer_export"):
+        df = leer_filas_por_pop(...)
+
+Los spans se acumulan por nombre (duración total + cantidad) en el temporizador del
+request en curso; el middleware los emite como header `Server-Timing` y en la
+línea de log del request. Fuera de un request (scripts, hilos propios) `span` no
+hace nada más que medir.
+
+Los endpoints sync corren en el threadpool con una copia del contexto, así que
+apuntan al mismo Temporizador que el middleware.
+"""
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_actual: ContextVar[Optional["Temporizador"]] = ContextVar("temporizador", default=None)
+
+
+class Temporizador:
+    __slots__ = ("inicio", "spans")
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}   # nombre => [segundos, veces]
+
+    def agregar(self, nombre: str, segundos: float):
+        s = self.spans.get(nombre)
+        if s is None:
+            self.spans[nombre] = [segundos, 1]
+        else:
+            s[0] += segundos
+            s[1] += 1
+
+    def transcurrido(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def resumen(self) -> Dict[str, float]:
+        """{span: ms} (útil para el log)."""
+        return {k: round(v[0] * 1000, 2) for k, v in self.spans.items()}
+
+    def server_timing(self) -> str:
+        """`get_data;dur=1.2, leer_export;dur=830.4;desc="x4", total;dur=845.0`"""
+        partes = []
+        for nombre, (seg, n) in self.spans.items():
+            p = f"{nombre};dur={seg * 1000:.1f}"
+            if n > 1:
+                p += f';desc="x{n}"'
+            partes.append(p)
+        partes.append(f"total;dur={self.transcurrido() * 1000:.1f}")
+        return ", ".join(partes)
+
+
+def iniciar() -> Tuple[Temporizador, Token]:
+    t = Temporizador()
+    return t, _actual.set(t)
+
+
+def terminar(token: Token):
+    _actual.reset(token)
+
+
+def actual() -> Optional[Temporizador]:
+    return _actual.get()
+
+
+@contextmanager
+def span(nombre: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t = _actual.get()
+        if t is not None:
+            t.agregar(nombre, time.perf_counter() - t0)
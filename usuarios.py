@@ -1,15 +1,22 @@
 # usuarios.py
 from __future__ import annotations
-import os, secrets, time
+import os, json, secrets, tempfile, threading, time
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta, timezone
-from passlib.hash import bcrypt_sha256
-from conector_sheets import leer_hoja, escribir_hoja_stream
+from functools import lru_cache
+from conector_sheets import leer_hoja, leer_fila, escribir_hoja_stream, actualizar_fila, agregar_fila
 import os
-from passlib.hash import bcrypt_sha256 as _bcrypt_sha256, bcrypt as _bcrypt
+import normalizacion
+import registro
 
+log = registro.obtener("usuarios")
 
-bcrypt_sha256 = _bcrypt_sha256.using(truncate_error=False)
+
+@lru_cache(maxsize=None)
+def hashers():
+    """(bcrypt_sha256, bcrypt) de passlib, importados al primer uso (calentamiento de arranque)."""
+    from passlib.hash import bcrypt_sha256 as _bcrypt_sha256, bcrypt as _bcrypt
+    return _bcrypt_sha256.using(truncate_error=False), _bcrypt
 
 
 # === Config ===
@@ -21,13 +28,34 @@ COLUMNS = [
     "is_active", "created_at", "reset_token", "reset_expires"
 ]
 
-# === Cache lectura corta (para no golpear cuotas) ===
+# === Cache en memoria, refrescada en segundo plano (ningún login espera a Sheets) ===
 _CACHE_ROWS: List[Dict] | None = None
-_CACHE_TS: float | None = None
-CACHE_TTL = int(os.getenv("USUARIOS_CACHE_TTL", "60"))  # seg
+REFRESH_SECS = int(os.getenv("USUARIOS_REFRESH_SECS", os.getenv("USUARIOS_CACHE_TTL", "60")))  # seg
+
+# === Índices en memoria sobre _CACHE_ROWS (mismos dicts, se actualizan in-place) ===
+_IDX_EMAIL: Dict[str, Dict] = {}   # email -> fila
+_IDX_TOKEN: Dict[str, Dict] = {}   # reset_token -> fila
+_ROW_NUM: Dict[str, int] = {}      # email -> número de fila en la hoja (1-based)
+_SHEET_COLS: List[str] = []        # orden real de columnas en la hoja
+_LOCK = threading.RLock()          # solo cache/índices: nunca se toma durante I/O a Sheets
+_WRITE_LOCK = threading.Lock()     # serializa escrituras (fila conocida / append) entre hilos
+_REFRESH_LOCK = threading.Lock()   # un solo refresco desde Sheets a la vez
+_FIRST_TRY = threading.Event()     # el hilo ya intentó la primera carga (con o sin éxito)
+_WAKE = threading.Event()          # pide un refresco anticipado
+_REFRESHER: threading.Thread | None = None
+
+# === Journal compartido entre workers (mismo host) ===
+# Cada escritura agrega una línea JSON con la fila final; (inodo, tamaño) del archivo es
+# el "sello de versión": si creció desde lo último aplicado, el worker aplica lo nuevo
+# localmente (sin ir a Sheets). Entre instancias distintas manda el refresco periódico.
+# Lo escrito en el journal ya está en Sheets, así que cuando lleva más de dos refrescos
+# sin cambios se rota por un archivo vacío (otro inodo: los lectores vuelven a 0).
+JOURNAL_PATH = os.getenv("USUARIOS_JOURNAL", os.path.join(tempfile.gettempdir(), "buscador_usuarios.journal"))
+_JOURNAL_INO = 0
+_JOURNAL_OFFSET = 0
 
 def create_user():
-    print("USING HASHER: bcrypt_sha256 (create_user)")
+    log.debug("hasher: bcrypt_sha256 (create_user)")
 
 def authenticate(email: str, password: str) -> bool:
     u = get_user(email)
@@ -35,6 +63,7 @@ def authenticate(email: str, password: str) -> bool:
         return False
 
     h = (u.get("password_hash") or "").strip()
+    bcrypt_sha256, _bcrypt = hashers()
 
     # 1) Intento principal: bcrypt_sha256 (tu formato actual)
     try:
@@ -51,125 +80,338 @@ def authenticate(email: str, password: str) -> bool:
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
-def _norm_email(e: str) -> str:
-    return (e or "").strip().lower()
+_norm_email = normalizacion.email
 
 def _rows_to_list(df) -> List[Dict]:
     return [] if df is None or df.empty else df.fillna("").to_dict(orient="records")
 
-def _load_rows(force: bool = False) -> List[Dict]:
-    global _CACHE_ROWS, _CACHE_TS
-    now = time.time()
-    if not force and _CACHE_ROWS is not None and _CACHE_TS and (now - _CACHE_TS) < CACHE_TTL:
-        return _CACHE_ROWS
-    df = leer_hoja(SHEET_ID, USERS_SHEET)
-    rows = _rows_to_list(df)
-    # normaliza columnas/valores básicos
-    normd = []
-    seen = set()
-    for r in rows:
-        item = {c: str(r.get(c, "")).strip() for c in COLUMNS}
-        em = _norm_email(item.get("email", ""))
-        if not em or em in seen:
+def _index_rows(rows: List[Dict], row_nums: List[int], sheet_cols: List[str]):
+    """Reemplaza cache + índices (llamar con _LOCK tomado)."""
+    global _CACHE_ROWS, _IDX_EMAIL, _IDX_TOKEN, _ROW_NUM, _SHEET_COLS
+    _CACHE_ROWS = rows
+    _IDX_EMAIL = {r["email"]: r for r in rows}
+    _IDX_TOKEN = {r["reset_token"]: r for r in rows if r.get("reset_token")}
+    _ROW_NUM = {r["email"]: n for r, n in zip(rows, row_nums)}
+    _SHEET_COLS = list(sheet_cols)
+
+def _upsert_cache(item: Dict, row_num: int = 0):
+    """Aplica una fila final sobre la cache in-place (idempotente; llamar con _LOCK tomado)."""
+    em = item["email"]
+    current = _IDX_EMAIL.get(em)
+    if current is not None:
+        old_token = current.get("reset_token")
+        if old_token and _IDX_TOKEN.get(old_token) is current:
+            del _IDX_TOKEN[old_token]
+        current.update(item)
+    else:
+        current = dict(item)
+        _CACHE_ROWS.append(current)
+        _IDX_EMAIL[em] = current
+    if row_num:
+        _ROW_NUM[em] = row_num
+    if current.get("reset_token"):
+        _IDX_TOKEN[current["reset_token"]] = current
+
+# ---- journal ----
+def _journal_stat() -> tuple:
+    """(inodo, tamaño) del journal; (0, 0) si no existe."""
+    try:
+        st = os.stat(JOURNAL_PATH)
+    except OSError:
+        return 0, 0
+    return st.st_ino, st.st_size
+
+def _journal_append(entry: Dict):
+    data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+    try:
+        # O_APPEND + un solo write: las líneas de distintos procesos no se mezclan
+        fd = os.open(JOURNAL_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        log.warning("no se pudo escribir el journal", extra={"datos": {"error": repr(e)}})
+
+def _apply_journal():
+    """Aplica las líneas nuevas del journal (llamar con _LOCK tomado)."""
+    global _JOURNAL_INO, _JOURNAL_OFFSET
+    ino, size = _journal_stat()
+    if ino != _JOURNAL_INO:   # rotado (o creado): se lee desde el principio
+        _JOURNAL_INO, _JOURNAL_OFFSET = ino, 0
+    if size <= _JOURNAL_OFFSET:
+        return
+    try:
+        with open(JOURNAL_PATH, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != ino:
+                return  # rotó entre stat y open: lo toma la próxima llamada
+            f.seek(_JOURNAL_OFFSET)
+            data = f.read()
+    except OSError:
+        return
+    end = data.rfind(b"\n") + 1  # solo líneas completas
+    for line in data[:end].splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(entry.get("row"), dict):
             continue
-        item["email"] = em
-        seen.add(em)
-        normd.append(item)
-    _CACHE_ROWS, _CACHE_TS = normd, now
-    return normd
+        _upsert_cache(entry["row"], entry.get("n", 0))
+        if entry.get("reescrita") and entry.get("pid") != os.getpid():
+            # otro worker reescribió la hoja completa: nuestros números de fila ya no
+            # sirven (hasta el refresco las escrituras reescriben la hoja entera)
+            _ROW_NUM.clear()
+            _SHEET_COLS[:] = COLUMNS
+            _WAKE.set()
+    _JOURNAL_OFFSET += end
 
-def _save_rows(rows: List[Dict]):
-    """Vuelca todas las filas; backoff simple ante 429."""
-    def iter_rows():
-        yield COLUMNS
-        for r in rows:
-            yield [r.get(c, "") for c in COLUMNS]
-    # invalidar cache
-    global _CACHE_ROWS, _CACHE_TS
-    _CACHE_ROWS, _CACHE_TS = None, None
+def _compact_journal():
+    """Rota el journal si su última línea tiene más de dos refrescos: todos los workers
+    ya releyeron esas filas desde Sheets y el archivo no aporta nada."""
+    try:
+        st = os.stat(JOURNAL_PATH)
+    except OSError:
+        return
+    if st.st_size == 0 or time.time() - st.st_mtime < 2 * REFRESH_SECS:
+        return
+    tmp = f"{JOURNAL_PATH}.{os.getpid()}.tmp"
+    try:
+        os.close(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600))
+        os.replace(tmp, JOURNAL_PATH)
+    except OSError as e:
+        log.warning("no se pudo rotar el journal", extra={"datos": {"error": repr(e)}})
+        return
+    log.info("journal rotado", extra={"datos": {"bytes": st.st_size}})
 
-    for delay in (0, 1, 2, 4):  # 4 reintentos (0/1/2/4s)
+# ---- carga / refresco ----
+def _refresh_from_sheets():
+    """Relee la hoja completa y reemplaza la cache; re-aplica lo escrito durante la lectura."""
+    global _JOURNAL_INO, _JOURNAL_OFFSET
+    with _REFRESH_LOCK:
+        _compact_journal()
+        ino, offset = _journal_stat()
+        df = leer_hoja(SHEET_ID, USERS_SHEET)
+        sheet_cols = [] if df is None else [str(c) for c in df.columns]
+        # normaliza columnas/valores básicos; guardamos la fila real de la hoja (header = fila 1)
+        normd, row_nums = [], []
+        seen = set()
+        for i, r in enumerate(_rows_to_list(df)):
+            item = {c: str(r.get(c, "")).strip() for c in COLUMNS}
+            em = _norm_email(item.get("email", ""))
+            if not em or em in seen:
+                continue
+            item["email"] = em
+            seen.add(em)
+            normd.append(item)
+            row_nums.append(i + 2)
+        with _LOCK:
+            _index_rows(normd, row_nums, sheet_cols)
+            _JOURNAL_INO, _JOURNAL_OFFSET = ino, offset
+            _apply_journal()
+
+def _refresh_loop():
+    while True:
         try:
-            escribir_hoja_stream(SHEET_ID, USERS_SHEET, iter_rows(), batch_rows=5000)
+            _refresh_from_sheets()
+        except Exception as e:
+            # nos quedamos con la cache anterior
+            log.warning("refresco en segundo plano falló", extra={"datos": {"error": repr(e)}})
+        _FIRST_TRY.set()
+        _WAKE.wait(REFRESH_SECS)
+        _WAKE.clear()
+
+def start_background_refresh():
+    """Arranca (una vez por proceso) el hilo que refresca la cache cada REFRESH_SECS."""
+    global _REFRESHER
+    with _LOCK:
+        if _REFRESHER is not None and _REFRESHER.is_alive():
             return
+        _REFRESHER = threading.Thread(target=_refresh_loop, name="usuarios-refresh", daemon=True)
+        _REFRESHER.start()
+
+def _load_rows(force: bool = False) -> List[Dict]:
+    if force:
+        _refresh_from_sheets()
+    elif _CACHE_ROWS is None:
+        # arranque en frío: esperamos la primera carga del hilo (o la hacemos aquí)
+        start_background_refresh()
+        _FIRST_TRY.wait(timeout=30)
+        if _CACHE_ROWS is None:
+            _refresh_from_sheets()  # si falla, el error llega al caller como antes
+    with _LOCK:
+        _apply_journal()
+        return _CACHE_ROWS
+
+def _with_backoff(fn, *args, **kwargs):
+    """Reintenta ante 429 / RATE_LIMIT (0/1/2/4s)."""
+    for delay in (0, 1, 2, 4):
+        try:
+            return fn(*args, **kwargs)
         except Exception as e:
             msg = str(e)
             if "429" in msg or "RATE_LIMIT" in msg:
                 time.sleep(delay)
                 continue
             raise
+    return fn(*args, **kwargs)
+
+def _save_rows(rows: List[Dict]):
+    """Vuelca todas las filas (deja la hoja con el orden COLUMNS). Sin _LOCK: es I/O a Sheets."""
+    def iter_rows():
+        yield COLUMNS
+        for r in rows:
+            yield [r.get(c, "") for c in COLUMNS]
+
+    _with_backoff(escribir_hoja_stream, SHEET_ID, USERS_SHEET, iter_rows(), batch_rows=5000)
+
+def _row_writes_ok() -> bool:
+    """Solo escribimos filas sueltas si la hoja tiene el layout esperado (COLUMNS al inicio)."""
+    return _SHEET_COLS[:len(COLUMNS)] == COLUMNS
+
+def _rows_with(item: Dict) -> List[Dict]:
+    """Copia de la cache con `item` reemplazado / agregado (llamar con _LOCK tomado)."""
+    current = _IDX_EMAIL.get(item["email"])
+    rows = [dict(item) if r is current else dict(r) for r in _CACHE_ROWS]
+    if current is None:
+        rows.append(dict(item))
+    return rows
+
+def _row_is(row_num: int, em: str) -> bool:
+    """¿La fila `row_num` de la hoja sigue siendo la de `em`? (la cache puede tener hasta REFRESH_SECS)."""
+    vals = _with_backoff(leer_fila, SHEET_ID, USERS_SHEET, row_num)
+    return bool(vals) and _norm_email(vals[0]) == em
+
+def _write_user(item: Dict):
+    """Persiste UNA fila (update en su fila conocida o append), actualiza la cache in-place y avisa a los demás workers.
+
+    La I/O a Sheets (con sus reintentos) corre fuera de _LOCK: un login concurrente
+    nunca espera a una escritura, solo al parche final de la cache.
+    Antes de un update se confirma que la fila sigue siendo la de ese email (alguien pudo
+    ordenar la hoja a mano u otra instancia reescribirla); si no, se relee la hoja y se
+    reescribe completa en vez de pisar la fila de otro usuario.
+    """
+    em = item["email"]
+    _load_rows()
+    with _WRITE_LOCK:
+        with _LOCK:
+            _apply_journal()
+            current = _IDX_EMAIL.get(em)
+            row_num = _ROW_NUM.get(em, 0)
+            # hoja vacía/sin header o layout inesperado: reescritura completa (una sola vez)
+            full = not _row_writes_ok() or (current is not None and not row_num)
+            new_rows = _rows_with(item) if full else []
+
+        if not full and current is not None and not _row_is(row_num, em):
+            log.warning("la fila del usuario se movió, se relee la hoja", extra={"datos": {"fila": row_num}})
+            _refresh_from_sheets()
+            with _LOCK:
+                full, new_rows = True, _rows_with(item)
+
+        if full:
+            _save_rows(new_rows)
+            with _LOCK:
+                _index_rows(new_rows, [i + 2 for i in range(len(new_rows))], COLUMNS)
+                row_num = _ROW_NUM[em]
+            _journal_append({"row": item, "n": row_num, "reescrita": True, "pid": os.getpid()})
+            return
+
+        values = [item.get(c, "") for c in COLUMNS]
+        if current is not None:
+            _with_backoff(actualizar_fila, SHEET_ID, USERS_SHEET, row_num, values)
+        else:
+            row_num = _with_backoff(agregar_fila, SHEET_ID, USERS_SHEET, values)
+            if not row_num:
+                # no pudimos inferir la fila: refresco anticipado en segundo plano
+                _WAKE.set()
+        with _LOCK:
+            _upsert_cache(item, row_num)
+        _journal_append({"row": item, "n": row_num})
 
 def get_user(email: str) -> Optional[Dict]:
     em = _norm_email(email)
-    for r in _load_rows():
-        if r.get("email") == em:
-            return r.copy()
-    return None
+    _load_rows()
+    r = _IDX_EMAIL.get(em)
+    return r.copy() if r else None
 
 def list_users() -> List[Dict]:
     return [r.copy() for r in _load_rows()]
 
-def create_user(email: str, password: str, name: str = "", role: str = "customer") -> Dict:
+def validate_password(password: str):
+    if len(password or "") < 8:
+        raise ValueError("La clave debe tener al menos 8 caracteres")
+
+def validate_new_user(email: str, password: str):
+    """Validaciones baratas previas a hashear (evita gastar bcrypt en registros inválidos)."""
     email = _norm_email(email)
     if not email or "@" not in email:
         raise ValueError("Email inválido")
     if get_user(email):
         raise ValueError("Ya existe un usuario con ese email")
-    if len(password) < 8:
-        raise ValueError("La clave debe tener al menos 8 caracteres")
+    validate_password(password)
 
-    rows = _load_rows()
-    rows.append({
+def hash_password(password: str) -> str:
+    return hashers()[0].hash(password)
+
+def verify_password(u: Optional[Dict], password: str) -> bool:
+    """Verifica contra un usuario ya leído (CPU pura, sin I/O)."""
+    if not u or (u.get("is_active", "TRUE") not in ("TRUE", "True", "true", "1")):
+        return False
+    h = (u.get("password_hash") or "").strip()
+    bcrypt_sha256, _bcrypt = hashers()
+    try:
+        return bcrypt_sha256.verify(password, h)
+    except Exception:
+        # fallback: hash bcrypt puro ($2b$...)
+        try:
+            return _bcrypt.verify(password, h)
+        except Exception:
+            return False
+
+def create_user(email: str, password: str, name: str = "", role: str = "customer",
+                password_hash: Optional[str] = None) -> Dict:
+    """password_hash: hash ya calculado (p. ej. en ejecutor_hash); si no, se calcula aquí."""
+    email = _norm_email(email)
+    validate_new_user(email, password)
+
+    _write_user({
         "email": email,
         "name": (name or "").strip(),
-        "password_hash": bcrypt_sha256.hash(password),
+        "password_hash": password_hash or hash_password(password),
         "role": role if role in ("admin", "customer") else "customer",
         "is_active": "TRUE",
         "created_at": _utcnow().isoformat(),
         "reset_token": "",
         "reset_expires": ""
     })
-    _save_rows(rows)
     return get_user(email)  # post-escritura
 
 def update_user(email: str, **fields) -> Dict:
     email = _norm_email(email)
-    rows = _load_rows()
-    found = False
-    for r in rows:
-        if r.get("email") == email:
-            found = True
-            for k, v in fields.items():
-                if k in COLUMNS and k not in ("email", "password_hash"):  # no cambiar email/ hash aquí
-                    r[k] = str(v).strip()
-            break
-    if not found:
+    u = get_user(email)
+    if not u:
         raise ValueError("Usuario inexistente")
-    _save_rows(rows)
+    for k, v in fields.items():
+        if k in COLUMNS and k not in ("email", "password_hash"):  # no cambiar email/ hash aquí
+            u[k] = str(v).strip()
+    _write_user(u)
     return get_user(email)
 
 def deactivate_user(email: str):
     update_user(email, is_active="FALSE")
 
-def set_password(email: str, new_password: str):
-    if len(new_password) < 8:
-        raise ValueError("La clave debe tener al menos 8 caracteres")
-    email = _norm_email(email)
-    rows = _load_rows()
-    for r in rows:
-        if r.get("email") == email:
-            r["password_hash"] = bcrypt_sha256.hash(new_password)
-            r["reset_token"] = ""
-            r["reset_expires"] = ""
-            _save_rows(rows)
-            return
-    raise ValueError("Usuario inexistente")
+def set_password(email: str, new_password: str, password_hash: Optional[str] = None):
+    validate_password(new_password)
+    u = get_user(email)
+    if not u:
+        raise ValueError("Usuario inexistente")
+    u["password_hash"] = password_hash or hash_password(new_password)
+    u["reset_token"] = ""
+    u["reset_expires"] = ""
+    _write_user(u)
 
 def authenticate(email: str, password: str) -> bool:
-    u = get_user(email)
-    if not u or (u.get("is_active", "TRUE") not in ("TRUE", "True", "true", "1")):
-        return False
-    return bcrypt_sha256.verify(password, u.get("password_hash",""))
+    return verify_password(get_user(email), password)
 
 def start_password_reset(email: str) -> str:
     u = get_user(email)
@@ -181,22 +423,26 @@ def start_password_reset(email: str) -> str:
     update_user(email, reset_token=token, reset_expires=expires)
     return token
 
-def complete_password_reset(token: str, new_password: str) -> str:
-    if len(new_password) < 8:
-        raise ValueError("La clave debe tener al menos 8 caracteres")
-    rows = _load_rows()
+def check_reset_token(token: str) -> Dict:
+    """Devuelve el usuario dueño del token vigente; ValueError si no existe o expiró."""
+    _load_rows()
+    r = _IDX_TOKEN.get(token) if token else None
+    if not r:
+        raise ValueError("Token inválido")
     now = _utcnow()
-    for r in rows:
-        if r.get("reset_token") == token:
-            exp = r.get("reset_expires", "")
-            try:
-                if not exp or now > datetime.fromisoformat(exp):
-                    raise ValueError("Token expirado")
-            except Exception:
-                raise ValueError("Token inválido o expirado")
-            r["password_hash"] = bcrypt_sha256.hash(new_password)
-            r["reset_token"] = ""
-            r["reset_expires"] = ""
-            _save_rows(rows)
-            return r["email"]
-    raise ValueError("Token inválido")
+    exp = r.get("reset_expires", "")
+    try:
+        if not exp or now > datetime.fromisoformat(exp):
+            raise ValueError("Token expirado")
+    except Exception:
+        raise ValueError("Token inválido o expirado")
+    return r.copy()
+
+def complete_password_reset(token: str, new_password: str, password_hash: Optional[str] = None) -> str:
+    validate_password(new_password)
+    u = check_reset_token(token)
+    u["password_hash"] = password_hash or hash_password(new_password)
+    u["reset_token"] = ""
+    u["reset_expires"] = ""
+    _write_user(u)
+    return u["email"]